@@ -0,0 +1,151 @@
+"""attempt_events + mastery_rebuilds: append-only attempt log for kc_mastery replay
+
+Creates both tables and backfills `attempt_events` from completed grading
+sessions (correctness from the "N/10" grade, KC weights from today's
+`question_kc`), in id-ordered chunks.
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import json
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "a7b8c9d0e1f2"
+down_revision: Union[str, Sequence[str], None] = "f6a7b8c9d0e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_CHUNK = 1000
+_CORRECT_THRESHOLD = 0.6  # mastery_service.CORRECT_THRESHOLD at the time of writing
+
+
+def _correct(result) -> Optional[bool]:
+    if isinstance(result, str):
+        result = json.loads(result)
+    grade = (result or {}).get("grade")
+    if not grade or "/" not in str(grade):
+        return None
+    numerator, _, denominator = str(grade).partition("/")
+    try:
+        return float(numerator) / (float(denominator) or 10.0) >= _CORRECT_THRESHOLD
+    except ValueError:
+        return None
+
+
+def _backfill() -> None:
+    conn = op.get_bind()
+    question_kc = sa.table(
+        "question_kc",
+        sa.column("question_id", sa.Integer),
+        sa.column("practice_mode", sa.String),
+        sa.column("kc_id", sa.Integer),
+        sa.column("weight", sa.Float),
+    )
+    sessions = sa.table(
+        "grading_sessions",
+        sa.column("id", sa.Integer),
+        sa.column("user_id", sa.Integer),
+        sa.column("question_id", sa.Integer),
+        sa.column("practice_mode", sa.String),
+        sa.column("status", sa.String),
+        sa.column("grading_result", sa.JSON),
+        sa.column("image_uploaded_at", sa.DateTime),
+        sa.column("created_at", sa.DateTime),
+    )
+    events = sa.table(
+        "attempt_events",
+        sa.column("user_id", sa.Integer),
+        sa.column("question_id", sa.Integer),
+        sa.column("practice_mode", sa.String),
+        sa.column("correct", sa.Boolean),
+        sa.column("kc_weights", sa.JSON),
+        sa.column("grading_session_id", sa.Integer),
+        sa.column("attempted_at", sa.DateTime),
+    )
+    weights: Dict[Tuple[int, str], List[list]] = {}
+    for question_id, mode, kc_id, weight in conn.execute(
+        sa.select(question_kc.c.question_id, question_kc.c.practice_mode, question_kc.c.kc_id, question_kc.c.weight)
+    ):
+        weights.setdefault((question_id, mode), []).append([kc_id, weight])
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(
+                sessions.c.id,
+                sessions.c.user_id,
+                sessions.c.question_id,
+                sessions.c.practice_mode,
+                sessions.c.grading_result,
+                sessions.c.image_uploaded_at,
+                sessions.c.created_at,
+            )
+            .where(sessions.c.id > last_id, sessions.c.status == "completed")
+            .order_by(sessions.c.id)
+            .limit(_CHUNK)
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for session_id, user_id, question_id, mode, result, uploaded_at, created_at in rows:
+            correct = _correct(result)
+            if correct is None:
+                continue
+            batch.append(
+                {
+                    "user_id": user_id,
+                    "question_id": question_id,
+                    "practice_mode": mode,
+                    "correct": correct,
+                    "kc_weights": weights.get((question_id, mode), []),
+                    "grading_session_id": session_id,
+                    "attempted_at": uploaded_at or created_at,
+                }
+            )
+        if batch:
+            conn.execute(events.insert(), batch)
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "attempt_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("student_users.id"), nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=False),
+        sa.Column("practice_mode", sa.String(), nullable=False),
+        sa.Column("correct", sa.Boolean(), nullable=False),
+        sa.Column("kc_weights", sa.JSON(), nullable=False),
+        sa.Column("grading_session_id", sa.Integer(), sa.ForeignKey("grading_sessions.id"), nullable=True),
+        sa.Column("attempted_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_attempt_events_id", "attempt_events", ["id"])
+    op.create_index("ix_attempt_events_user", "attempt_events", ["user_id", "id"])
+    op.create_table(
+        "mastery_rebuilds",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("remap", sa.Boolean(), nullable=False),
+        sa.Column("last_user_id", sa.Integer(), nullable=False),
+        sa.Column("n_users", sa.Integer(), nullable=False),
+        sa.Column("n_events", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_mastery_rebuilds_id", "mastery_rebuilds", ["id"])
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_index("ix_mastery_rebuilds_id", table_name="mastery_rebuilds")
+    op.drop_table("mastery_rebuilds")
+    op.drop_index("ix_attempt_events_user", table_name="attempt_events")
+    op.drop_index("ix_attempt_events_id", table_name="attempt_events")
+    op.drop_table("attempt_events")
@@ -0,0 +1,107 @@
+"""student_skill_scores: normalized legacy skill scores
+
+Creates the table and backfills it from each student's `knowledge_profile`
+JSON (subjects.mathematics.topics[].skills), in id-ordered chunks. The JSON
+column is left in place, unread, for rollback.
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import json
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "b8c9d0e1f2a3"
+down_revision: Union[str, Sequence[str], None] = "a7b8c9d0e1f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_CHUNK = 500
+
+
+def _last_question(questions):
+    try:
+        return int(questions[-1]) if questions else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _backfill() -> None:
+    conn = op.get_bind()
+    users = sa.table("student_users", sa.column("id", sa.Integer), sa.column("knowledge_profile", sa.JSON))
+    scores = sa.table(
+        "student_skill_scores",
+        sa.column("user_id", sa.Integer),
+        sa.column("topic_name", sa.String),
+        sa.column("skill_name", sa.String),
+        sa.column("score", sa.Integer),
+        sa.column("n_questions", sa.Integer),
+        sa.column("last_question_id", sa.Integer),
+        sa.column("updated_at", sa.DateTime),
+    )
+    now = datetime.utcnow()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(users.c.id, users.c.knowledge_profile)
+            .where(users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(_CHUNK)
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for user_id, profile in rows:
+            if isinstance(profile, str):
+                profile = json.loads(profile)
+            topics = (((profile or {}).get("subjects") or {}).get("mathematics") or {}).get("topics") or []
+            seen = set()
+            for topic in topics:
+                for skill_name, skill in (topic.get("skills") or {}).items():
+                    key = (topic.get("topic_name", "General"), skill_name)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    questions = skill.get("questions") or []
+                    batch.append(
+                        {
+                            "user_id": user_id,
+                            "topic_name": key[0],
+                            "skill_name": skill_name,
+                            "score": int(skill.get("score", 50)),
+                            "n_questions": len(questions),
+                            "last_question_id": _last_question(questions),
+                            "updated_at": now,
+                        }
+                    )
+        if batch:
+            conn.execute(scores.insert(), batch)
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "student_skill_scores",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("student_users.id"), nullable=False),
+        sa.Column("topic_name", sa.String(), nullable=False),
+        sa.Column("skill_name", sa.String(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=False),
+        sa.Column("n_questions", sa.Integer(), nullable=False),
+        sa.Column("last_question_id", sa.Integer(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "topic_name", "skill_name", name="uq_student_skill_scores"),
+    )
+    op.create_index("ix_student_skill_scores_id", "student_skill_scores", ["id"])
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_index("ix_student_skill_scores_id", table_name="student_skill_scores")
+    op.drop_table("student_skill_scores")
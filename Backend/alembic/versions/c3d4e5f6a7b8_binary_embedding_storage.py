@@ -0,0 +1,89 @@
+"""Binary embedding storage: JSON float lists -> header + float32 LargeBinary
+
+Converts `student_personas.embedding` and `student_memory_events.embedding` in
+place, in id-ordered chunks so large tables don't load into memory at once.
+The codec is inlined (not imported from app/) so this revision stays frozen.
+
+Revision ID: c3d4e5f6a7b8
+Revises: f1a2b3c4d5e6
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+revision: str = "c3d4e5f6a7b8"
+down_revision: Union[str, Sequence[str], None] = "f1a2b3c4d5e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_TABLES = ("student_personas", "student_memory_events")
+_CHUNK = 500
+_F32_HEADER = b"f4\x00\x00"
+_HEADERS = {b"f4\x00\x00": "<f4", b"f2\x00\x00": "<f2"}
+
+
+def _to_blob(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return _F32_HEADER + np.asarray(value, dtype="<f4").tobytes()
+
+
+def _to_list(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    return np.frombuffer(value, dtype=_HEADERS[value[:4]], offset=4).astype(float).tolist()
+
+
+def _convert(table: str, src_type, dst_type, convert) -> None:
+    """Copy `embedding` into `embedding_new` through `convert`, chunk by chunk."""
+    conn = op.get_bind()
+    t = sa.table(
+        table,
+        sa.column("id", sa.Integer),
+        sa.column("embedding", src_type),
+        sa.column("embedding_new", dst_type),
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(t.c.id, t.c.embedding)
+            .where(t.c.id > last_id)
+            .order_by(t.c.id)
+            .limit(_CHUNK)
+        ).fetchall()
+        if not rows:
+            break
+        updates = [{"row_id": row_id, "value": convert(value)} for row_id, value in rows]
+        conn.execute(
+            t.update().where(t.c.id == sa.bindparam("row_id")).values(embedding_new=sa.bindparam("value")),
+            updates,
+        )
+        last_id = rows[-1][0]
+
+
+def _swap(table: str, src_type, dst_type, convert) -> None:
+    with op.batch_alter_table(table) as batch:
+        batch.add_column(sa.Column("embedding_new", dst_type, nullable=True))
+    _convert(table, src_type, dst_type, convert)
+    with op.batch_alter_table(table) as batch:
+        batch.drop_column("embedding")
+    with op.batch_alter_table(table) as batch:
+        batch.alter_column("embedding_new", new_column_name="embedding")
+
+
+def upgrade() -> None:
+    for table in _TABLES:
+        _swap(table, sa.JSON(), sa.LargeBinary(), _to_blob)
+
+
+def downgrade() -> None:
+    for table in _TABLES:
+        _swap(table, sa.LargeBinary(), sa.JSON(none_as_null=True), _to_list)
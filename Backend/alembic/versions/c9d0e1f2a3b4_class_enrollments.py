@@ -0,0 +1,37 @@
+"""class_enrollments: teacher rosters
+
+Scopes the teacher class-mastery heatmap to students who enrolled with the
+teacher.
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "c9d0e1f2a3b4"
+down_revision: Union[str, Sequence[str], None] = "b8c9d0e1f2a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "class_enrollments",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("teacher_id", sa.Integer(), sa.ForeignKey("teacher_users.id"), nullable=False),
+        sa.Column("student_id", sa.Integer(), sa.ForeignKey("student_users.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("teacher_id", "student_id", name="uq_class_enrollments"),
+    )
+    op.create_index("ix_class_enrollments_id", "class_enrollments", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_class_enrollments_id", table_name="class_enrollments")
+    op.drop_table("class_enrollments")
@@ -0,0 +1,86 @@
+"""pgvector columns + HNSW cosine indexes for the persona/memory banks
+
+Postgres-only, and only where the `vector` extension is installable: adds
+`embedding_vec vector(768)` next to the binary `embedding`, backfills it in
+id-ordered chunks, and builds an HNSW `vector_cosine_ops` index so
+`VECTOR_STORE_BACKEND=pgvector` can rank in SQL. A no-op on SQLite or on a
+Postgres without pgvector (the numpy/python backends keep working there).
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+revision: str = "d4e5f6a7b8c9"
+down_revision: Union[str, Sequence[str], None] = "c3d4e5f6a7b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_TABLES = ("student_personas", "student_memory_events")
+_DIM = 768
+_CHUNK = 500
+_HEADERS = {b"f4\x00\x00": "<f4", b"f2\x00\x00": "<f2"}
+
+
+def _pgvector_available() -> bool:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    return bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+    ).first() is not None
+
+
+def _backfill(table: str) -> None:
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(
+                f"SELECT id, embedding FROM {table} WHERE id > :last AND embedding IS NOT NULL "
+                "ORDER BY id LIMIT :n"
+            ),
+            {"last": last_id, "n": _CHUNK},
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, blob in rows:
+            blob = bytes(blob)
+            vec = np.frombuffer(blob, dtype=_HEADERS[blob[:4]], offset=4)
+            if vec.size == _DIM:
+                updates.append({"id": row_id, "v": "[" + ",".join(map(repr, vec.astype(float))) + "]"})
+        if updates:
+            conn.execute(
+                sa.text(f"UPDATE {table} SET embedding_vec = CAST(:v AS vector) WHERE id = :id"),
+                updates,
+            )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    if not _pgvector_available():
+        print("pgvector not available; skipping embedding_vec columns")
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    for table in _TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS embedding_vec vector({_DIM})")
+        _backfill(table)
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_embedding_vec ON {table} "
+            "USING hnsw (embedding_vec vector_cosine_ops)"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in _TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_embedding_vec")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS embedding_vec")
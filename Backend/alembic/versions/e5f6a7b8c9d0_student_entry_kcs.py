@@ -0,0 +1,84 @@
+"""student_entry_kcs: KC-slug inverted index over personas and memory events
+
+Creates the table and backfills it from each row's `concept_keywords`, in
+id-ordered chunks.
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "e5f6a7b8c9d0"
+down_revision: Union[str, Sequence[str], None] = "d4e5f6a7b8c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_BANKS = (("persona", "student_personas"), ("memory", "student_memory_events"))
+_CHUNK = 1000
+
+
+def _backfill(bank: str, table: str) -> None:
+    conn = op.get_bind()
+    src = sa.table(
+        table,
+        sa.column("id", sa.Integer),
+        sa.column("user_id", sa.Integer),
+        sa.column("concept_keywords", sa.JSON),
+    )
+    dst = sa.table(
+        "student_entry_kcs",
+        sa.column("user_id", sa.Integer),
+        sa.column("bank", sa.String),
+        sa.column("kc_slug", sa.String),
+        sa.column("entry_id", sa.Integer),
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(src.c.id, src.c.user_id, src.c.concept_keywords)
+            .where(src.c.id > last_id)
+            .order_by(src.c.id)
+            .limit(_CHUNK)
+        ).fetchall()
+        if not rows:
+            break
+        postings = []
+        for row_id, user_id, slugs in rows:
+            if isinstance(slugs, str):
+                slugs = json.loads(slugs)
+            for slug in dict.fromkeys(slugs or []):
+                postings.append({"user_id": user_id, "bank": bank, "kc_slug": slug, "entry_id": row_id})
+        if postings:
+            conn.execute(dst.insert(), postings)
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "student_entry_kcs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("student_users.id"), nullable=False),
+        sa.Column("bank", sa.String(), nullable=False),
+        sa.Column("kc_slug", sa.String(), nullable=False),
+        sa.Column("entry_id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("bank", "entry_id", "kc_slug", name="uq_student_entry_kcs"),
+    )
+    op.create_index("ix_student_entry_kcs_id", "student_entry_kcs", ["id"])
+    op.create_index(
+        "ix_student_entry_kcs_lookup", "student_entry_kcs", ["user_id", "bank", "kc_slug"]
+    )
+    for bank, table in _BANKS:
+        _backfill(bank, table)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_student_entry_kcs_lookup", table_name="student_entry_kcs")
+    op.drop_index("ix_student_entry_kcs_id", table_name="student_entry_kcs")
+    op.drop_table("student_entry_kcs")
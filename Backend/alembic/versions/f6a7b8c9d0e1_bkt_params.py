@@ -0,0 +1,42 @@
+"""bkt_params: BKT parameters fitted offline, per KC or per difficulty tier
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "f6a7b8c9d0e1"
+down_revision: Union[str, Sequence[str], None] = "e5f6a7b8c9d0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bkt_params",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kc_id", sa.Integer(), sa.ForeignKey("knowledge_components.id"), nullable=True),
+        sa.Column("difficulty_tier", sa.String(), nullable=True),
+        sa.Column("p_L0", sa.Float(), nullable=False),
+        sa.Column("p_T", sa.Float(), nullable=False),
+        sa.Column("p_S", sa.Float(), nullable=False),
+        sa.Column("p_G", sa.Float(), nullable=False),
+        sa.Column("n_attempts", sa.Integer(), nullable=False),
+        sa.Column("heldout_ll", sa.Float(), nullable=True),
+        sa.Column("baseline_ll", sa.Float(), nullable=True),
+        sa.Column("fitted_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("kc_id"),
+        sa.UniqueConstraint("difficulty_tier"),
+    )
+    op.create_index("ix_bkt_params_id", "bkt_params", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_bkt_params_id", table_name="bkt_params")
+    op.drop_table("bkt_params")
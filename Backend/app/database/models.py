@@ -1,8 +1,10 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, JSON, ForeignKey, DateTime, Text, Table, Enum, UniqueConstraint
+from sqlalchemy import Boolean, Column, Integer, String, Float, JSON, ForeignKey, DateTime, Text, Table, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 import enum
 
+from .vector_type import Embedding
+
 Base = declarative_base()
 
 
@@ -317,6 +319,41 @@ StudentUser.feedbacks = relationship("UserFeedback", back_populates="student")
 # memory banks. See docs/tasa-knowledge-model.md.
 
 
+class StudentSkillScore(Base):
+    """Legacy 0-100 skill score for one (student, topic, skill), normalized out
+    of the `StudentUser.knowledge_profile` JSON; the JSON shape is now a
+    projection of these rows."""
+    __tablename__ = "student_skill_scores"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("student_users.id"), nullable=False)
+    topic_name = Column(String, nullable=False)
+    skill_name = Column(String, nullable=False)
+    score = Column(Integer, nullable=False)
+    n_questions = Column(Integer, nullable=False, default=0)
+    last_question_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "topic_name", "skill_name", name="uq_student_skill_scores"),
+    )
+
+
+class ClassEnrollment(Base):
+    """A student on a teacher's roster. Students enroll themselves, so a
+    teacher only sees the mastery of students who chose to share it."""
+    __tablename__ = "class_enrollments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    teacher_id = Column(Integer, ForeignKey("teacher_users.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("student_users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("teacher_id", "student_id", name="uq_class_enrollments"),
+    )
+
+
 class QuestionKC(Base):
     """Maps a graded question to one or more knowledge components.
 
@@ -359,6 +396,59 @@ class KCMastery(Base):
     )
 
 
+class AttemptEvent(Base):
+    """L1: append-only log of graded attempts, the source of truth that
+    `kc_mastery` can be rebuilt from (app/services/attempt_replay.py)."""
+    __tablename__ = "attempt_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("student_users.id"), nullable=False)
+    question_id = Column(Integer, nullable=False)
+    practice_mode = Column(String, nullable=False)
+    correct = Column(Boolean, nullable=False)
+    kc_weights = Column(JSON, nullable=False)  # [[kc_id, weight], ...] as mapped at attempt time
+    grading_session_id = Column(Integer, ForeignKey("grading_sessions.id"), nullable=True)
+    attempted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_attempt_events_user", "user_id", "id"),
+    )
+
+
+class MasteryRebuild(Base):
+    """Progress of one `kc_mastery` rebuild from `attempt_events`, so an
+    interrupted rebuild resumes after the last finished student."""
+    __tablename__ = "mastery_rebuilds"
+
+    id = Column(Integer, primary_key=True, index=True)
+    remap = Column(Boolean, nullable=False, default=False)  # use today's question_kc mapping
+    last_user_id = Column(Integer, nullable=False, default=0)
+    n_users = Column(Integer, nullable=False, default=0)
+    n_events = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class FittedBktParams(Base):
+    """L1: BKT parameters fitted offline from grading history
+    (scripts/fit_bkt_params.py), for one KC or one difficulty tier. Read by
+    `params_for_kc` ahead of the hand-set tier defaults."""
+    __tablename__ = "bkt_params"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kc_id = Column(Integer, ForeignKey("knowledge_components.id"), nullable=True, unique=True)
+    difficulty_tier = Column(String, nullable=True, unique=True)  # set when kc_id is null
+    p_L0 = Column(Float, nullable=False)
+    p_T = Column(Float, nullable=False)
+    p_S = Column(Float, nullable=False)
+    p_G = Column(Float, nullable=False)
+    n_attempts = Column(Integer, nullable=False, default=0)  # training attempts
+    heldout_ll = Column(Float, nullable=True)   # mean held-out log-likelihood per attempt
+    baseline_ll = Column(Float, nullable=True)  # same, for the params it replaced
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+
+
 class StudentPersona(Base):
     """L2: an embedded natural-language persona line for a student."""
     __tablename__ = "student_personas"
@@ -367,7 +457,7 @@ class StudentPersona(Base):
     user_id = Column(Integer, ForeignKey("student_users.id"), nullable=False, index=True)
     description = Column(Text, nullable=False)
     concept_keywords = Column(JSON, nullable=True)   # list of KC slugs
-    embedding = Column(JSON, nullable=True)          # text-embedding-004 vector
+    embedding = Column(Embedding, nullable=True)     # text-embedding-004 vector (binary)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -379,6 +469,23 @@ class StudentMemoryEvent(Base):
     user_id = Column(Integer, ForeignKey("student_users.id"), nullable=False, index=True)
     summary = Column(Text, nullable=False)
     concept_keywords = Column(JSON, nullable=True)   # list of KC slugs
-    embedding = Column(JSON, nullable=True)
+    embedding = Column(Embedding, nullable=True)
     event_at = Column(DateTime, default=datetime.utcnow)
     source_grading_id = Column(Integer, ForeignKey("grading_sessions.id"), nullable=True)
+
+
+class StudentEntryKC(Base):
+    """Inverted index for TASA retrieval: (student, bank, KC slug) -> persona or
+    memory row id. Mirrors each row's `concept_keywords`; kept on write."""
+    __tablename__ = "student_entry_kcs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("student_users.id"), nullable=False)
+    bank = Column(String, nullable=False)      # "persona" | "memory"
+    kc_slug = Column(String, nullable=False)
+    entry_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("bank", "entry_id", "kc_slug", name="uq_student_entry_kcs"),
+        Index("ix_student_entry_kcs_lookup", "user_id", "bank", "kc_slug"),
+    )
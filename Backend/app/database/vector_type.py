@@ -0,0 +1,79 @@
+"""
+Compact binary storage for embedding vectors.
+
+A 768-dim `text-embedding-004` vector is ~15 KB as a JSON float list and has to
+be JSON-decoded on every read. Stored here as raw little-endian floats behind a
+4-byte header naming the element type:
+
+    b"f4\\0\\0" + float32 bytes   (default, 3 KB per vector)
+    b"f2\\0\\0" + float16 bytes   (opt-in via EMBEDDING_STORAGE_DTYPE=float16, 1.5 KB)
+
+Reads decode zero-copy with `numpy.frombuffer` into a read-only array view; the
+4-byte header keeps the float32 payload aligned.
+"""
+import json
+import os
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+_HEADERS = {
+    np.dtype("<f4"): b"f4\x00\x00",
+    np.dtype("<f2"): b"f2\x00\x00",
+}
+_DTYPES = {header: dtype for dtype, header in _HEADERS.items()}
+HEADER_SIZE = 4
+
+STORAGE_DTYPE = np.dtype(
+    "<f2" if os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower() == "float16" else "<f4"
+)
+
+
+def encode_embedding(
+    vec: Optional[Sequence[float]], dtype: Union[str, np.dtype, None] = None
+) -> Optional[bytes]:
+    """Serialize a vector (list or ndarray) to header + raw floats."""
+    if vec is None:
+        return None
+    dtype = np.dtype(dtype or STORAGE_DTYPE).newbyteorder("<")
+    if dtype not in _HEADERS:
+        raise ValueError(f"unsupported embedding storage dtype: {dtype}")
+    arr = np.asarray(vec, dtype=dtype).ravel()
+    return _HEADERS[dtype] + arr.tobytes()
+
+
+def decode_embedding(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    """Zero-copy, read-only view over a stored vector in its stored dtype."""
+    if blob is None:
+        return None
+    dtype = _DTYPES.get(bytes(blob[:HEADER_SIZE]))
+    if dtype is None:
+        raise ValueError("unrecognized embedding blob header")
+    return np.frombuffer(blob, dtype=dtype, offset=HEADER_SIZE)
+
+
+class Embedding(TypeDecorator):
+    """`LargeBinary` column holding an encoded embedding.
+
+    Binds lists or ndarrays; loads `np.ndarray` views. Legacy JSON values
+    (a row read before the binary migration ran) are still accepted on read.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return encode_embedding(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = json.loads(value)
+        if isinstance(value, list):
+            return np.asarray(value, dtype=np.float32)
+        return decode_embedding(bytes(value) if isinstance(value, memoryview) else value)
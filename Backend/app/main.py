@@ -1,12 +1,14 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from .database.database import engine
-from .database.models import Base
-from .routers import auth, feedback, grading, practice, questions, tutor, video
+from .auth.dependencies import get_current_teacher
+from .database.database import SessionLocal, engine
+from .database.models import Base, TeacherUser
+from .routers import auth, feedback, grading, practice, questions, teacher, tutor, video
+from .services import gemini_client, grading_queue, image_preprocessing
 
 load_dotenv()
 
@@ -55,9 +57,40 @@ app.include_router(grading.router)
 app.include_router(tutor.router)
 app.include_router(feedback.router)
 app.include_router(practice.router)
+app.include_router(teacher.router)
+
+@app.on_event("startup")
+async def resume_grading_jobs():
+    """Re-enqueue photo submissions a previous process accepted but never graded."""
+    db = SessionLocal()
+    try:
+        resumed = grading_queue.recover(db, grading_queue.get_queue())
+        if resumed:
+            print(f"Resumed {resumed} pending grading job(s)")
+    except Exception as e:
+        print(f"Could not resume grading jobs: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+async def stop_grading_workers():
+    await grading_queue.get_queue().stop()
 
 # Health check
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics(current_user: TeacherUser = Depends(get_current_teacher)):
+    """In-process counters: the grading queue (with its dead-letter list and
+    the duplicate-photo cache hit rate), Gemini calls per model and image
+    preprocessing. Per worker process; reset on restart."""
+    return {
+        "grading_queue": grading_queue.get_queue().stats(),
+        "gemini": gemini_client.stats(),
+        "image_preprocessing": image_preprocessing.stats(),
+    }
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import time
@@ -5,7 +6,7 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Request
 from jose import JWTError, jwt
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
@@ -15,7 +16,7 @@ from ..auth.utils import ALGORITHM, SECRET_KEY
 from ..database.database import get_db
 from ..database.models import GradingSession
 from ..service_instances import convo_service
-from ..services.knowledge_profile_service import KnowledgeProfileService
+from ..services import grading_queue, image_preprocessing, upload_stream
 
 router = APIRouter()
 
@@ -237,19 +238,22 @@ async def connect_mobile_to_session(
         print(f"Error connecting mobile: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/api/submit-grading-image")
+@router.post("/api/submit-grading-image", status_code=202)
 async def submit_grading_image(
     request: Request,
-    sessionId: str = Form(...),
-    timestamp: str = Form(...),
-    imageSize: int = Form(...),
-    metadata: str = Form(...),
-    image: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    """Submit an image for grading."""
+    """Submit an image for grading (multipart: sessionId, image, plus the
+    client's timestamp/imageSize/metadata, which are not used). Returns once the
+    image is queued; poll /api/grading-session/{sessionId}/result for the
+    outcome.
+
+    The body is read as a stream (see upload_stream) rather than through
+    File/Form parameters, so the size cap applies to the bytes actually sent
+    and the image never touches disk: it is preprocessed in memory and handed
+    to the grading queue."""
     try:
-        # Extract and validate temporary token
+        # Extract and validate temporary token before reading the body
         auth_header = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
             raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
@@ -262,13 +266,26 @@ async def submit_grading_image(
             token_session_id = payload.get("session_id")
             user_id = int(payload.get("sub"))
 
-            # Verify it's a grading temp token for this session
-            if token_type != "grading_temp" or token_session_id != sessionId:
+            if token_type != "grading_temp":
                 raise HTTPException(status_code=401, detail="Invalid token for this session")
 
         except JWTError:
             raise HTTPException(status_code=401, detail="Invalid token")
 
+        try:
+            fields, files = await upload_stream.read_multipart(request)
+        except upload_stream.UploadRejected as rejected:
+            raise HTTPException(status_code=rejected.status_code, detail=rejected.detail)
+
+        sessionId = fields.get("sessionId")
+        image = files.get("image")
+        if not sessionId or image is None:
+            raise HTTPException(status_code=422, detail="sessionId and image are required")
+
+        # Verify it's a grading temp token for this session
+        if token_session_id != sessionId:
+            raise HTTPException(status_code=401, detail="Invalid token for this session")
+
         # Validate session
         db_session = db.query(GradingSession).filter(
             GradingSession.session_id == sessionId,
@@ -281,32 +298,16 @@ async def submit_grading_image(
             raise HTTPException(status_code=404, detail="Invalid or expired session")
 
         # Validate image file
-        if not image.content_type.startswith('image/'):
+        if not image.content_type.startswith('image/') or not image.data:
             raise HTTPException(status_code=400, detail="Invalid file type")
 
-        if imageSize > 10 * 1024 * 1024:  # 10MB limit
-            raise HTTPException(status_code=400, detail="File too large")
-
-        # Create uploads directory if it doesn't exist
-        # Use absolute path relative to the Backend directory (three levels up from
-        # this router module: routers/ -> app/ -> Backend/), matching the original
-        # main.py location this handler was moved from.
-        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        upload_dir = os.path.join(backend_dir, "temp_uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-
-        # Save image with unique filename
-        filename = f"{sessionId}_{int(time.time())}.jpg"
-        file_path = os.path.join(upload_dir, filename)
-
-        # Save file
-        content = await image.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Decoding and shrinking the photo is CPU work: keep it off the loop.
+        processed = await asyncio.to_thread(image_preprocessing.preprocess_or_original, image.data)
+        print(f"Grading image preprocessed: {processed.summary()}")
 
         # Update session status
+        previous_status = db_session.status
         db_session.status = "image_uploaded"
-        db_session.image_path = file_path
         db_session.image_uploaded_at = datetime.utcnow()
         db.commit()
 
@@ -319,80 +320,32 @@ async def submit_grading_image(
                     "user_id": user_id,
                     "question_id": db_session.question_id,
                     "status": "image_uploaded",
-                    "image_path": file_path,
                     "uploaded_at": datetime.utcnow().isoformat()
                 })
             )
 
-        # Trigger grading process
-        grading_result = await convo_service.gemini_service.generate_photo_grading(
-            db_session.question_text,
-            db_session.correct_solution,
-            file_path
-        )
-
-        # Update with grading result
-        db_session.grading_result = grading_result
-        db_session.status = "completed"
-        db.commit()
-
-        # Update knowledge profile after successful grading
-        try:
-            print(user_id, db_session.question_id, db_session.practice_mode, grading_result)
-            updated_profile = KnowledgeProfileService.update_profile_after_grading(
-                db=db,
-                user_id=user_id,
-                question_id=db_session.question_id,
-                practice_mode=db_session.practice_mode,
-                grading_result=grading_result
-            )
-            if updated_profile:
-                print(f"Successfully updated knowledge profile for user {user_id}")
-            else:
-                print(f"Failed to update knowledge profile for user {user_id}")
-        except Exception as profile_error:
-            print(f"Error updating knowledge profile: {profile_error}")
-            # Don't fail the grading if profile update fails
-
-        # TASA L3/L2: record the mistake as an event-memory episode and refresh
-        # the persona bank on its cadence. Off the hot path, best-effort only.
-        try:
-            from app.services import memory_service, persona_service
-            await memory_service.generate_event(
-                db=db,
-                user_id=user_id,
-                question_id=db_session.question_id,
-                question_text=db_session.question_text,
-                practice_mode=db_session.practice_mode,
-                grading_result=grading_result,
-                source_grading_id=db_session.id,
-            )
-            await persona_service.maybe_regenerate(db, user_id)
-        except Exception as memory_error:
-            print(f"TASA memory/persona update failed (non-fatal): {memory_error}")
-
-        # Clean up the uploaded image file after grading
+        # Grading (Gemini, then the mastery/memory/persona writes) runs on the
+        # grading queue; the phone gets its answer as soon as the job is queued.
+        # Stash first: a worker drops the stash when it finishes the job.
+        grading_queue.stash_image(sessionId, processed.data)
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Cleaned up image file: {file_path}")
-        except Exception as cleanup_error:
-            print(f"Warning: Failed to clean up image file {file_path}: {cleanup_error}")
-            # Don't fail the request if cleanup fails
+            grading_queue.get_queue().enqueue(sessionId, processed.data)
+        except grading_queue.QueueFull:
+            grading_queue.drop_image(sessionId)
+            db_session.status = previous_status
+            db.commit()
+            raise HTTPException(status_code=503, detail="Grading is busy, please try again shortly")
 
         return {
-            "status": "success",
-            "message": "Image uploaded and graded successfully",
+            "status": "queued",
+            "message": "Image uploaded; grading has started",
             "sessionId": sessionId,
-            "result": grading_result
+            "jobId": sessionId,
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        # Clean up uploaded file if error occurs
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
         print(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
@@ -412,6 +365,13 @@ async def get_grading_result(
         if not db_session:
             raise HTTPException(status_code=404, detail="Session not found")
 
+        if db_session.status == grading_queue.FAILED:
+            return {
+                "status": db_session.status,
+                "result": None,
+                "error": "Grading failed, please resubmit"
+            }
+
         if db_session.status != "completed":
             return {
                 "status": db_session.status,
@@ -18,6 +18,7 @@ router = APIRouter()
 
 class SmartPracticeRequest(BaseModel):
     last_question_id: Optional[int] = None
+    practice_mode: Optional[str] = None  # which table last_question_id refers to
     correct: Optional[bool] = None
     time_spent: Optional[int] = None
     session_id: Optional[str] = None
@@ -50,6 +51,7 @@ async def get_next_question_mcp(
         context = {
             "user_id": current_user.id,
             "last_question_id": request.last_question_id,
+            "practice_mode": request.practice_mode,
             "correct": request.correct,
             "time_spent": request.time_spent,
             "session_id": request.session_id or f"session_{int(time.time())}"
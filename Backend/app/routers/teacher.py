@@ -0,0 +1,74 @@
+import traceback
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..auth.dependencies import get_current_student, get_current_teacher
+from ..database.database import get_db
+from ..database.models import StudentUser, TeacherUser
+from ..services import class_mastery_service
+
+router = APIRouter()
+
+
+@router.get("/api/teacher/class-mastery")
+async def get_class_mastery(
+    grade: Optional[str] = None,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=class_mastery_service.MAX_PAGE),
+    current_user: TeacherUser = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """Students × KCs decayed-mastery heatmap for the teacher's roster
+    (optionally only students of `grade`), one page of students at a time;
+    pass `next_after_id` back as `after_id` for the next page."""
+    try:
+        return {
+            "status": "success",
+            **class_mastery_service.class_heatmap(
+                db, current_user.id, grade=grade, after_id=after_id, limit=limit
+            ),
+        }
+    except Exception as e:
+        print(f"Error building class mastery heatmap: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Failed to build heatmap")
+
+
+@router.post("/api/teacher/{teacher_id}/enroll")
+async def enroll_with_teacher(
+    teacher_id: int,
+    current_user: StudentUser = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Join a teacher's class, sharing your mastery with them."""
+    teacher = db.query(TeacherUser).filter(TeacherUser.id == teacher_id, TeacherUser.is_active.isnot(False)).first()
+    if teacher is None:
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    created = class_mastery_service.enroll(db, teacher_id, current_user.id)
+    return {"status": "enrolled" if created else "already_enrolled", "teacherId": teacher_id}
+
+
+@router.delete("/api/teacher/{teacher_id}/enroll")
+async def leave_teacher(
+    teacher_id: int,
+    current_user: StudentUser = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Leave a teacher's class; they stop seeing your mastery."""
+    if not class_mastery_service.unenroll(db, teacher_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Not enrolled with this teacher")
+    return {"status": "removed", "teacherId": teacher_id}
+
+
+@router.delete("/api/teacher/students/{student_id}")
+async def remove_student(
+    student_id: int,
+    current_user: TeacherUser = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """Take a student off your roster."""
+    if not class_mastery_service.unenroll(db, current_user.id, student_id):
+        raise HTTPException(status_code=404, detail="Student not on your roster")
+    return {"status": "removed", "studentId": student_id}
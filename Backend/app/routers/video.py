@@ -65,7 +65,7 @@ async def youtube_video_quiz(request: dict, current_user = Depends(get_current_u
 
 
         # Generate quiz using Gemini
-        quiz_response = convo_service.gemini_service.generate_quiz(
+        quiz_response = await convo_service.gemini_service.generate_quiz(
             entire_transcript=entire_transcript,
             previous_messages=previous_messages
         )
@@ -0,0 +1,281 @@
+"""
+Rebuild `kc_mastery` from the append-only `attempt_events` log.
+
+`kc_mastery` only holds each (student, KC)'s latest posterior, so a BKT
+parameter change, a bug fix in the update, or a new question→KC mapping can
+only reach existing students by replaying their history. The rebuild streams
+students in id order, `chunk_users` at a time: it locks their mastery rows,
+reads their events, replays them through `mastery_engine.replay_attempts`
+with the current params and prerequisite graph, rewrites their rows, and
+commits together with the progress row in `mastery_rebuilds`. Memory is
+bounded by one chunk, and a killed run resumes after the last committed
+student.
+
+Concurrent grading is safe per chunk: `record_attempt` locks the same rows, so
+an attempt either committed before the chunk's lock (and is replayed) or
+waits and is applied on top of the rebuilt value; rows a grader creates
+meanwhile are picked up by `rebuild_chunk`.
+
+The discounted evidence `record_attempt` spreads along the prerequisite graph
+(`kc_graph.spread`) is replayed too, attempt by attempt and only onto KCs the
+student had practiced by then, so a rebuild with unchanged params and graph
+reproduces the live rows.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.database.models import AttemptEvent, KCMastery, MasteryRebuild, QuestionKC
+from app.services import kc_graph, mastery_engine
+from app.services.mastery_service import BktParams, insert_missing_rows, invalidate_snapshot, update_mastery_rows
+
+CHUNK_USERS = 500
+
+
+def start(db: Session, remap: bool = False) -> MasteryRebuild:
+    """Register a new rebuild. With `remap`, events are expanded through
+    today's `question_kc` instead of the KC weights stored at attempt time."""
+    rebuild = MasteryRebuild(remap=remap, last_user_id=0, n_users=0, n_events=0)
+    db.add(rebuild)
+    db.commit()
+    return rebuild
+
+
+def latest_unfinished(db: Session) -> Optional[MasteryRebuild]:
+    return (
+        db.query(MasteryRebuild)
+        .filter(MasteryRebuild.finished_at.is_(None))
+        .order_by(MasteryRebuild.id.desc())
+        .first()
+    )
+
+
+def next_users(db: Session, after_user_id: int, limit: int) -> List[int]:
+    return list(
+        db.scalars(
+            select(AttemptEvent.user_id)
+            .where(AttemptEvent.user_id > after_user_id)
+            .group_by(AttemptEvent.user_id)
+            .order_by(AttemptEvent.user_id)
+            .limit(limit)
+        )
+    )
+
+
+def _current_mapping(db: Session) -> Dict[Tuple[int, str], List[int]]:
+    mapping: Dict[Tuple[int, str], List[int]] = {}
+    for question_id, mode, kc_id in db.execute(
+        select(QuestionKC.question_id, QuestionKC.practice_mode, QuestionKC.kc_id)
+    ):
+        mapping.setdefault((question_id, mode), []).append(kc_id)
+    return mapping
+
+
+def _expand(
+    db: Session, user_ids: Sequence[int], mapping: Optional[Dict[Tuple[int, str], List[int]]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[List[int]], int, int]:
+    """The users' graded, mapped events in attempt order as `(user_id,
+    correct, epoch)` arrays plus each event's KC ids, how many events were
+    read and the highest event id among them."""
+    users, outcomes, times, event_kcs = [], [], [], []
+    n_events = last_event_id = 0
+    for event_id, user_id, question_id, mode, correct, weights, attempted_at in db.execute(
+        select(
+            AttemptEvent.id,
+            AttemptEvent.user_id,
+            AttemptEvent.question_id,
+            AttemptEvent.practice_mode,
+            AttemptEvent.correct,
+            AttemptEvent.kc_weights,
+            AttemptEvent.attempted_at,
+        )
+        .where(AttemptEvent.user_id.in_(list(user_ids)))
+        .order_by(AttemptEvent.user_id, AttemptEvent.id)
+    ):
+        n_events += 1
+        last_event_id = max(last_event_id, event_id)
+        kcs = mapping.get((question_id, mode), []) if mapping is not None else [k for k, _w in weights or []]
+        if kcs:
+            users.append(user_id)
+            outcomes.append(correct)
+            times.append(attempted_at)
+            event_kcs.append(list(kcs))
+    return (
+        np.array(users, dtype=np.int64),
+        np.array(outcomes, dtype=bool),
+        mastery_engine.to_epoch(times),
+        event_kcs,
+        n_events,
+        last_event_id,
+    )
+
+
+def _spread(
+    db: Session, users: np.ndarray, correct: np.ndarray, event_kcs: List[List[int]], state_of: Dict[Tuple[int, int], int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`(event, state, weight)` arrays of the graph evidence each event
+    spreads, as `record_attempt` computes it; only states the replay has
+    (KCs the student practices at some point) can hold a row to nudge."""
+    events, states, weights = [], [], []
+    if kc_graph.PROPAGATION_ENABLED:
+        graph = kc_graph.get_graph(db)
+        cache: Dict[Tuple[Tuple[int, ...], bool], Dict[int, float]] = {}
+        for e, (user_id, ok, kcs) in enumerate(zip(users.tolist(), correct.tolist(), event_kcs)):
+            key = (tuple(kcs), ok)
+            if key not in cache:
+                cache[key] = graph.spread(kcs, ok)
+            for kc_id, weight in cache[key].items():
+                state = state_of.get((user_id, kc_id))
+                if state is not None:
+                    events.append(e)
+                    states.append(state)
+                    weights.append(weight)
+    return (
+        np.array(events, dtype=np.int64),
+        np.array(states, dtype=np.int64),
+        np.array(weights, dtype=np.float64),
+    )
+
+
+def _replay(
+    db: Session,
+    user_ids: Sequence[int],
+    mapping: Optional[Dict[Tuple[int, str], List[int]]],
+    overrides: Optional[Dict[str, BktParams]],
+) -> Tuple[Dict[Tuple[int, int], Dict], int, int]:
+    """The rebuilt row values per (user_id, kc_id), how many events were
+    replayed and the last event id read."""
+    users, correct, times, event_kcs, n_events, last_event_id = _expand(db, user_ids, mapping)
+
+    direct_event = np.repeat(np.arange(len(event_kcs)), [len(kcs) for kcs in event_kcs])
+    direct_kc = np.array([kc_id for kcs in event_kcs for kc_id in kcs], dtype=np.int64)
+    pairs, direct_state = np.unique(
+        np.stack([users[direct_event], direct_kc], axis=1).reshape(-1, 2), axis=0, return_inverse=True
+    )
+    state_of = {(user_id, kc_id): i for i, (user_id, kc_id) in enumerate(pairs.tolist())}
+    spread_event, spread_state, spread_weight = _spread(db, users, correct, event_kcs, state_of)
+    params = mastery_engine.kc_params_matrix(db, pairs[:, 1].tolist(), overrides)
+    result = mastery_engine.replay_attempts(
+        users, correct, times, direct_event, direct_state.ravel(),
+        spread_event, spread_state, spread_weight, params,
+    )
+
+    now = datetime.utcnow()
+    values = {}
+    for i, pair in enumerate(state_of):
+        last = result.last_practiced[i]
+        values[pair] = {
+            "p_mastery": float(result.p_mastery[i]),
+            "n_attempts": int(result.n_attempts[i]),
+            "n_correct": int(result.n_correct[i]),
+            "last_practiced_at": (
+                None if np.isnan(last) else mastery_engine._EPOCH + timedelta(seconds=float(last))
+            ),
+            "updated_at": now,
+        }
+    return values, n_events, last_event_id
+
+
+def _lock_new_rows(db: Session, locked: Dict[Tuple[int, int], int], values: Dict[Tuple[int, int], Dict]) -> bool:
+    """Create (skipping conflicts) and lock the rows of replayed pairs not
+    locked yet, adding them to `locked`. False if there were none."""
+    missing = [pair for pair in values if pair not in locked]
+    if not missing:
+        return False
+    insert_missing_rows(db, [{"user_id": u, "kc_id": k, **values[(u, k)]} for u, k in missing])
+    wanted = set(missing)
+    for row_id, user_id, kc_id in db.execute(
+        select(KCMastery.id, KCMastery.user_id, KCMastery.kc_id)
+        .where(KCMastery.user_id.in_(list({u for u, _k in missing})))
+        .order_by(KCMastery.user_id, KCMastery.kc_id)
+        .with_for_update()
+    ):
+        if (user_id, kc_id) in wanted:
+            locked[(user_id, kc_id)] = row_id
+    return True
+
+
+def preview(
+    db: Session,
+    user_ids: Sequence[int],
+    remap: bool = False,
+    overrides: Optional[Dict[str, BktParams]] = None,
+) -> Dict[Tuple[int, int], Dict]:
+    """The row values `rebuild_chunk` would write for `user_ids`, per
+    (user_id, kc_id), without locking or writing anything."""
+    return _replay(db, user_ids, _current_mapping(db) if remap else None, overrides)[0]
+
+
+def rebuild_chunk(
+    db: Session,
+    user_ids: Sequence[int],
+    remap: bool = False,
+    overrides: Optional[Dict[str, BktParams]] = None,
+    mapping: Optional[Dict[Tuple[int, str], List[int]]] = None,
+) -> int:
+    """Replay and replace the mastery rows of `user_ids` (uncommitted).
+    Returns the number of events replayed.
+
+    Rows are updated in place, so a grader waiting on their lock sees the
+    rebuilt values, and rows no replayed event touches are deleted. A grader
+    can still commit a student's first row for some KC after the chunk's lock:
+    the replay's new pairs are inserted skipping conflicts and locked, and if
+    events arrived meanwhile the chunk is replayed again under those locks."""
+    locked = {
+        (user_id, kc_id): row_id
+        for row_id, user_id, kc_id in db.execute(
+            select(KCMastery.id, KCMastery.user_id, KCMastery.kc_id)
+            .where(KCMastery.user_id.in_(list(user_ids)))
+            .order_by(KCMastery.user_id, KCMastery.kc_id)
+            .with_for_update()
+        )
+    }
+    if remap and mapping is None:
+        mapping = _current_mapping(db)
+    while True:
+        values, n_events, last_event_id = _replay(db, user_ids, mapping if remap else None, overrides)
+        if not _lock_new_rows(db, locked, values) or db.scalar(
+            select(AttemptEvent.id)
+            .where(AttemptEvent.user_id.in_(list(user_ids)), AttemptEvent.id > last_event_id)
+            .limit(1)
+        ) is None:
+            break
+
+    update_mastery_rows(db, [{"id": locked.pop(pair), **row} for pair, row in values.items()])
+    if locked:
+        db.execute(delete(KCMastery).where(KCMastery.id.in_(list(locked.values()))))
+    return n_events
+
+
+def run(
+    db: Session,
+    rebuild: MasteryRebuild,
+    chunk_users: int = CHUNK_USERS,
+    max_chunks: Optional[int] = None,
+    overrides: Optional[Dict[str, BktParams]] = None,
+    progress: Optional[Callable[[MasteryRebuild], None]] = None,
+) -> MasteryRebuild:
+    """Rebuild chunk by chunk from `rebuild.last_user_id`, committing each
+    chunk with the progress row. Stops after `max_chunks` (None: until done)."""
+    mapping = _current_mapping(db) if rebuild.remap else None
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        user_ids = next_users(db, rebuild.last_user_id, chunk_users)
+        if not user_ids:
+            rebuild.finished_at = datetime.utcnow()
+            db.commit()
+            break
+        n_events = rebuild_chunk(db, user_ids, rebuild.remap, overrides, mapping)
+        rebuild.last_user_id = user_ids[-1]
+        rebuild.n_users += len(user_ids)
+        rebuild.n_events += n_events
+        db.commit()
+        for user_id in user_ids:
+            invalidate_snapshot(user_id)
+        chunks += 1
+        if progress is not None:
+            progress(rebuild)
+    return rebuild
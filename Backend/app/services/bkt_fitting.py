@@ -0,0 +1,355 @@
+"""
+Offline BKT parameter fitting by expectation-maximization (Baum-Welch).
+
+`mastery_service._TIER_PARAMS` are hand-set; this module fits p_L0/p_T/p_S/p_G
+per difficulty tier or per KC from logged grading history (every completed
+`GradingSession`, expanded through `question_kc` by
+`mastery_engine.grading_history`) and stores them in `bkt_params`, where
+`params_for_kc` picks them up ahead of the defaults.
+
+Each (student, KC) attempt sequence is one HMM chain, and all chains are
+processed together: as in `mastery_engine.replay`, the forward and backward
+passes run in rounds over the t-th attempt of every chain, so the Python loop
+is max-chain-length long and each step is a few NumPy ops over every active
+chain. Sufficient statistics are summed per parameter group with `bincount`.
+
+Standard BKT has no forgetting, so the fit ignores time gaps between attempts;
+the forgetting curve stays a separate read/update-time step.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database.models import FittedBktParams
+from app.services.kc_registry import get_registry, invalidate
+from app.services.mastery_engine import P_G, P_L0, P_S, P_T, grading_history
+from app.services.mastery_service import BktParams
+
+# Keep the fit identifiable: slip/guess above these make "mastered" and
+# "unmastered" swap meaning.
+MAX_SLIP = 0.3
+MAX_GUESS = 0.4
+_EPS = 1e-4
+
+GroupKey = Union[str, int]  # difficulty tier or kc_id
+
+
+def _as_array(params: BktParams) -> Tuple[float, float, float, float]:
+    return (params.p_L0, params.p_T, params.p_S, params.p_G)
+
+
+def _as_params(row: np.ndarray) -> BktParams:
+    return BktParams(p_L0=float(row[P_L0]), p_T=float(row[P_T]), p_S=float(row[P_S]), p_G=float(row[P_G]))
+
+
+@dataclass
+class Chains:
+    """Attempt events sorted by (chain, time), with round bookkeeping."""
+
+    group: np.ndarray     # parameter group per event
+    correct: np.ndarray   # bool per event
+    first: np.ndarray     # event starts its chain
+    has_next: np.ndarray  # event is followed by another in its chain
+    by_round: np.ndarray  # event indices grouped by position in chain
+    bounds: np.ndarray    # by_round[bounds[r]:bounds[r+1]] is round r
+
+    @classmethod
+    def build(
+        cls, chain: np.ndarray, group_of_chain: np.ndarray, correct: np.ndarray, timestamps: np.ndarray
+    ) -> "Chains":
+        chain = np.asarray(chain, dtype=np.int64)
+        order = np.lexsort((np.asarray(timestamps, dtype=np.float64), chain))
+        chain = chain[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(chain)) + 1] if chain.size else np.zeros(0, dtype=np.int64)
+        rank = np.arange(chain.size) - np.repeat(starts, np.diff(np.r_[starts, chain.size]))
+        return cls(
+            group=np.asarray(group_of_chain, dtype=np.int64)[chain],
+            correct=np.asarray(correct, dtype=bool)[order],
+            first=rank == 0,
+            has_next=np.r_[chain[1:] == chain[:-1], False] if chain.size else np.zeros(0, dtype=bool),
+            by_round=np.argsort(rank, kind="stable"),
+            bounds=np.r_[0, np.cumsum(np.bincount(rank))] if chain.size else np.zeros(1, dtype=np.int64),
+        )
+
+    @property
+    def size(self) -> int:
+        return self.correct.size
+
+    def rounds(self):
+        for r in range(len(self.bounds) - 1):
+            yield self.by_round[self.bounds[r]:self.bounds[r + 1]]
+
+
+def _emissions(chains: Chains, P: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """P(observation | mastered), P(observation | not mastered) per event."""
+    slip, guess = P[:, P_S], P[:, P_G]
+    e1 = np.where(chains.correct, 1 - slip, slip)
+    e0 = np.where(chains.correct, guess, 1 - guess)
+    return e1, e0
+
+
+def _forward(chains: Chains, P: np.ndarray, e1: np.ndarray, e0: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Filtered P(mastered | attempts so far) and the per-event scale
+    P(observation | earlier attempts), whose logs sum to the log-likelihood."""
+    f1 = np.zeros(chains.size)
+    scale = np.empty(chains.size)
+    for idx in chains.rounds():
+        prior = np.where(
+            chains.first[idx], P[idx, P_L0], f1[idx - 1] + (1 - f1[idx - 1]) * P[idx, P_T]
+        )
+        u1 = prior * e1[idx]
+        s = u1 + (1 - prior) * e0[idx]
+        f1[idx] = u1 / s
+        scale[idx] = s
+    return f1, scale
+
+
+def log_likelihood(chains: Chains, params: np.ndarray) -> float:
+    """Total log P(observations) under `(n_groups, 4)` params."""
+    if not chains.size:
+        return 0.0
+    P = params[chains.group]
+    e1, e0 = _emissions(chains, P)
+    _, scale = _forward(chains, P, e1, e0)
+    return float(np.log(scale).sum())
+
+
+def _e_step(chains: Chains, P: np.ndarray):
+    e1, e0 = _emissions(chains, P)
+    f1, scale = _forward(chains, P, e1, e0)
+
+    # Scaled backward pass; w1 is the mastered-branch message from t+1.
+    b1 = np.ones(chains.size)
+    b0 = np.ones(chains.size)
+    w1 = np.zeros(chains.size)
+    for idx in reversed(list(chains.rounds())):
+        idx = idx[chains.has_next[idx]]
+        nxt = idx + 1
+        m1 = e1[nxt] * b1[nxt] / scale[nxt]
+        m0 = e0[nxt] * b0[nxt] / scale[nxt]
+        p_T = P[idx, P_T]
+        b1[idx] = m1
+        b0[idx] = (1 - p_T) * m0 + p_T * m1
+        w1[idx] = m1
+
+    norm = f1 * b1 + (1 - f1) * b0
+    g1 = f1 * b1 / norm
+    # Expected "learned between t and t+1" (not mastered -> mastered).
+    learned = np.where(chains.has_next, (1 - f1) * P[:, P_T] * w1 / norm, 0.0)
+    return g1, learned, float(np.log(scale).sum())
+
+
+def _m_step(chains: Chains, g1: np.ndarray, learned: np.ndarray, params: np.ndarray) -> np.ndarray:
+    n_groups = params.shape[0]
+    g0 = 1 - g1
+    total = lambda weights, mask=None: np.bincount(
+        chains.group if mask is None else chains.group[mask],
+        weights=weights if mask is None else weights[mask],
+        minlength=n_groups,
+    )
+    sums = np.stack(
+        [
+            total(g1, chains.first),                 # p_L0 numerator
+            total(np.ones(chains.size), chains.first),
+            total(learned, chains.has_next),         # p_T
+            total(g0, chains.has_next),
+            total(g1 * ~chains.correct),             # p_S
+            total(g1),
+            total(g0 * chains.correct),              # p_G
+            total(g0),
+        ],
+        axis=1,
+    )
+    updated = params.copy()
+    for col, (num, den) in zip((P_L0, P_T, P_S, P_G), ((0, 1), (2, 3), (4, 5), (6, 7))):
+        ok = sums[:, den] > 0
+        updated[ok, col] = sums[ok, num] / sums[ok, den]
+    updated[:, P_L0] = np.clip(updated[:, P_L0], _EPS, 1 - _EPS)
+    updated[:, P_T] = np.clip(updated[:, P_T], _EPS, 1 - _EPS)
+    updated[:, P_S] = np.clip(updated[:, P_S], _EPS, MAX_SLIP)
+    updated[:, P_G] = np.clip(updated[:, P_G], _EPS, MAX_GUESS)
+    return updated
+
+
+def fit_em(
+    chains: Chains, init: np.ndarray, max_iter: int = 100, tol: float = 1e-6
+) -> Tuple[np.ndarray, float, int]:
+    """EM from `init` (`(n_groups, 4)`) until the per-attempt log-likelihood
+    gain drops below `tol`. Returns `(params, log_likelihood, iterations)`."""
+    params = np.array(init, dtype=np.float64)
+    if not chains.size:
+        return params, 0.0, 0
+    previous = -np.inf
+    for iteration in range(1, max_iter + 1):
+        g1, learned, ll = _e_step(chains, params[chains.group])
+        if ll - previous < tol * chains.size:
+            return params, ll, iteration
+        params = _m_step(chains, g1, learned, params)
+        previous = ll
+    return params, log_likelihood(chains, params), max_iter
+
+
+def simulate(
+    params: np.ndarray, chain_group: np.ndarray, length: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sample `length` attempts for each chain from the BKT generative model
+    with its group's params. Returns `(chain, correct, timestamps)` event
+    arrays, for parameter-recovery checks and benchmarks."""
+    rng = np.random.default_rng(seed)
+    P = params[np.asarray(chain_group, dtype=np.int64)]
+    n_chains = P.shape[0]
+    mastered = rng.random(n_chains) < P[:, P_L0]
+    correct = np.empty((n_chains, length), dtype=bool)
+    for t in range(length):
+        p_correct = np.where(mastered, 1 - P[:, P_S], P[:, P_G])
+        correct[:, t] = rng.random(n_chains) < p_correct
+        mastered |= rng.random(n_chains) < P[:, P_T]
+    chain = np.repeat(np.arange(n_chains), length)
+    timestamps = np.tile(np.arange(length, dtype=np.float64), n_chains)
+    return chain, correct.ravel(), timestamps
+
+
+# ---- Fitting from grading history ----
+
+
+@dataclass
+class GroupFit:
+    key: GroupKey
+    fitted: BktParams
+    current: BktParams
+    n_train: int
+    n_heldout: int
+    heldout_ll: Optional[float]   # mean per held-out attempt, fitted params
+    baseline_ll: Optional[float]  # same, current params
+
+    @property
+    def adopt(self) -> bool:
+        """Fitted params explain unseen students' attempts better."""
+        return self.heldout_ll is not None and self.heldout_ll > self.baseline_ll
+
+
+@dataclass
+class FitReport:
+    by: str                       # "tier" | "kc"
+    groups: List[GroupFit] = field(default_factory=list)
+    skipped: Dict[GroupKey, int] = field(default_factory=dict)  # too few attempts
+    iterations: int = 0
+    heldout_ll: Optional[float] = None
+    baseline_ll: Optional[float] = None
+
+    @property
+    def adopt(self) -> bool:
+        return self.heldout_ll is not None and self.heldout_ll > self.baseline_ll
+
+
+def _heldout_means(chains: Chains, fitted: np.ndarray, current: np.ndarray, n_groups: int):
+    """Mean per-attempt held-out log-likelihood per group and overall."""
+    if not chains.size:
+        return np.full(n_groups, np.nan), np.full(n_groups, np.nan), None, None
+    counts = np.bincount(chains.group, minlength=n_groups)
+    out = []
+    for params in (fitted, current):
+        P = params[chains.group]
+        e1, e0 = _emissions(chains, P)
+        _, scale = _forward(chains, P, e1, e0)
+        logs = np.log(scale)
+        per_group = np.bincount(chains.group, weights=logs, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out.append((per_group / counts, float(logs.mean())))
+    (fit_g, fit_all), (cur_g, cur_all) = out
+    return fit_g, cur_g, fit_all, cur_all
+
+
+def fit_history(
+    db: Session,
+    by: str = "tier",
+    holdout: float = 0.2,
+    min_attempts: int = 200,
+    seed: int = 0,
+    max_iter: int = 100,
+    user_ids: Optional[Sequence[int]] = None,
+) -> FitReport:
+    """Fit params per tier (or per KC) on a random `1 - holdout` of students
+    and score fitted vs current params on the rest. Groups with fewer than
+    `min_attempts` training attempts are skipped (they keep falling back)."""
+    if by not in ("tier", "kc"):
+        raise ValueError(f"by must be 'tier' or 'kc', not {by!r}")
+    users, kc_ids, correct, times = grading_history(db, user_ids)
+    registry = get_registry(db)
+    report = FitReport(by=by)
+    if not users.size:
+        return report
+
+    pairs, chain = np.unique(np.stack([users, kc_ids], axis=1), axis=0, return_inverse=True)
+    chain = chain.ravel()
+    tier_of = lambda kc_id: getattr(registry.by_id.get(int(kc_id)), "difficulty_tier", None)
+    chain_keys = [tier_of(k) if by == "tier" else int(k) for k in pairs[:, 1]]
+    keys = sorted(set(chain_keys), key=str)
+    group_of = {key: g for g, key in enumerate(keys)}
+    chain_group = np.array([group_of[key] for key in chain_keys], dtype=np.int64)
+    current = np.array(
+        [
+            _as_array(registry.tier_params.get(key, registry.default_params) if by == "tier" else registry.params(key))
+            for key in keys
+        ]
+    )
+
+    student_ids = np.unique(pairs[:, 0])
+    heldout_students = student_ids[np.random.default_rng(seed).random(student_ids.size) < holdout]
+    is_heldout = np.isin(pairs[:, 0], heldout_students)[chain]
+
+    train = Chains.build(chain[~is_heldout], chain_group, correct[~is_heldout], times[~is_heldout])
+    test = Chains.build(chain[is_heldout], chain_group, correct[is_heldout], times[is_heldout])
+    n_train = np.bincount(train.group, minlength=len(keys))
+    n_test = np.bincount(test.group, minlength=len(keys))
+
+    fitted, _, report.iterations = fit_em(train, current, max_iter=max_iter)
+    # Too-thin groups keep their current params in the held-out comparison too.
+    thin = n_train < min_attempts
+    fitted[thin] = current[thin]
+    fit_g, cur_g, report.heldout_ll, report.baseline_ll = _heldout_means(test, fitted, current, len(keys))
+
+    for g, key in enumerate(keys):
+        if thin[g]:
+            report.skipped[key] = int(n_train[g])
+            continue
+        report.groups.append(
+            GroupFit(
+                key=key,
+                fitted=_as_params(fitted[g]),
+                current=_as_params(current[g]),
+                n_train=int(n_train[g]),
+                n_heldout=int(n_test[g]),
+                heldout_ll=None if n_test[g] == 0 else float(fit_g[g]),
+                baseline_ll=None if n_test[g] == 0 else float(cur_g[g]),
+            )
+        )
+    return report
+
+
+def save(db: Session, report: FitReport) -> int:
+    """Replace the stored params of the report's scope (tiers or KCs) with its
+    fitted groups. Caller commits."""
+    column = FittedBktParams.difficulty_tier if report.by == "tier" else FittedBktParams.kc_id
+    db.query(FittedBktParams).filter(column.isnot(None)).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    for group in report.groups:
+        db.add(
+            FittedBktParams(
+                kc_id=group.key if report.by == "kc" else None,
+                difficulty_tier=group.key if report.by == "tier" else None,
+                p_L0=group.fitted.p_L0,
+                p_T=group.fitted.p_T,
+                p_S=group.fitted.p_S,
+                p_G=group.fitted.p_G,
+                n_attempts=group.n_train,
+                heldout_ll=group.heldout_ll,
+                baseline_ll=group.baseline_ll,
+                fitted_at=now,
+            )
+        )
+    invalidate()
+    return len(report.groups)
@@ -0,0 +1,149 @@
+"""
+Class-wide mastery heatmap for teachers: a students × KCs matrix of decayed
+mastery.
+
+One page of students (a cohort is the active students on the teacher's roster,
+`ClassEnrollment`, optionally narrowed to a `grade`, paged by id) is read with their stored mastery in a single LEFT JOIN; decay is then
+applied to the whole matrix at once (`mastery_engine.decay_batch`) rather than
+per row as `current_mastery` does. The undecayed page is cached per cohort page
+for `CLASS_HEATMAP_TTL_SECONDS`; decay only depends on stored timestamps, so
+cached pages are re-decayed on every read and the TTL only bounds how long a
+new attempt can go unseen.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database.models import ClassEnrollment, KCMastery, StudentUser
+from app.services import mastery_engine
+from app.services.kc_registry import get_registry
+from app.services.ttl_cache import TTLCache
+
+CACHE_TTL_SECONDS = float(os.getenv("CLASS_HEATMAP_TTL_SECONDS", "60"))
+MAX_PAGE = 200
+
+_pages = TTLCache(maxsize=256, ttl=CACHE_TTL_SECONDS)
+
+
+def _load_page(db: Session, teacher_id: int, grade: Optional[str], after_id: int, limit: int) -> Dict:
+    registry = get_registry(db)
+    kcs = [kc for kc in registry.kcs if kc.id is not None]
+    col_of = {kc.id: j for j, kc in enumerate(kcs)}
+
+    students = (
+        select(StudentUser.id, StudentUser.name)
+        .join(ClassEnrollment, ClassEnrollment.student_id == StudentUser.id)
+        .where(
+            ClassEnrollment.teacher_id == teacher_id,
+            StudentUser.is_active.isnot(False),
+            StudentUser.id > after_id,
+        )
+    )
+    if grade is not None:
+        students = students.where(StudentUser.grade == grade)
+    page = students.order_by(StudentUser.id).limit(limit).subquery()
+    rows = db.execute(
+        select(page.c.id, page.c.name, KCMastery.kc_id, KCMastery.p_mastery, KCMastery.last_practiced_at)
+        .outerjoin(KCMastery, KCMastery.user_id == page.c.id)
+        .order_by(page.c.id)
+    ).all()
+
+    student_list: List[Dict] = []
+    row_of: Dict[int, int] = {}
+    cells_r, cells_c, values, practiced = [], [], [], []
+    for user_id, name, kc_id, p_mastery, last_practiced_at in rows:
+        if user_id not in row_of:
+            row_of[user_id] = len(student_list)
+            student_list.append({"id": user_id, "name": name})
+        if kc_id is None or kc_id not in col_of:
+            continue
+        cells_r.append(row_of[user_id])
+        cells_c.append(col_of[kc_id])
+        values.append(p_mastery)
+        practiced.append(last_practiced_at)
+
+    shape = (len(student_list), len(kcs))
+    stored = np.full(shape, np.nan)
+    last = np.full(shape, np.nan)
+    stored[cells_r, cells_c] = values
+    last[cells_r, cells_c] = mastery_engine.to_epoch(practiced)
+    return {
+        "students": student_list,
+        "kcs": [{"id": kc.id, "slug": kc.slug, "name": kc.name, "domain": kc.domain} for kc in kcs],
+        "stored": stored,
+        "last_practiced": last,
+        "full_page": len(student_list) == limit,
+    }
+
+
+def _cells(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    rounded = np.round(matrix, 3).astype(object)
+    rounded[np.isnan(matrix)] = None
+    return rounded.tolist()
+
+
+def class_heatmap(
+    db: Session,
+    teacher_id: int,
+    grade: Optional[str] = None,
+    after_id: int = 0,
+    limit: int = 50,
+    now: Optional[datetime] = None,
+) -> Dict:
+    """Decayed mastery for one page of `teacher_id`'s roster: `mastery[i][j]`
+    is student i on KC j (None where never practiced). `next_after_id` pages
+    onward."""
+    limit = max(1, min(limit, MAX_PAGE))
+    key = (teacher_id, grade, after_id, limit)
+    page = _pages.get(key)
+    cached = page is not None
+    if page is None:
+        page = _load_page(db, teacher_id, grade, after_id, limit)
+        _pages.set(key, page)
+
+    now_s = mastery_engine.to_epoch([now or datetime.utcnow()])[0]
+    days = (now_s - page["last_practiced"]) / 86400.0
+    decayed = mastery_engine.decay_batch(page["stored"], days)
+    with np.errstate(invalid="ignore"):
+        practiced = ~np.isnan(decayed)
+        counts = practiced.sum(axis=0)
+        means = np.where(counts > 0, np.nansum(decayed, axis=0) / np.maximum(counts, 1), np.nan)
+
+    students = page["students"]
+    return {
+        "students": students,
+        "kcs": page["kcs"],
+        "mastery": _cells(decayed),
+        "kc_means": _cells(means[None, :])[0] if means.size else [],
+        "kc_students_practiced": counts.tolist(),
+        "next_after_id": students[-1]["id"] if page["full_page"] and students else None,
+        "cached": cached,
+    }
+
+
+def enroll(db: Session, teacher_id: int, student_id: int) -> bool:
+    """Put a student on a teacher's roster. False if already enrolled."""
+    exists = db.query(ClassEnrollment.id).filter_by(teacher_id=teacher_id, student_id=student_id).first()
+    if exists:
+        return False
+    db.add(ClassEnrollment(teacher_id=teacher_id, student_id=student_id))
+    db.commit()
+    clear_cache()
+    return True
+
+
+def unenroll(db: Session, teacher_id: int, student_id: int) -> bool:
+    """Take a student off a teacher's roster. False if they weren't on it."""
+    removed = db.query(ClassEnrollment).filter_by(teacher_id=teacher_id, student_id=student_id).delete()
+    db.commit()
+    # Cached pages would keep showing the student until they expire.
+    clear_cache()
+    return bool(removed)
+
+
+def clear_cache() -> None:
+    _pages.clear()
@@ -7,6 +7,9 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 import json
 
+# Decayed mastery below which a prerequisite counts as a gap.
+SKILL_GAP_THRESHOLD = 0.6
+
 
 class EducationMCPServer:
     """
@@ -109,7 +112,7 @@ class EducationMCPServer:
             },
             {
                 "name": "identify_skill_gaps",
-                "description": "Identify prerequisite skill gaps that may be preventing mastery of target skill. Returns list of weak prerequisite skills that should be strengthened first.",
+                "description": "Identify prerequisite skill gaps that may be preventing mastery of target skill. Returns list of weak prerequisite skills (prerequisites first) that should be strengthened first.",
                 "parameters": {
                     "type": "object",
                     "properties": {
@@ -119,7 +122,7 @@ class EducationMCPServer:
                         },
                         "target_skill": {
                             "type": "string",
-                            "description": "The skill to check prerequisites for"
+                            "description": "The kc_slug (from get_student_profile) to check prerequisites for"
                         }
                     },
                     "required": ["user_id", "target_skill"]
@@ -156,6 +159,24 @@ class EducationMCPServer:
                     },
                     "required": ["user_id", "question_id"]
                 }
+            },
+            {
+                "name": "get_common_misconceptions",
+                "description": "Get the mistakes most often made by students across the whole platform on a knowledge component, each with how many students made it.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "kc_slug": {
+                            "type": "string",
+                            "description": "The knowledge component slug"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum misconceptions to return (default 5)"
+                        }
+                    },
+                    "required": ["kc_slug"]
+                }
             }
         ]
 
@@ -207,6 +228,12 @@ class EducationMCPServer:
                 tool_args["question_id"]
             )
 
+        elif tool_name == "get_common_misconceptions":
+            return self._get_common_misconceptions(
+                tool_args["kc_slug"],
+                tool_args.get("limit", 5)
+            )
+
         else:
             return {"error": f"Unknown tool: {tool_name}"}
 
@@ -248,6 +275,16 @@ class EducationMCPServer:
             ),
         }
 
+    def _get_common_misconceptions(self, kc_slug: str, limit: int = 5) -> Dict:
+        """Real: clusters of near-duplicate memory events across all students."""
+        from app.services.misconception_library import get_library
+
+        top = get_library(self.db).top_misconceptions(kc_slug, limit)
+        return {
+            "kc_slug": kc_slug,
+            "misconceptions": [m.to_dict() for m in top],
+        }
+
     def _search_questions(self, skill: str, difficulty_min: float = 0.0,
                          difficulty_max: float = 1.0, topic: str = None,
                          limit: int = 10) -> Dict:
@@ -397,29 +434,36 @@ class EducationMCPServer:
         }
 
     def _identify_skill_gaps(self, user_id: int, target_skill: str) -> Dict:
-        """MOCKED: Identify prerequisite gaps"""
-        # Simulated gap analysis
-        skill_gap_data = {
-            "quadratic_formula": [
-                {"skill": "algebraic_manipulation", "current_score": 55, "target_score": 70, "gap": 15},
-                {"skill": "square_roots", "current_score": 65, "target_score": 70, "gap": 5}
-            ],
-            "completing_the_square": [
-                {"skill": "algebraic_manipulation", "current_score": 55, "target_score": 75, "gap": 20},
-                {"skill": "perfect_squares", "current_score": 50, "target_score": 70, "gap": 20}
-            ],
-            "sum_of_terms": [
-                {"skill": "finding_nth_term", "current_score": 50, "target_score": 70, "gap": 20},
-                {"skill": "basic_arithmetic", "current_score": 80, "target_score": 70, "gap": 0}
-            ]
-        }
+        """Real: the transitive prerequisites of the `target_skill` KC the
+        student is weak on (below SKILL_GAP_THRESHOLD after decay, or never
+        practiced), prerequisites-first, from the precomputed KC graph."""
+        from app.services import kc_graph
+        from app.services.mastery_service import current_mastery
+
+        if target_skill not in kc_graph.get_graph(self.db).index:
+            return {
+                "target_skill": target_skill,
+                "gaps": [],
+                "total_gaps": 0,
+                "recommendation": "Unknown skill: pass a kc_slug from get_student_profile",
+            }
 
-        gaps = skill_gap_data.get(target_skill, [])
+        weak = kc_graph.weak_prerequisites(self.db, user_id, target_skill, threshold=SKILL_GAP_THRESHOLD)
+        mastery = {row["kc_slug"]: row for row in current_mastery(self.db, user_id)}
+        gaps = [
+            {
+                "skill": slug,
+                "skill_name": mastery[slug]["kc_name"] if slug in mastery else None,
+                "current_mastery": mastery[slug]["mastery"] if slug in mastery else None,
+                "target_mastery": SKILL_GAP_THRESHOLD,
+            }
+            for slug in weak
+        ]
 
         return {
             "target_skill": target_skill,
-            "gaps": [g for g in gaps if g["gap"] > 0],
-            "total_gaps": len([g for g in gaps if g["gap"] > 0]),
+            "gaps": gaps,
+            "total_gaps": len(gaps),
             "recommendation": "Focus on prerequisite skills before advancing" if gaps else "No major gaps detected"
         }
 
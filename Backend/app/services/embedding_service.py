@@ -3,14 +3,35 @@ Text embeddings via Gemini `text-embedding-004`.
 
 Used by the TASA knowledge model (persona / event-memory banks) to encode
 descriptions once at write time and the current query at read time. Vectors are
-stored as plain JSON lists on the ORM rows; similarity search is done in
-`vector_repo` with pure-Python cosine.
+stored as compact float32 blobs on the ORM rows (`database/vector_type.py`);
+similarity search is done in `vector_repo` (cached per-student float32
+matrices, one mat-vec per bank).
+
+Embeddings are content-addressed — the same (model, task type, title, text)
+always yields the same vector — so every call goes through a two-tier cache: an
+in-process LRU, then Redis (shared across workers). The smart-practice read path
+only ever embeds a couple of distinct query strings, so in steady state it makes
+no Gemini round trip at all.
+
+The write path batches: `embed_documents_batch` sends every cache miss in one
+batch-embedding request per `BATCH_SIZE` texts, and `embed_document_async`
+routes concurrent single-text calls (e.g. several graded uploads at once)
+through a `MicroBatcher` so they share one upstream call.
 """
 import asyncio
+import hashlib
+import json
 import os
-from typing import List, Optional
+import threading
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import google.generativeai as genai
+import numpy as np
+
+from app.services import gemini_client
+from app.services.micro_batcher import MicroBatcher
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
 
 # 768-dim model; RETRIEVAL_* task types let the query and stored documents be
 # embedded asymmetrically, which improves retrieval quality over plain similarity.
@@ -18,7 +39,27 @@ _MODEL = "models/text-embedding-004"
 _DOCUMENT = "RETRIEVAL_DOCUMENT"
 _QUERY = "RETRIEVAL_QUERY"
 
+# Cache sizing: ~3 KB per 768-dim vector in-process; Redis holds float32 bytes.
+CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+_REDIS_PREFIX = "emb:"
+
+# Gemini accepts up to 100 texts per batch-embedding request.
+BATCH_SIZE = 100
+# Upper bound on concurrent upstream embedding requests from this process.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+# How long the micro-batcher holds the first queued text for company.
+BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+
+_upstream_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MicroBatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
 _configured = False
+_local = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+_redis_hits = 0
+_redis_misses = 0
 
 
 def _ensure_configured() -> None:
@@ -34,25 +75,209 @@ def _ensure_configured() -> None:
     _configured = True
 
 
+def cache_key(task_type: str, text: str, title: Optional[str] = None) -> str:
+    """Stable content hash of everything that determines the vector."""
+    payload = json.dumps([_MODEL, task_type, title, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _redis_get(key: str) -> Optional[List[float]]:
+    global _redis_hits, _redis_misses
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        blob = client.get(_REDIS_PREFIX + key)
+    except Exception as err:
+        redis_failed(err)
+        return None
+    if blob is None:
+        _redis_misses += 1
+        return None
+    _redis_hits += 1
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+def _cache_put(key: str, vec: List[float]) -> None:
+    _local.set(key, tuple(vec))
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(
+            _REDIS_PREFIX + key, CACHE_TTL_SECONDS, np.asarray(vec, dtype=np.float32).tobytes()
+        )
+    except Exception as err:
+        redis_failed(err)
+
+
+def _embed_local_miss(key: str, text: str, task_type: str, title: Optional[str]) -> List[float]:
+    """Second tier (Redis), then the Gemini round trip; fills both tiers."""
+    vec = _redis_get(key)
+    if vec is not None:
+        _local.set(key, tuple(vec))
+        return vec
+
+    _ensure_configured()
+    with _upstream_slots, gemini_client.timed(_MODEL):
+        result = genai.embed_content(model=_MODEL, content=text, task_type=task_type, title=title)
+    vec = result["embedding"]
+    _cache_put(key, vec)
+    return vec
+
+
+def _embed_chunk(texts: List[str], task_type: str, title: Optional[str]) -> List[List[float]]:
+    """One batch-embedding round trip for up to `BATCH_SIZE` texts."""
+    _ensure_configured()
+    with _upstream_slots, gemini_client.timed(_MODEL):
+        result = genai.embed_content(model=_MODEL, content=texts, task_type=task_type, title=title)
+    vectors = result["embedding"]
+    if len(vectors) != len(texts):
+        raise RuntimeError(f"embedding batch returned {len(vectors)} vectors for {len(texts)} texts")
+    return vectors
+
+
+def _embed_many(
+    texts: Sequence[str],
+    task_type: str,
+    title: Optional[str] = None,
+    local_checked: bool = False,
+) -> List[Union[List[float], Exception]]:
+    """Cache-aware batch embed. Each slot holds a vector or the Exception that
+    item failed with; a failed batch is retried text-by-text so one bad input
+    doesn't sink the rest. `local_checked` skips the in-process tier when the
+    caller has already missed it."""
+    results: List[Union[List[float], Exception, None]] = [None] * len(texts)
+    misses: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        key = cache_key(task_type, text, title)
+        cached = None if local_checked else _local.get(key)
+        if cached is not None:
+            results[i] = list(cached)
+        else:
+            misses.setdefault(key, []).append(i)
+
+    pending: List[Tuple[str, str]] = []
+    for key, slots in misses.items():
+        vec = _redis_get(key)
+        if vec is not None:
+            _local.set(key, tuple(vec))
+            for i in slots:
+                results[i] = vec
+        else:
+            pending.append((key, texts[slots[0]]))
+
+    for start in range(0, len(pending), BATCH_SIZE):
+        chunk = pending[start:start + BATCH_SIZE]
+        try:
+            vectors: List[Union[List[float], Exception]] = _embed_chunk(
+                [text for _, text in chunk], task_type, title
+            )
+        except Exception as err:
+            print(f"batch embed of {len(chunk)} texts failed, retrying individually: {err}")
+            vectors = []
+            for key, text in chunk:
+                try:
+                    vectors.append(_embed_local_miss(key, text, task_type, title))
+                except Exception as item_err:
+                    vectors.append(item_err)
+        for (key, _), vec in zip(chunk, vectors):
+            if not isinstance(vec, Exception):
+                _cache_put(key, vec)
+            for i in misses[key]:
+                results[i] = vec
+    return results
+
+
+def _embed(text: str, task_type: str, title: Optional[str] = None) -> List[float]:
+    key = cache_key(task_type, text, title)
+    cached = _local.get(key)
+    if cached is not None:
+        return list(cached)
+    return _embed_local_miss(key, text, task_type, title)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for both tiers (in-process LRU, then Redis)."""
+    return {
+        "local": _local.stats(),
+        "redis": {"hits": _redis_hits, "misses": _redis_misses},
+    }
+
+
 def embed_document(text: str, title: Optional[str] = None) -> List[float]:
     """Embed a stored persona/memory description (write path)."""
-    _ensure_configured()
-    result = genai.embed_content(
-        model=_MODEL, content=text, task_type=_DOCUMENT, title=title
-    )
-    return result["embedding"]
+    return _embed(text, _DOCUMENT, title)
 
 
 def embed_query(text: str) -> List[float]:
     """Embed the current student query/context (read path)."""
-    _ensure_configured()
-    result = genai.embed_content(model=_MODEL, content=text, task_type=_QUERY)
-    return result["embedding"]
+    return _embed(text, _QUERY)
+
+
+def embed_documents_batch(
+    texts: Sequence[str], title: Optional[str] = None
+) -> List[Optional[List[float]]]:
+    """Embed many stored descriptions in as few round trips as possible.
+
+    Aligned with `texts`; an item that could not be embedded is None (and
+    logged) rather than failing the whole batch.
+    """
+    vectors: List[Optional[List[float]]] = []
+    for text, vec in zip(texts, _embed_many(texts, _DOCUMENT, title)):
+        if isinstance(vec, Exception):
+            print(f"embedding failed for {text[:60]!r}: {vec}")
+            vectors.append(None)
+        else:
+            vectors.append(vec)
+    return vectors
+
+
+async def embed_documents_batch_async(
+    texts: Sequence[str], title: Optional[str] = None
+) -> List[Optional[List[float]]]:
+    return await asyncio.to_thread(embed_documents_batch, texts, title)
+
+
+def _document_batch(items: List[Tuple[str, Optional[str]]]) -> List[Union[List[float], Exception]]:
+    """MicroBatcher hook: items may carry different titles, so group by title.
+    Submitters have already missed the in-process tier."""
+    results: List[Union[List[float], Exception, None]] = [None] * len(items)
+    by_title: Dict[Optional[str], List[int]] = {}
+    for i, (_, title) in enumerate(items):
+        by_title.setdefault(title, []).append(i)
+    for title, slots in by_title.items():
+        vectors = _embed_many([items[i][0] for i in slots], _DOCUMENT, title, local_checked=True)
+        for i, vec in zip(slots, vectors):
+            results[i] = vec
+    return results
+
+
+def _document_batcher() -> MicroBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = MicroBatcher(
+            _document_batch,
+            max_batch=BATCH_SIZE,
+            max_wait_ms=BATCH_WINDOW_MS,
+            max_concurrency=MAX_CONCURRENT_REQUESTS,
+        )
+        _batchers[loop] = batcher
+    return batcher
 
 
 async def embed_document_async(text: str, title: Optional[str] = None) -> List[float]:
-    return await asyncio.to_thread(embed_document, text, title)
+    cached = _local.get(cache_key(_DOCUMENT, text, title))
+    if cached is not None:
+        return list(cached)
+    return await _document_batcher().submit((text, title))
 
 
 async def embed_query_async(text: str) -> List[float]:
-    return await asyncio.to_thread(embed_query, text)
+    # Skip the thread hop entirely on an in-process hit (the common case).
+    key = cache_key(_QUERY, text)
+    cached = _local.get(key)
+    if cached is not None:
+        return list(cached)
+    return await asyncio.to_thread(_embed_local_miss, key, text, _QUERY, None)
@@ -0,0 +1,167 @@
+"""
+Non-blocking access to the Gemini SDK.
+
+`google.generativeai`'s `generate_content` / `ChatSession.send_message` are
+blocking HTTP calls; awaited straight from an `async def` they freeze the
+event loop (and every concurrent SSE tutor stream) for the whole round trip.
+Every Gemini call site goes through here instead:
+
+- blocking SDK calls run on one dedicated, bounded thread pool
+  (`GEMINI_EXECUTOR_THREADS`), not the loop's default executor, so LLM calls
+  can't starve other `to_thread` work;
+- a per-model asyncio semaphore (`GEMINI_MAX_CONCURRENCY`) caps in-flight
+  requests per model, so one busy path can't exhaust quota for the others;
+- each call has a timeout (`GEMINI_TIMEOUT_SECONDS`), passed to the SDK as
+  well so the worker thread is released too;
+- per-model latency percentiles and call/error/timeout counters (timeouts
+  count as errors too), via `stats()`.
+
+Sync callers that already run off the loop (the embedding batcher's worker
+threads) use `timed()` to feed the same metrics.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+EXECUTOR_THREADS = int(os.getenv("GEMINI_EXECUTOR_THREADS", "32"))
+_LATENCY_WINDOW = 512  # recent calls kept per model for percentiles
+
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_THREADS, thread_name_prefix="gemini")
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+_stats_lock = threading.Lock()
+
+
+class _ModelStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self.latencies)
+
+        def pct(q: float) -> Optional[float]:
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+        }
+
+
+_stats: Dict[str, _ModelStats] = {}
+
+
+def _model_stats(model: str) -> _ModelStats:
+    with _stats_lock:
+        if model not in _stats:
+            _stats[model] = _ModelStats()
+        return _stats[model]
+
+
+def _count_timeout(model: str) -> None:
+    stats = _model_stats(model)
+    with _stats_lock:
+        stats.timeouts += 1
+
+
+def _semaphore(model: str) -> asyncio.Semaphore:
+    # One per (event loop, model): a semaphore must not be shared across loops.
+    per_loop = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if model not in per_loop:
+        per_loop[model] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return per_loop[model]
+
+
+def model_name(model: Any) -> str:
+    return getattr(model, "model_name", None) or str(model)
+
+
+@contextmanager
+def timed(model: str):
+    """Record one call to `model` (latency, errors) around a block."""
+    stats = _model_stats(model)
+    with _stats_lock:
+        stats.in_flight += 1
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        with _stats_lock:
+            stats.errors += 1
+        raise
+    finally:
+        with _stats_lock:
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.latencies.append(time.perf_counter() - start)
+
+
+async def call(model: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """Run blocking `fn(*args, **kwargs)` on the Gemini pool, under `model`'s
+    concurrency limit and a timeout. Raises `asyncio.TimeoutError` on timeout."""
+    timeout = TIMEOUT_SECONDS if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    async with _semaphore(model):
+        try:
+            with timed(model):
+                return await asyncio.wait_for(
+                    loop.run_in_executor(_executor, partial(fn, *args, **kwargs)), timeout
+                )
+        except asyncio.TimeoutError:
+            _count_timeout(model)
+            raise
+
+
+async def call_async(model: str, make_call: Callable[[], Awaitable], timeout: Optional[float] = None) -> Any:
+    """Same limits and metrics for the SDK's own `*_async` methods."""
+    timeout = TIMEOUT_SECONDS if timeout is None else timeout
+    async with _semaphore(model):
+        try:
+            with timed(model):
+                return await asyncio.wait_for(make_call(), timeout)
+        except asyncio.TimeoutError:
+            _count_timeout(model)
+            raise
+
+
+async def generate_content(model: Any, contents: Any, timeout: Optional[float] = None, **kwargs) -> Any:
+    """`model.generate_content(contents)` without blocking the loop."""
+    timeout = TIMEOUT_SECONDS if timeout is None else timeout
+    kwargs.setdefault("request_options", {"timeout": timeout})
+    return await call(model_name(model), model.generate_content, contents, timeout=timeout, **kwargs)
+
+
+async def send_message(chat: Any, content: Any, timeout: Optional[float] = None, **kwargs) -> Any:
+    """`chat.send_message(content)` without blocking the loop. Calls on one
+    chat must not overlap (the session appends to its history)."""
+    timeout = TIMEOUT_SECONDS if timeout is None else timeout
+    kwargs.setdefault("request_options", {"timeout": timeout})
+    return await call(model_name(chat.model), chat.send_message, content, timeout=timeout, **kwargs)
+
+
+def stats() -> Dict[str, Dict]:
+    with _stats_lock:
+        return {model: s.snapshot() for model, s in _stats.items()}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
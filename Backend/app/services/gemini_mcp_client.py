@@ -2,11 +2,13 @@
 Gemini MCP Client
 Uses Gemini's function calling to make intelligent decisions using MCP tools.
 """
+import asyncio
 import os
 import google.generativeai as genai
 from typing import Dict, List, Any, Optional
 from dotenv import load_dotenv
 import json
+from . import gemini_client
 from .education_mcp_server import EducationMCPServer
 
 load_dotenv()
@@ -146,7 +148,7 @@ IMPORTANT: When you've selected the best question, respond with JSON in this exa
             chat = self.model.start_chat(enable_automatic_function_calling=True)
 
             # Send initial message
-            response = await chat.send_message_async(prompt)
+            response = await gemini_client.call_async(self.model.model_name, lambda: chat.send_message_async(prompt))
 
             # Track tools used for debugging
             tools_used = []
@@ -171,8 +173,11 @@ IMPORTANT: When you've selected the best question, respond with JSON in this exa
                             print(f"🔧 Gemini calling tool: {function_name}")
                             print(f"   Arguments: {json.dumps(function_args, indent=2)}")
 
-                            # Execute the tool
-                            tool_result = self.mcp_server.execute_tool(
+                            # Execute the tool. Tools run blocking DB reads (and the
+                            # first misconception lookup builds its whole index), so
+                            # keep them off the event loop.
+                            tool_result = await asyncio.to_thread(
+                                self.mcp_server.execute_tool,
                                 function_name,
                                 function_args
                             )
@@ -190,7 +195,9 @@ IMPORTANT: When you've selected the best question, respond with JSON in this exa
                             )
 
                             # Continue conversation with tool result
-                            response = await chat.send_message_async(function_response)
+                            response = await gemini_client.call_async(
+                                self.model.model_name, lambda: chat.send_message_async(function_response)
+                            )
                             iteration += 1
                             continue
 
@@ -235,12 +242,18 @@ IMPORTANT: When you've selected the best question, respond with JSON in this exa
         so selection never breaks if the knowledge model is unavailable."""
         try:
             from app.services import student_state_service as sss
+            from app.services import state_snapshot_service
             was_correct = context.get("correct", False)
-            query = (
-                "Recommend the next practice question for this student. Their last "
-                f"attempt was {'correct' if was_correct else 'incorrect'}."
-            )
-            state = await sss.build_state(self.mcp_server.db, user_id, query)
+            db = self.mcp_server.db
+            kc_ids = None
+            if context.get("last_question_id") is not None and context.get("practice_mode"):
+                kc_ids = await asyncio.to_thread(
+                    state_snapshot_service.question_kc_ids,
+                    db, context["last_question_id"], context["practice_mode"],
+                )
+            state = await state_snapshot_service.get_state(db, user_id, was_correct, kc_ids)
+            if state.get("source") == "live":
+                print(f"TASA state built live, timings (ms): {state.get('timings_ms')}")
             return sss.format_state_for_prompt(state)
         except Exception as e:
             print(f"TASA state block failed (non-fatal): {e}")
@@ -1,12 +1,15 @@
+import asyncio
 import os
 import google.generativeai as genai
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from dotenv import load_dotenv
 import base64
 from PIL import Image
 import io
 import json
 
+from app.services import gemini_client, image_preprocessing
+
 load_dotenv()
 
 class GeminiService:
@@ -46,14 +49,44 @@ class GeminiService:
                 })
         return formatted_history
     
-    async def generate_photo_grading(self, question_text: str, correct_solution: str, image_path: str) -> Dict:
+    @staticmethod
+    def _load_grading_image(image: Union[str, bytes], preprocess: bool):
+        '''The photo (a file path, or the upload's bytes) as a Gemini content
+        part: preprocessed JPEG bytes (see image_preprocessing), or the image
+        as given.'''
+        if isinstance(image, (bytes, bytearray)):
+            if not preprocess:
+                mime_type = Image.MIME.get(Image.open(io.BytesIO(image)).format, "image/jpeg")
+                return {"mime_type": mime_type, "data": bytes(image)}
+            data = bytes(image)
+        else:
+            if not preprocess:
+                return Image.open(image)
+            with open(image, "rb") as f:
+                data = f.read()
+        processed = image_preprocessing.preprocess_or_original(data)
+        print(f"Grading image preprocessed: {processed.summary()}")
+        return {"mime_type": processed.mime_type, "data": processed.data}
+
+    async def generate_photo_grading(
+        self,
+        question_text: str,
+        correct_solution: str,
+        image: Union[str, bytes],
+        raise_errors: bool = False,
+        preprocess: bool = True,
+    ) -> Dict:
         '''
         Grades a photo of a student's work against the correct solution.
         Returns a dictionary with grade, feedback, corrections, and strengths.
+        With raise_errors, failures raise instead of returning a placeholder
+        0/10 result (the grading queue retries them). preprocess=False sends
+        the photo as given: the eval baseline, or an image the upload handler
+        has already preprocessed.
         '''
         try:
-            # Load the image from file path
-            pil_image = Image.open(image_path)
+            # Decoding and shrinking a phone photo is CPU work: keep it off the loop.
+            image_part = await asyncio.to_thread(self._load_grading_image, image, preprocess)
             
             # Create a structured prompt that will get us the desired output
             prompt = f"""
@@ -90,7 +123,7 @@ Respond with ONLY the JSON, no additional text.
 """
             
             # Send to Gemini with the image
-            response = self.photo_grading_model.generate_content([prompt, pil_image])
+            response = await gemini_client.generate_content(self.photo_grading_model, [prompt, image_part])
             
             # Parse the JSON response
             response_text = response.text.strip()
@@ -120,6 +153,8 @@ Respond with ONLY the JSON, no additional text.
         except json.JSONDecodeError as e:
             print(f"Error parsing Gemini response as JSON: {e}")
             print(f"Raw response: {response_text if 'response_text' in locals() else 'No response'}")
+            if raise_errors:
+                raise
             # Return a default grading result
             return {
                 "grade": "0/10",
@@ -131,6 +166,8 @@ Respond with ONLY the JSON, no additional text.
             print(f"Error in generate_photo_grading: {e}")
             import traceback
             traceback.print_exc()
+            if raise_errors:
+                raise
             return {
                 "grade": "0/10",
                 "feedback": f"Error grading the work: {str(e)}",
@@ -205,10 +242,10 @@ Respond with ONLY the JSON, no additional text.
                 formatted_history = self.format_chat_history(chat_history[-10:])
                 print(f"💬 Using chat history with {len(formatted_history)} messages")
                 chat = self.model.start_chat(history=formatted_history)
-                response = chat.send_message(content_parts)
+                response = await gemini_client.send_message(chat, content_parts)
             else:
                 print(f"💬 No chat history, generating fresh response")
-                response = self.model.generate_content(content_parts)
+                response = await gemini_client.generate_content(self.model, content_parts)
             
             print(f"RESPONSE: {response.text}")
             return response.text
@@ -221,7 +258,7 @@ Respond with ONLY the JSON, no additional text.
             traceback.print_exc()
             return "I'm sorry, I encountered an error while processing your request. Please try again."
     
-    def generate_quiz(self, entire_transcript: str, previous_messages: List[Dict]) -> str:
+    async def generate_quiz(self, entire_transcript: str, previous_messages: List[Dict]) -> str:
         """Generate a multiple choice quiz for a YouTube video."""
         try:
             # Build chat context
@@ -297,7 +334,7 @@ RULES:
 - Return ONLY the JSON, nothing else
 """
             
-            response = self.video_quiz_model.generate_content(quiz_prompt)
+            response = await gemini_client.generate_content(self.video_quiz_model, quiz_prompt)
             return response.text.strip()
             
         except Exception as e:
@@ -359,7 +396,7 @@ Remember: You're a tutor helping them learn, not just giving answers.
                 prompt += f" in {subject}."
             
             print(f"Sending question chat prompt to Gemini")
-            response = self.question_chat_model.generate_content(prompt)
+            response = await gemini_client.generate_content(self.question_chat_model, prompt)
             
             return response.text.strip()
             
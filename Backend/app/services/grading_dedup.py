@@ -0,0 +1,170 @@
+"""
+Grading-result cache keyed by a perceptual hash of the photo.
+
+Students on flaky mobile connections resubmit the same photo, and each
+resubmission used to cost a full Gemini grading call. Before grading, the
+worker computes a difference hash (dHash) of the preprocessed image, taken on
+a `HASH_SIZE`x`HASH_SIZE` grayscale grid, and looks for a result graded in the
+last `GRADING_DEDUP_TTL_SECONDS` for the same student and question (`user_id`,
+`question_id` and a hash of `correct_solution`) whose hash is within
+`GRADING_DEDUP_MAX_DISTANCE` of its 2048 bits. Results are never shared
+between students: blank or faint pages all hash close to zero, so another
+student's near-match says nothing about their work.
+
+An identical resubmission hashes identically; a copy the phone re-encoded
+lands a few bits away. A whole-page hash can't see a one-digit correction,
+though, so the distance is kept tight and the TTL short: a corrected photo
+retaken within the window may be served the earlier grade. Set
+`GRADING_DEDUP_MAX_DISTANCE=0` to match identical hashes only, or
+`GRADING_DEDUP=0` to turn the cache off.
+
+Results live in Redis (`grading:dedup:`, one capped list per student and
+question) when
+available, with a process-local `TTLCache` as fallback. `stats()` reports the
+hit rate.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
+
+DEDUP_ENABLED = os.getenv("GRADING_DEDUP", "1") != "0"
+TTL_SECONDS = int(os.getenv("GRADING_DEDUP_TTL_SECONDS", "900"))
+MAX_DISTANCE = int(os.getenv("GRADING_DEDUP_MAX_DISTANCE", "8"))
+HASH_SIZE = 32  # a 32x32 grid, fine enough to see edited lines
+_GRADIENT_MARGIN = 4
+_BUCKET_ENTRIES = 32
+_REDIS_PREFIX = "grading:dedup:"
+
+# bucket -> [(hash, result, stored_at)]
+_local = TTLCache(maxsize=2048, ttl=TTL_SECONDS)
+_local_lock = threading.Lock()
+_counts_lock = threading.Lock()
+_counts = {"hits": 0, "misses": 0, "stored": 0, "unhashable": 0}
+
+
+def dhash(image: Image.Image, size: int = HASH_SIZE, margin: int = _GRADIENT_MARGIN) -> int:
+    """Difference hash with a dead zone: two bits per horizontally adjacent
+    pair of cells, set when the left one is clearly brighter or clearly
+    darker. Plain dHash compares every pair, so blank paper (neighbours a
+    level or two apart) flips bits on every re-encode."""
+    gray = np.asarray(image.convert("L").resize((size + 1, size), Image.BOX), dtype=np.int16)
+    diff = gray[:, :-1] - gray[:, 1:]
+    bits = np.concatenate([(diff > margin).ravel(), (diff < -margin).ravel()])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def image_hash(data: bytes) -> Optional[int]:
+    """dHash of encoded image bytes, or None if they don't decode."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # a JPEG decodes at 1/8 scale
+        return dhash(image)
+    except Exception as err:
+        print(f"Grading dedup: could not hash image: {err}")
+        with _counts_lock:
+            _counts["unhashable"] += 1
+        return None
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def bucket_key(user_id: int, question_id: Optional[int], correct_solution: Optional[str]) -> str:
+    solution = hashlib.sha256((correct_solution or "").encode("utf-8")).hexdigest()[:16]
+    return f"{user_id}:{question_id}:{solution}"
+
+
+def _entries(bucket: str) -> List[Tuple[int, Dict, float]]:
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.lrange(f"{_REDIS_PREFIX}{bucket}", 0, -1)
+            entries = []
+            for blob in raw:
+                entry = json.loads(blob)
+                entries.append((int(entry["h"], 16), entry["r"], entry["t"]))
+            return entries
+        except Exception as err:
+            redis_failed(err)
+    return _local.get(bucket) or []
+
+
+def lookup(
+    user_id: int, question_id: Optional[int], correct_solution: Optional[str], fingerprint: Optional[int]
+) -> Optional[Dict]:
+    """The closest unexpired result this student got on this question within
+    `MAX_DISTANCE` bits of `fingerprint`, or None."""
+    if not DEDUP_ENABLED or fingerprint is None:
+        return None
+    cutoff = time.time() - TTL_SECONDS
+    best: Optional[Tuple[int, Dict]] = None
+    for stored, result, stored_at in _entries(bucket_key(user_id, question_id, correct_solution)):
+        if stored_at < cutoff:
+            continue
+        d = distance(stored, fingerprint)
+        if d <= MAX_DISTANCE and (best is None or d < best[0]):
+            best = (d, result)
+    with _counts_lock:
+        _counts["hits" if best is not None else "misses"] += 1
+    if best is None:
+        return None
+    print(f"Grading dedup hit for question {question_id} ({best[0]} bits apart)")
+    return dict(best[1])
+
+
+def store(
+    user_id: int,
+    question_id: Optional[int],
+    correct_solution: Optional[str],
+    fingerprint: Optional[int],
+    result: Dict,
+) -> None:
+    if not DEDUP_ENABLED or fingerprint is None:
+        return
+    bucket = bucket_key(user_id, question_id, correct_solution)
+    now = time.time()
+    with _counts_lock:
+        _counts["stored"] += 1
+    client = get_redis()
+    if client is not None:
+        try:
+            key = f"{_REDIS_PREFIX}{bucket}"
+            pipe = client.pipeline()
+            pipe.lpush(key, json.dumps({"h": format(fingerprint, "x"), "r": result, "t": now}))
+            pipe.ltrim(key, 0, _BUCKET_ENTRIES - 1)
+            pipe.expire(key, TTL_SECONDS)
+            pipe.execute()
+            return
+        except Exception as err:
+            redis_failed(err)
+    with _local_lock:
+        cutoff = now - TTL_SECONDS
+        entries = [e for e in _local.get(bucket) or [] if e[2] >= cutoff]
+        _local.set(bucket, [(fingerprint, result, now), *entries][:_BUCKET_ENTRIES])
+
+
+def stats() -> Dict:
+    """Lookup counters; `hit_rate` is the share of lookups served from cache
+    (each one a Gemini grading call saved)."""
+    with _counts_lock:
+        counts = dict(_counts)
+    lookups = counts["hits"] + counts["misses"]
+    counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else None
+    return counts
+
+
+def clear() -> None:
+    _local.clear()
+    with _counts_lock:
+        for name in _counts:
+            _counts[name] = 0
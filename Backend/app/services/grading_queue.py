@@ -0,0 +1,406 @@
+"""
+Asynchronous grading jobs for photo submissions.
+
+`/api/submit-grading-image` used to hold the phone's upload open for the whole
+pipeline: Gemini photo grading, then the mastery/profile update, memory event,
+persona refresh and state snapshot. Now it preprocesses the image in memory,
+enqueues a job carrying the bytes and returns; a bounded pool of asyncio
+workers (`GRADING_WORKERS`) runs the pipeline, so upload latency no longer
+depends on the LLM and throughput scales with the worker count.
+
+A job is identified by its grading session's public `session_id` (a session
+takes one submission), and `GradingSession.status` is its progress:
+`image_uploaded` (queued) -> `grading` -> `completed`, or `failed` once its
+retries are spent. Only the Gemini call is retried, with exponential backoff;
+the write-side steps after it are best-effort, as they always were. A photo
+that near-duplicates one the same student had graded recently for the same
+question reuses that grade instead of calling Gemini (`grading_dedup`). Jobs
+that exhaust their retries go to an in-memory dead-letter list (`stats()`
+exposes it).
+
+Nothing touches disk. The job holds the (preprocessed, ~100KB) image, and a
+copy is stashed in Redis (`grading:img:`) for `RECOVER_WINDOW`, so jobs still
+queued when the web process stops are not lost: their sessions stay
+`image_uploaded` and `recover()` re-enqueues them, with the stashed image, on
+the next startup. Without Redis such a session can't be regraded and is
+marked failed. Workers claim a session with a conditional UPDATE, so a job
+enqueued by two processes is graded once.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.database.models import GradingSession
+from app.services import grading_dedup
+from app.services.ttl_cache import get_redis, redis_failed
+
+WORKERS = int(os.getenv("GRADING_WORKERS", "4"))
+QUEUE_SIZE = int(os.getenv("GRADING_QUEUE_SIZE", "200"))
+MAX_RETRIES = int(os.getenv("GRADING_MAX_RETRIES", "2"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("GRADING_RETRY_BACKOFF_SECONDS", "2"))
+DEAD_LETTER_SIZE = 500
+RECOVER_WINDOW = timedelta(hours=1)
+STALE_GRADING = timedelta(minutes=10)
+
+_IMAGE_PREFIX = "grading:img:"
+
+QUEUED, GRADING, COMPLETED, FAILED = "image_uploaded", "grading", "completed", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class GradingJob:
+    job_id: str  # the grading session's `session_id`
+    image: Optional[bytes] = field(default=None, repr=False)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    last_error: Optional[str] = None
+
+
+Handler = Callable[[GradingJob], Awaitable[None]]
+OnDead = Callable[[GradingJob], Awaitable[None]]
+
+
+class GradingQueue:
+    """Bounded job queue drained by `workers` asyncio tasks. `handler` runs a
+    job and raises to have it retried; `on_dead` runs once a job is given up."""
+
+    def __init__(
+        self,
+        handler: Handler,
+        on_dead: Optional[OnDead] = None,
+        workers: int = WORKERS,
+        maxsize: int = QUEUE_SIZE,
+        max_retries: int = MAX_RETRIES,
+        backoff_seconds: float = RETRY_BACKOFF_SECONDS,
+    ) -> None:
+        self.handler = handler
+        self.on_dead = on_dead
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.dead_letters: Deque[GradingJob] = deque(maxlen=DEAD_LETTER_SIZE)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: set = set()
+        self._running = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # Created on first use so it binds to the serving event loop.
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        return self._queue
+
+    def enqueue(self, job_id: str, image: Optional[bytes] = None) -> GradingJob:
+        job = GradingJob(job_id=job_id, image=image)
+        try:
+            self._ensure_started().put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"grading queue is full ({self.maxsize} jobs)")
+        return job
+
+    async def _worker(self) -> None:
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            self._running += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+                queue.task_done()
+
+    async def _run(self, job: GradingJob) -> None:
+        try:
+            await self.handler(job)
+            self.completed += 1
+            return
+        except Exception as err:
+            job.attempts += 1
+            job.last_error = str(err)
+            print(f"Grading job {job.job_id} failed (attempt {job.attempts}): {err}")
+
+        if job.attempts <= self.max_retries:
+            self.retried += 1
+            # Backoff sleeps outside the worker, so one slow retry doesn't
+            # hold a worker slot.
+            task = asyncio.ensure_future(self._retry_later(job, self.backoff_seconds * 2 ** (job.attempts - 1)))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+
+        self.failed += 1
+        self.dead_letters.append(job)
+        if self.on_dead is not None:
+            try:
+                await self.on_dead(job)
+            except Exception as err:
+                print(f"Grading job {job.job_id} dead-letter handling failed: {err}")
+
+    async def _retry_later(self, job: GradingJob, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._queue.put(job)
+
+    async def join(self) -> None:
+        """Wait until every queued job, including pending retries, is done."""
+        if self._queue is None:
+            return
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*list(self._retries))
+
+    async def stop(self) -> None:
+        tasks = [*self._tasks, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "retry_pending": len(self._retries),
+            "workers": self.workers,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dead_letters": [
+                {"job_id": j.job_id, "attempts": j.attempts, "error": j.last_error} for j in self.dead_letters
+            ],
+            "dedup": grading_dedup.stats(),
+        }
+
+
+# ---- the grading pipeline ----
+
+
+def stash_image(job_id: str, image: bytes) -> None:
+    """Keep a copy of a queued job's image in Redis for `recover()`."""
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(f"{_IMAGE_PREFIX}{job_id}", int(RECOVER_WINDOW.total_seconds()), image)
+        except Exception as err:
+            redis_failed(err)
+
+
+def _stashed_image(job_id: str) -> Optional[bytes]:
+    client = get_redis()
+    if client is not None:
+        try:
+            return client.get(f"{_IMAGE_PREFIX}{job_id}")
+        except Exception as err:
+            redis_failed(err)
+    return None
+
+
+def drop_image(job_id: str) -> None:
+    """Discard a job's stashed image (graded, failed, or never queued)."""
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(f"{_IMAGE_PREFIX}{job_id}")
+        except Exception as err:
+            redis_failed(err)
+
+
+async def _after_grading(db: Session, session: GradingSession, grading_result: Dict) -> None:
+    """The write side of a graded attempt. Each step is best-effort: a failure
+    here never fails (or retries) the grading."""
+    from app.services import memory_service, persona_service, state_snapshot_service
+    from app.services.knowledge_profile_service import KnowledgeProfileService
+    from app.services.mastery_service import score_to_correct
+
+    user_id = session.user_id
+    try:
+        state_snapshot_service.invalidate(user_id)
+        updated_profile = KnowledgeProfileService.update_profile_after_grading(
+            db=db,
+            user_id=user_id,
+            question_id=session.question_id,
+            practice_mode=session.practice_mode,
+            grading_result=grading_result,
+            grading_session_id=session.id,
+        )
+        if updated_profile:
+            print(f"Successfully updated knowledge profile for user {user_id}")
+        else:
+            print(f"Failed to update knowledge profile for user {user_id}")
+    except Exception as profile_error:
+        db.rollback()
+        print(f"Error updating knowledge profile: {profile_error}")
+
+    # TASA L3/L2: record the mistake as an event-memory episode and refresh
+    # the persona bank on its cadence.
+    try:
+        await memory_service.generate_event(
+            db=db,
+            user_id=user_id,
+            question_id=session.question_id,
+            question_text=session.question_text,
+            practice_mode=session.practice_mode,
+            grading_result=grading_result,
+            source_grading_id=session.id,
+        )
+        await persona_service.maybe_regenerate(db, user_id)
+    except Exception as memory_error:
+        print(f"TASA memory/persona update failed (non-fatal): {memory_error}")
+
+    # Materialize the next-question state block now, so the next selection
+    # request is a lookup instead of an embedding + LLM rewrite.
+    try:
+        kc_ids = await asyncio.to_thread(
+            state_snapshot_service.question_kc_ids, db, session.question_id, session.practice_mode
+        )
+        await state_snapshot_service.materialize(db, user_id, bool(score_to_correct(grading_result)), kc_ids)
+    except Exception as snapshot_error:
+        print(f"TASA state snapshot failed (non-fatal): {snapshot_error}")
+
+
+Grader = Callable[[str, str, bytes], Awaitable[Dict]]
+
+
+async def process_job(
+    job: GradingJob,
+    session_factory: Callable[[], Session],
+    grader: Grader,
+    after_grading=_after_grading,
+) -> None:
+    """Grade one submission. Raises (leaving the session queued) if the
+    grader fails, so the queue retries it. A job without its image (recovered
+    after its stash expired) fails straight away, and a near-duplicate of a
+    photo the same student recently had graded for the question reuses that
+    grade (see
+    grading_dedup) instead of calling the grader.
+
+    The session is claimed with a conditional UPDATE, so a job enqueued twice
+    (e.g. recovered by two processes) is graded once."""
+    db = session_factory()
+    try:
+        claimed = (
+            db.query(GradingSession)
+            .filter(GradingSession.session_id == job.job_id, GradingSession.status == QUEUED)
+            .update({GradingSession.status: GRADING}, synchronize_session=False)
+        )
+        db.commit()
+        if not claimed:
+            return  # already graded, being graded elsewhere, or gone
+        session = db.query(GradingSession).filter(GradingSession.session_id == job.job_id).one()
+
+        image = job.image if job.image is not None else _stashed_image(job.job_id)
+        if image is None:
+            session.status = FAILED
+            session.grading_result = {"error": "image no longer available", "attempts": job.attempts}
+            db.commit()
+            return
+        fingerprint = await asyncio.to_thread(grading_dedup.image_hash, image)
+        grading_result = grading_dedup.lookup(
+            session.user_id, session.question_id, session.correct_solution, fingerprint
+        )
+        if grading_result is None:
+            try:
+                grading_result = await grader(session.question_text, session.correct_solution, image)
+            except Exception:
+                session.status = QUEUED
+                db.commit()
+                raise
+            grading_dedup.store(
+                session.user_id, session.question_id, session.correct_solution, fingerprint, grading_result
+            )
+
+        session.grading_result = grading_result
+        session.status = COMPLETED
+        db.commit()
+
+        job.image = None
+        drop_image(job.job_id)
+        await after_grading(db, session, grading_result)
+    finally:
+        db.close()
+
+
+async def mark_failed(job: GradingJob, session_factory: Callable[[], Session]) -> None:
+    db = session_factory()
+    try:
+        session = db.query(GradingSession).filter(GradingSession.session_id == job.job_id).first()
+        if session is None:
+            return
+        session.status = FAILED
+        session.grading_result = {"error": job.last_error, "attempts": job.attempts}
+        db.commit()
+    finally:
+        job.image = None
+        drop_image(job.job_id)
+        db.close()
+
+
+def recover(db: Session, queue: "GradingQueue", now: Optional[datetime] = None) -> int:
+    """Re-enqueue recent submissions a previous process accepted but never
+    finished grading; ones left mid-grading for over `STALE_GRADING` are
+    released first. Their images are fetched from the stash when a worker
+    picks them up. Returns how many were enqueued."""
+    now = now or datetime.utcnow()
+    recent = GradingSession.image_uploaded_at > now - RECOVER_WINDOW
+    db.query(GradingSession).filter(
+        GradingSession.status == GRADING, recent, GradingSession.image_uploaded_at < now - STALE_GRADING
+    ).update({GradingSession.status: QUEUED}, synchronize_session=False)
+    db.commit()
+
+    pending = (
+        db.query(GradingSession.session_id)
+        .filter(GradingSession.status == QUEUED, recent)
+        .order_by(GradingSession.image_uploaded_at)
+        .all()
+    )
+    n = 0
+    for (session_id,) in pending:
+        try:
+            queue.enqueue(session_id)
+            n += 1
+        except QueueFull:
+            break
+    return n
+
+
+_queue: Optional[GradingQueue] = None
+
+
+def get_queue() -> GradingQueue:
+    """The process-wide queue, grading through the shared Gemini service."""
+    global _queue
+    if _queue is None:
+        from app.database.database import SessionLocal
+        from app.service_instances import convo_service
+
+        async def handler(job: GradingJob) -> None:
+            await process_job(
+                job,
+                SessionLocal,
+                # The upload handler already preprocessed the image.
+                lambda question, solution, image: convo_service.gemini_service.generate_photo_grading(
+                    question, solution, image, raise_errors=True, preprocess=False
+                ),
+            )
+
+        async def on_dead(job: GradingJob) -> None:
+            await mark_failed(job, SessionLocal)
+
+        _queue = GradingQueue(handler, on_dead)
+    return _queue
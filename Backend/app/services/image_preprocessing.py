@@ -0,0 +1,204 @@
+"""
+In-memory preprocessing of photographed work before Gemini photo grading.
+
+Phone photos arrive as multi-megabyte, full-resolution JPEGs, often rotated
+via EXIF and with desk around the page. Grading only needs the handwriting, so
+before the model call the upload bytes are:
+
+1. rotated upright from their EXIF orientation;
+2. cropped to the paper — the bright region that dominates the frame, found on
+   a small grayscale thumbnail (skipped when no clear page stands out);
+3. downscaled so the longer edge is at most `GRADING_IMAGE_MAX_EDGE`;
+4. converted to grayscale;
+5. re-encoded as JPEG at `GRADING_IMAGE_JPEG_QUALITY`.
+
+Everything happens on bytes in memory. The result reports what it saved, and
+the process keeps running totals (`stats()`). `scripts/eval_image_preprocessing.py`
+grades a labelled set both ways, side by side, to check the smaller images
+don't cost grading accuracy.
+"""
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+MAX_EDGE = int(os.getenv("GRADING_IMAGE_MAX_EDGE", "1600"))
+JPEG_QUALITY = int(os.getenv("GRADING_IMAGE_JPEG_QUALITY", "80"))
+GRAYSCALE = os.getenv("GRADING_IMAGE_GRAYSCALE", "1") != "0"
+CROP = os.getenv("GRADING_IMAGE_CROP", "1") != "0"
+
+# Paper detection: the page must cover at least this share of the frame, and
+# cropping must remove at least this much, or the crop is skipped.
+_DETECT_EDGE = 256
+_MIN_PAGE_FRACTION = 0.25
+_MIN_CROP_GAIN = 0.05
+_CROP_MARGIN = 0.02
+_EXIF_ORIENTATION = 0x0112
+
+_totals_lock = threading.Lock()
+_totals = {"images": 0, "bytes_in": 0, "bytes_out": 0, "failed": 0}
+
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    elapsed_ms: float
+    steps: List[str] = field(default_factory=list)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    def summary(self) -> str:
+        saved = self.bytes_saved / self.original_bytes * 100 if self.original_bytes else 0.0
+        return (
+            f"{self.original_bytes / 1024:.0f}KB -> {len(self.data) / 1024:.0f}KB ({saved:.0f}% saved), "
+            f"{self.width}x{self.height}, {'+'.join(self.steps) or 'unchanged'} in {self.elapsed_ms:.0f}ms"
+        )
+
+
+def _otsu(gray: np.ndarray) -> float:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = total - w0
+    mu0 = np.cumsum(hist * levels)
+    mean = mu0[-1] / total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean * w0 - mu0) ** 2 / (w0 * w1)
+    return float(np.nanargmax(between))
+
+
+def find_paper(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (left, upper, right, lower) of the page in `image`, or
+    None when no bright page clearly stands out from the background."""
+    thumb = image.convert("L")
+    thumb.thumbnail((_DETECT_EDGE, _DETECT_EDGE))
+    gray = np.asarray(thumb)
+    bright = gray > _otsu(gray)
+    # Rows/columns that are mostly page; a few bright desk pixels don't count.
+    rows = np.flatnonzero(bright.mean(axis=1) > 0.5)
+    cols = np.flatnonzero(bright.mean(axis=0) > 0.5)
+    if rows.size == 0 or cols.size == 0:
+        return None
+    h, w = gray.shape
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    area = (bottom - top) * (right - left) / float(h * w)
+    if area < _MIN_PAGE_FRACTION or area > 1 - _MIN_CROP_GAIN:
+        return None
+
+    sx, sy = image.width / w, image.height / h
+    mx, my = int(image.width * _CROP_MARGIN), int(image.height * _CROP_MARGIN)
+    return (
+        max(0, int(left * sx) - mx),
+        max(0, int(top * sy) - my),
+        min(image.width, int(right * sx) + mx),
+        min(image.height, int(bottom * sy) + my),
+    )
+
+
+def preprocess(
+    data: bytes,
+    max_edge: Optional[int] = None,
+    quality: Optional[int] = None,
+    grayscale: Optional[bool] = None,
+    crop: Optional[bool] = None,
+) -> PreprocessedImage:
+    """Shrink an uploaded photo for grading. Defaults come from the
+    `GRADING_IMAGE_*` settings. Raises if `data` isn't a decodable image."""
+    max_edge = MAX_EDGE if max_edge is None else max_edge
+    quality = JPEG_QUALITY if quality is None else quality
+    grayscale = GRAYSCALE if grayscale is None else grayscale
+    crop = CROP if crop is None else crop
+
+    start = time.perf_counter()
+    steps: List[str] = []
+    image = Image.open(io.BytesIO(data))
+    # JPEG draft mode decodes at a reduced scale straight from the DCT (and,
+    # for grayscale, only the luma channel), which is far cheaper than
+    # decoding 12MP of color and then resizing. With cropping on, the draft
+    # is sized for the smallest page `find_paper` accepts, so the cropped
+    # page still reaches `max_edge`.
+    if image.format == "JPEG" and max_edge:
+        full = image.size
+        target = int(max_edge / _MIN_PAGE_FRACTION ** 0.5) if crop else max_edge
+        image.draft("L" if grayscale else "RGB", (target, target))
+        if image.size != full:
+            steps.append("resize")
+
+    if image.getexif().get(_EXIF_ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+        steps.append("orient")
+
+    if crop:
+        box = find_paper(image)
+        if box is not None:
+            image = image.crop(box)
+            steps.append("crop")
+
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if "resize" not in steps:
+            steps.append("resize")
+
+    if grayscale:
+        if image.mode != "L":
+            image = image.convert("L")
+        steps.append("gray")
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    result = PreprocessedImage(
+        data=out.getvalue(),
+        mime_type="image/jpeg",
+        width=image.width,
+        height=image.height,
+        original_bytes=len(data),
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+        steps=steps,
+    )
+    with _totals_lock:
+        _totals["images"] += 1
+        _totals["bytes_in"] += result.original_bytes
+        _totals["bytes_out"] += len(result.data)
+    return result
+
+
+def _sniff_mime(data: bytes) -> str:
+    try:
+        return Image.MIME.get(Image.open(io.BytesIO(data)).format, "application/octet-stream")
+    except Exception:
+        return "application/octet-stream"
+
+
+def preprocess_or_original(data: bytes, **kwargs) -> PreprocessedImage:
+    """`preprocess`, falling back to the untouched bytes if it fails, so a
+    preprocessing bug never blocks grading."""
+    try:
+        return preprocess(data, **kwargs)
+    except Exception as err:
+        print(f"Image preprocessing failed, grading the original: {err}")
+        with _totals_lock:
+            _totals["failed"] += 1
+        return PreprocessedImage(
+            data=data, mime_type=_sniff_mime(data), width=0, height=0, original_bytes=len(data), elapsed_ms=0.0
+        )
+
+
+def stats() -> Dict:
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["bytes_saved"] = totals["bytes_in"] - totals["bytes_out"]
+    return totals
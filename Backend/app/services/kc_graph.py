@@ -0,0 +1,208 @@
+"""
+Precomputed prerequisite graph over the KC registry.
+
+The taxonomy's prerequisite edges are closed once per registry build: every KC
+gets a topological position, bitsets (Python ints, bit i = the KC at position
+i) of all its transitive prerequisites and dependents, and a hop-distance
+matrix (read along rows for prerequisites, columns for dependents). The
+registry is immutable and swapped on taxonomy/DB change, so the graph is
+rebuilt exactly when it is — `get_graph` compares identities.
+
+Two consumers:
+- `record_attempt` spreads discounted evidence from an attempt to the KCs
+  around it (`spread` picks the targets and weights for all of the attempt's
+  KCs at once; `propagate_batch` is the evidence step over the locked rows).
+- Question selection asks for "weak prerequisites of X": one AND of two
+  bitsets once the student's weak set is a mask (`weak_prerequisites`,
+  behind the `identify_skill_gaps` MCP tool).
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.services.kc_registry import KCRegistry, get_registry
+
+# Evidence carried across one prerequisite edge, by direction and outcome;
+# n hops away it is base ** n. A correct answer says most about the
+# prerequisites it relied on, a wrong one most about what builds on it.
+PROPAGATION_WEIGHTS: Mapping[Tuple[str, bool], float] = {
+    ("prerequisite", True): 0.5,
+    ("prerequisite", False): 0.2,
+    ("dependent", True): 0.1,
+    ("dependent", False): 0.5,
+}
+MAX_HOPS = int(os.getenv("KC_PROPAGATION_MAX_HOPS", "2"))
+PROPAGATION_ENABLED = os.getenv("KC_PROPAGATION", "1") != "0"
+
+_UNREACHABLE = 1 << 20
+
+
+@dataclass(frozen=True)
+class KCGraph:
+    slugs: Tuple[str, ...]           # topological order: prerequisites first
+    index: Mapping[str, int]         # slug -> position
+    ids: np.ndarray                  # position -> kc_id (-1 when not in the DB)
+    index_of_id: Mapping[int, int]   # kc_id -> position
+    ancestors: Tuple[int, ...]       # position -> bitset of transitive prerequisites
+    descendants: Tuple[int, ...]     # position -> bitset of transitive dependents
+    up_hops: np.ndarray              # [i, j] = edges from i down to prerequisite j
+    cyclic: Tuple[str, ...]          # slugs left out of the order by a cycle
+
+    def mask(self, slugs: Iterable[str]) -> int:
+        bits = 0
+        for slug in slugs:
+            i = self.index.get(slug)
+            if i is not None:
+                bits |= 1 << i
+        return bits
+
+    def slugs_in(self, bits: int) -> List[str]:
+        """Slugs of a bitset, in topological order."""
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(self.slugs[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+    def prerequisites_of(self, slug: str) -> List[str]:
+        i = self.index.get(slug)
+        return [] if i is None else self.slugs_in(self.ancestors[i])
+
+    def dependents_of(self, slug: str) -> List[str]:
+        i = self.index.get(slug)
+        return [] if i is None else self.slugs_in(self.descendants[i])
+
+    def weak_prerequisites(self, slug: str, weak_mask: int) -> List[str]:
+        i = self.index.get(slug)
+        return [] if i is None else self.slugs_in(self.ancestors[i] & weak_mask)
+
+    def spread(self, kc_ids: Sequence[int], correct: bool) -> Dict[int, float]:
+        """kc_id -> evidence weight for the KCs within `MAX_HOPS` of any of
+        `kc_ids`, excluding those KCs themselves. Each target takes its nearest
+        source; a KC that is both a prerequisite and a dependent (through
+        different sources) keeps the larger weight."""
+        sources = [self.index_of_id[k] for k in kc_ids if k in self.index_of_id]
+        if not sources or MAX_HOPS <= 0:
+            return {}
+        up = self.up_hops[sources].min(axis=0)       # hops down to each prerequisite
+        down = self.up_hops[:, sources].min(axis=1)  # hops up to each dependent
+        weights = np.zeros(len(self.slugs))
+        for hops, direction in ((up, "prerequisite"), (down, "dependent")):
+            reach = (hops > 0) & (hops <= MAX_HOPS)
+            base = PROPAGATION_WEIGHTS[(direction, correct)]
+            weights = np.maximum(weights, np.where(reach, base ** hops.astype(np.float64), 0.0))
+        weights[sources] = 0.0
+        targets = np.nonzero((weights > 0) & (self.ids >= 0))[0]
+        return {int(self.ids[t]): float(weights[t]) for t in targets}
+
+
+def propagate_batch(p_L: np.ndarray, correct: bool, weights: np.ndarray, params: np.ndarray) -> np.ndarray:
+    """Indirect evidence over arrays of states: the BKT posterior for the
+    observation (no learning step — the KC wasn't practiced), blended in by
+    `weights`. `params` is an `(n, 4)` [p_L0, p_T, p_S, p_G] matrix."""
+    p_S, p_G = params[:, 2], params[:, 3]
+    if correct:
+        num = p_L * (1 - p_S)
+        denom = num + (1 - p_L) * p_G
+    else:
+        num = p_L * p_S
+        denom = num + (1 - p_L) * (1 - p_G)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        posterior = np.where(denom > 0, num / np.where(denom > 0, denom, 1.0), p_L)
+    return p_L + weights * (posterior - p_L)
+
+
+def _topological(slugs: Sequence[str], prereqs: Mapping[str, Tuple[str, ...]]) -> Tuple[List[str], List[str]]:
+    indegree = {s: sum(1 for p in prereqs[s] if p in prereqs) for s in slugs}
+    dependents: Dict[str, List[str]] = {}
+    for s in slugs:
+        for p in prereqs[s]:
+            if p in prereqs:
+                dependents.setdefault(p, []).append(s)
+    ready = [s for s in slugs if indegree[s] == 0]
+    order: List[str] = []
+    while ready:
+        s = ready.pop(0)
+        order.append(s)
+        for d in dependents.get(s, ()):
+            indegree[d] -= 1
+            if indegree[d] == 0:
+                ready.append(d)
+    placed = set(order)
+    return order, [s for s in slugs if s not in placed]
+
+
+def build(registry: KCRegistry) -> KCGraph:
+    prereqs = {kc.slug: kc.prerequisites for kc in registry.kcs}
+    order, cyclic = _topological([kc.slug for kc in registry.kcs], prereqs)
+    if cyclic:
+        print(f"kc_graph: prerequisite cycle among {cyclic}; their edges are ignored")
+    slugs = tuple(order + cyclic)
+    index = {s: i for i, s in enumerate(slugs)}
+    n = len(slugs)
+
+    # Hop distances from each KC down to its prerequisites. Topological order
+    # means every prerequisite's row is final before it is read (a KC caught in
+    # a cycle is never placed, so neither is anything that builds on it).
+    up_hops = np.full((n, n), _UNREACHABLE, dtype=np.int32)
+    np.fill_diagonal(up_hops, 0)
+    for s in order:
+        i = index[s]
+        for p in prereqs[s]:
+            if p in index:
+                up_hops[i] = np.minimum(up_hops[i], up_hops[index[p]] + 1)
+
+    reach = (up_hops > 0) & (up_hops < _UNREACHABLE)
+    ancestors = tuple(sum(1 << int(j) for j in np.nonzero(row)[0]) for row in reach)
+    descendants = tuple(sum(1 << int(i) for i in np.nonzero(col)[0]) for col in reach.T)
+
+    ids = np.array([registry.slug_to_id.get(s, -1) for s in slugs], dtype=np.int64)
+    return KCGraph(
+        slugs=slugs,
+        index=index,
+        ids=ids,
+        index_of_id={int(k): i for i, k in enumerate(ids) if k >= 0},
+        ancestors=ancestors,
+        descendants=descendants,
+        up_hops=up_hops,
+        cyclic=tuple(cyclic),
+    )
+
+
+_lock = threading.Lock()
+_built: Optional[Tuple[KCRegistry, KCGraph]] = None
+
+
+def get_graph(db: Optional[Session] = None) -> KCGraph:
+    """The graph for the current registry, rebuilt whenever the registry is."""
+    global _built
+    registry = get_registry(db)
+    built = _built
+    if built is not None and built[0] is registry:
+        return built[1]
+    with _lock:
+        if _built is None or _built[0] is not registry:
+            _built = (registry, build(registry))
+        return _built[1]
+
+
+def weak_mask(graph: KCGraph, mastery: Iterable[Dict], threshold: float) -> int:
+    """Bitset of the KCs a student is weak on: below `threshold` after decay,
+    or never practiced. `mastery` is `current_mastery` output."""
+    strong = graph.mask(row["kc_slug"] for row in mastery if row["mastery"] >= threshold)
+    return ((1 << len(graph.slugs)) - 1) & ~strong
+
+
+def weak_prerequisites(db: Session, user_id: int, kc_slug: str, threshold: float = 0.6) -> List[str]:
+    """The transitive prerequisites of `kc_slug` the student is weak on,
+    prerequisites-first. Served from the mastery snapshot, so between attempts
+    this touches neither the DB nor the graph build."""
+    from app.services.mastery_service import current_mastery
+
+    graph = get_graph(db)
+    return graph.weak_prerequisites(kc_slug, weak_mask(graph, current_mastery(db, user_id), threshold))
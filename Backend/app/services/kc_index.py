@@ -0,0 +1,68 @@
+"""
+KC-slug inverted index over a student's persona and memory banks.
+
+`student_entry_kcs` holds one posting per (row, KC slug), written alongside the
+row (`index_entry`, after flush and before commit, like the vector-store
+hooks). Retrieval asks `lookup` which of the student's rows mention any of the
+query's KCs — across their whole history, via the (user_id, bank, kc_slug)
+index — and gets back how many query slugs each row matched, which is also
+exactly the numerator of the keyword-overlap score.
+"""
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database.models import StudentEntryKC
+from app.services.kc_registry import get_registry
+
+# Most-recent matching rows returned per lookup, to bound the candidate set for
+# students with very long histories on one KC.
+MAX_CANDIDATES = 200
+
+
+def index_entry(
+    db: Session, bank: str, user_id: int, entry_id: int, slugs: Optional[Iterable[str]]
+) -> None:
+    """Add the postings for one freshly flushed row."""
+    db.add_all(
+        [
+            StudentEntryKC(user_id=user_id, bank=bank, kc_slug=slug, entry_id=entry_id)
+            for slug in dict.fromkeys(slugs or [])
+        ]
+    )
+
+
+def reset(db: Session, bank: str, user_id: int) -> None:
+    """Drop the student's postings for a bank being replaced wholesale."""
+    db.query(StudentEntryKC).filter(
+        StudentEntryKC.user_id == user_id, StudentEntryKC.bank == bank
+    ).delete(synchronize_session=False)
+
+
+def lookup(
+    db: Session, bank: str, user_id: int, slugs: Sequence[str], limit: int = MAX_CANDIDATES
+) -> Dict[int, int]:
+    """`{entry_id: number of query slugs it mentions}` for the student's rows
+    tagged with any of `slugs`, newest `limit` rows."""
+    if not slugs:
+        return {}
+    rows = (
+        db.query(StudentEntryKC.entry_id, func.count(StudentEntryKC.id))
+        .filter(
+            StudentEntryKC.user_id == user_id,
+            StudentEntryKC.bank == bank,
+            StudentEntryKC.kc_slug.in_(list(slugs)),
+        )
+        .group_by(StudentEntryKC.entry_id)
+        .order_by(StudentEntryKC.entry_id.desc())
+        .limit(limit)
+        .all()
+    )
+    return {entry_id: hits for entry_id, hits in rows}
+
+
+def slugs_for_kc_ids(db: Session, kc_ids: Optional[Sequence[int]]) -> set:
+    if not kc_ids:
+        return set()
+    return set(get_registry(db).slugs_for(kc_ids))
@@ -4,29 +4,24 @@ Question ↔ knowledge-component mapping.
 Runtime side: `resolve_kcs` reads the `question_kc` table (populated offline by
 `scripts/map_questions_to_kcs.py`) so the mastery updater can turn a graded
 question into the KC(s) it exercised. Taxonomy helpers here are shared with that
-offline script.
+offline script; both read through the cached `kc_registry`.
 """
-import json
-from pathlib import Path
 from typing import Dict, List, Tuple
 
 from sqlalchemy.orm import Session
 
-from app.database.models import KnowledgeComponent, QuestionKC
-
-_TAXONOMY_PATH = Path(__file__).resolve().parents[1] / "data" / "kc_taxonomy.json"
+from app.database.models import QuestionKC
+from app.services.kc_registry import get_registry
 
 
 def load_taxonomy() -> List[Dict]:
     """Return the raw KC nodes (id/slug, name, ib_topic_ref, domain, description)."""
-    with open(_TAXONOMY_PATH) as f:
-        data = json.load(f)
-    return data["knowledge_components"] if isinstance(data, dict) else data
+    return [dict(node) for node in get_registry().taxonomy]
 
 
 def get_slug_to_id(db: Session) -> Dict[str, int]:
     """Map each KC slug to its `knowledge_components.id` for the current DB."""
-    return {kc.slug: kc.id for kc in db.query(KnowledgeComponent).all()}
+    return dict(get_registry(db).slug_to_id)
 
 
 def resolve_kcs(db: Session, question_id: int, practice_mode: str) -> List[Tuple[int, float]]:
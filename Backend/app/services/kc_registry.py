@@ -0,0 +1,207 @@
+"""
+Process-wide, immutable registry of the knowledge-component taxonomy.
+
+Merges the taxonomy file (`kc_taxonomy.json`: slugs, tiers, prerequisites,
+domains) with the DB's `knowledge_components` ids and any fitted BKT params
+(`bkt_params`) into one frozen snapshot, so
+the grading path stops re-querying a KC per attempt (`params_for_kc`) and
+re-parsing the JSON per persona refresh. Lookups never touch the DB or disk.
+
+Reload-on-change: at most every `KC_REGISTRY_REFRESH_SECONDS`, `get_registry`
+re-stats the file and, when given a session, re-reads the KC and fitted-param
+rows it is built from (both tables are small) and compares their hash; any
+edit, such as a tier swap or a refit, swaps in a freshly built registry. Readers holding the old one keep a
+consistent view.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database.models import FittedBktParams, KnowledgeComponent
+
+TAXONOMY_PATH = Path(__file__).resolve().parents[1] / "data" / "kc_taxonomy.json"
+REFRESH_SECONDS = float(os.getenv("KC_REGISTRY_REFRESH_SECONDS", "30"))
+
+
+@dataclass(frozen=True)
+class KCInfo:
+    slug: str
+    name: str
+    domain: str
+    difficulty_tier: str
+    prerequisites: Tuple[str, ...]  # prerequisite slugs
+    id: Optional[int] = None        # None until the DB has the KC
+
+
+@dataclass(frozen=True)
+class KCRegistry:
+    kcs: Tuple[KCInfo, ...]
+    by_slug: Mapping[str, KCInfo]
+    by_id: Mapping[int, KCInfo]
+    slug_to_id: Mapping[str, int]
+    domains: Mapping[str, Tuple[str, ...]]      # domain -> slugs
+    dependents: Mapping[str, Tuple[str, ...]]   # slug -> slugs that require it
+    tier_params: Mapping                         # tier -> BktParams (fitted over hand-set)
+    kc_params: Mapping                           # kc_id -> fitted BktParams
+    default_params: object                       # BktParams for unknown tiers
+    taxonomy: Tuple[Mapping, ...]                # raw taxonomy nodes
+
+    @property
+    def slugs(self) -> frozenset:
+        return frozenset(self.by_slug)
+
+    def slug(self, kc_id: int) -> Optional[str]:
+        kc = self.by_id.get(kc_id)
+        return kc.slug if kc else None
+
+    def slugs_for(self, kc_ids: Sequence[int]) -> List[str]:
+        return [self.by_id[i].slug for i in kc_ids if i in self.by_id]
+
+    def params(self, kc_id: int):
+        """`BktParams` for a KC: its own fitted params, else its difficulty
+        tier's, else the defaults."""
+        if kc_id in self.kc_params:
+            return self.kc_params[kc_id]
+        kc = self.by_id.get(kc_id)
+        if kc is None:
+            return self.default_params
+        return self.tier_params.get(kc.difficulty_tier, self.default_params)
+
+
+def _build(taxonomy: List[Dict], db_rows: Sequence[tuple], fitted_rows: Sequence[tuple] = ()) -> KCRegistry:
+    # Imported here: mastery_service itself reads params through the registry.
+    from app.services.mastery_service import _DEFAULT_PARAMS, _TIER_PARAMS, BktParams
+
+    tier_params = dict(_TIER_PARAMS)
+    kc_params = {}
+    for kc_id, tier, p_L0, p_T, p_S, p_G in fitted_rows:
+        params = BktParams(p_L0=p_L0, p_T=p_T, p_S=p_S, p_G=p_G)
+        if kc_id is not None:
+            kc_params[kc_id] = params
+        elif tier is not None:
+            tier_params[tier] = params
+
+    db_by_slug = {slug: (kc_id, name, domain, tier) for kc_id, slug, name, domain, tier in db_rows}
+    kcs: List[KCInfo] = []
+    seen = set()
+    for node in taxonomy:
+        slug = node["id"]
+        kc_id, name, domain, tier = db_by_slug.get(slug, (None, None, None, None))
+        kcs.append(
+            KCInfo(
+                slug=slug,
+                name=name or node.get("name", slug),
+                domain=domain or node.get("domain", ""),
+                difficulty_tier=tier or node.get("difficulty_tier", ""),
+                prerequisites=tuple(node.get("prerequisites", [])),
+                id=kc_id,
+            )
+        )
+        seen.add(slug)
+    for slug, (kc_id, name, domain, tier) in db_by_slug.items():
+        if slug not in seen:  # in the DB but not the file (e.g. a newer curriculum)
+            kcs.append(KCInfo(slug, name, domain, tier, (), kc_id))
+
+    domains: Dict[str, List[str]] = {}
+    dependents: Dict[str, List[str]] = {}
+    for kc in kcs:
+        domains.setdefault(kc.domain, []).append(kc.slug)
+        for prereq in kc.prerequisites:
+            dependents.setdefault(prereq, []).append(kc.slug)
+
+    return KCRegistry(
+        kcs=tuple(kcs),
+        by_slug=MappingProxyType({kc.slug: kc for kc in kcs}),
+        by_id=MappingProxyType({kc.id: kc for kc in kcs if kc.id is not None}),
+        slug_to_id=MappingProxyType({kc.slug: kc.id for kc in kcs if kc.id is not None}),
+        domains=MappingProxyType({d: tuple(s) for d, s in domains.items()}),
+        dependents=MappingProxyType({s: tuple(d) for s, d in dependents.items()}),
+        tier_params=MappingProxyType(tier_params),
+        kc_params=MappingProxyType(kc_params),
+        default_params=_DEFAULT_PARAMS,
+        taxonomy=tuple(MappingProxyType(dict(node)) for node in taxonomy),
+    )
+
+
+_lock = threading.Lock()
+_registry: Optional[KCRegistry] = None
+_file_stamp: Optional[int] = None
+_db_stamp: Optional[int] = None
+_db_rows: Tuple[tuple, ...] = ()
+_fitted_rows: Tuple[tuple, ...] = ()
+_checked_at = 0.0
+
+
+def read_taxonomy() -> List[Dict]:
+    """The raw KC nodes from the taxonomy file (uncached)."""
+    with open(TAXONOMY_PATH) as f:
+        data = json.load(f)
+    return data["knowledge_components"] if isinstance(data, dict) else data
+
+
+def _file_mtime() -> Optional[int]:
+    try:
+        return os.stat(TAXONOMY_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _db_rows_now(db: Session) -> Tuple[Tuple[tuple, ...], Tuple[tuple, ...]]:
+    kcs = db.query(
+        KnowledgeComponent.id,
+        KnowledgeComponent.slug,
+        KnowledgeComponent.name,
+        KnowledgeComponent.domain,
+        KnowledgeComponent.difficulty_tier,
+    ).order_by(KnowledgeComponent.id)
+    fitted = db.query(
+        FittedBktParams.kc_id,
+        FittedBktParams.difficulty_tier,
+        FittedBktParams.p_L0,
+        FittedBktParams.p_T,
+        FittedBktParams.p_S,
+        FittedBktParams.p_G,
+    ).order_by(FittedBktParams.id)
+    return tuple(map(tuple, kcs.all())), tuple(map(tuple, fitted.all()))
+
+
+def get_registry(db: Optional[Session] = None) -> KCRegistry:
+    """The current registry, rebuilt if the taxonomy file or (given `db`) the
+    KC table changed since the last check."""
+    global _registry, _file_stamp, _db_stamp, _db_rows, _fitted_rows, _checked_at
+    now = time.monotonic()
+    with _lock:
+        never_saw_db = db is not None and _db_stamp is None
+        if _registry is not None and not never_saw_db and now - _checked_at < REFRESH_SECONDS:
+            return _registry
+        _checked_at = now
+
+        file_stamp = _file_mtime()
+        db_stamp = _db_stamp
+        if db is not None:
+            kc_rows, fitted_rows = _db_rows_now(db)
+            db_stamp = hash((kc_rows, fitted_rows))
+        if _registry is not None and file_stamp == _file_stamp and db_stamp == _db_stamp:
+            return _registry
+
+        if db is not None and db_stamp != _db_stamp:
+            _db_rows, _fitted_rows = kc_rows, fitted_rows
+        taxonomy = read_taxonomy() if file_stamp is not None else []
+        _registry = _build(taxonomy, _db_rows, _fitted_rows)
+        _file_stamp, _db_stamp = file_stamp, db_stamp
+        return _registry
+
+
+def invalidate() -> None:
+    """Force the next `get_registry` to rebuild (tests, admin reloads)."""
+    global _registry, _file_stamp, _db_stamp, _db_rows, _fitted_rows, _checked_at
+    with _lock:
+        _registry, _file_stamp, _db_stamp, _checked_at = None, None, None, 0.0
+        _db_rows, _fitted_rows = (), ()
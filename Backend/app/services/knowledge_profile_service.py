@@ -1,12 +1,59 @@
 """
 Service for managing and updating student knowledge profiles
+
+Legacy skill scores live in `student_skill_scores`, one row per (student,
+topic, skill), updated with an indexed upsert per grading. The old
+`knowledge_profile` JSON shape is served as a projection of those rows, cached
+per student (Redis `profile:` when available) until their next grading.
 """
 import json
-import copy
+import os
 from datetime import datetime
 from typing import Dict, List, Optional
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from app.database.models import StudentUser, NcertExamples, NcertExercises, PYQs
+from app.database.models import StudentUser, StudentSkillScore, NcertExamples, NcertExercises, PYQs
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
+
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "3600"))
+_REDIS_PREFIX = "profile:"
+
+_profiles = TTLCache(maxsize=4096, ttl=PROFILE_CACHE_TTL_SECONDS)
+
+
+def _cached_profile(user_id: int) -> Optional[Dict]:
+    client = get_redis()
+    if client is not None:
+        try:
+            blob = client.get(f"{_REDIS_PREFIX}{user_id}")
+            return json.loads(blob) if blob is not None else None
+        except Exception as err:
+            redis_failed(err)
+    return _profiles.get(user_id)
+
+
+def _store_profile(user_id: int, profile: Dict) -> None:
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(f"{_REDIS_PREFIX}{user_id}", PROFILE_CACHE_TTL_SECONDS, json.dumps(profile))
+            return
+        except Exception as err:
+            redis_failed(err)
+    _profiles.set(user_id, profile)
+
+
+def invalidate_profile(user_id: int) -> None:
+    """Drop the student's cached profile projection (after a grading write)."""
+    _profiles.pop(user_id)
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(f"{_REDIS_PREFIX}{user_id}")
+        except Exception as err:
+            redis_failed(err)
+
 
 class KnowledgeProfileService:
     
@@ -89,7 +136,8 @@ class KnowledgeProfileService:
         user_id: int,
         question_id: int,
         practice_mode: str,
-        grading_result: Dict
+        grading_result: Dict,
+        grading_session_id: Optional[int] = None
     ) -> Dict:
         """
         Update knowledge profile after a grading session
@@ -113,6 +161,7 @@ class KnowledgeProfileService:
                     question_id=question_id,
                     practice_mode=practice_mode,
                     grading_result=grading_result,
+                    grading_session_id=grading_session_id,
                 )
                 if changes:
                     print(f"Updated KC mastery for user {user_id}: {changes}")
@@ -120,146 +169,185 @@ class KnowledgeProfileService:
                 print(f"KC mastery update failed (non-fatal): {mastery_error}")
                 db.rollback()
             
-            # Get or initialize profile
-            profile = copy.deepcopy(user.knowledge_profile) if user.knowledge_profile else None
-            if not profile:
-                print("no profile found, creating new blank profile")
-                profile = KnowledgeProfileService.initialize_blank_profile()
-                user.knowledge_profile = profile
-            
             # Get skills tested for this question
             skills_tested = KnowledgeProfileService.get_question_skills_tested(db, question_id, practice_mode)
             if not skills_tested or 'skills' not in skills_tested:
                 print(f"No skills_tested found for question {question_id}")
-                return profile
-            print(skills_tested)
-            
+                return KnowledgeProfileService.get_student_profile(db, user_id)
+
             # Extract score from grading result
             if 'grade' not in grading_result:
                 print("No grade found in grading result")
-                return profile
-            print(grading_result["grade"])
-            grade_parts = grading_result["grade"].split('/')
-            print(f"Grade parts: {grade_parts}")
-            print(f"First part: '{grade_parts[0]}'")
-            print(f"Type: {type(grade_parts[0])}")
-
-            numerator = float(grade_parts[0])
+                return KnowledgeProfileService.get_student_profile(db, user_id)
+            numerator = float(grading_result["grade"].split('/')[0])
             actual_score = numerator / 10
-            print(actual_score)
-            
-            # Update timestamp
-            profile['last_updated'] = datetime.utcnow().isoformat()
-            
-            # Ensure mathematics subject exists
-            if 'mathematics' not in profile['subjects']:
-                print("math not in profile for some weird reason")
-                profile['subjects']['mathematics'] = {'topics': []}
-            
-            # Process each skill tested
+
+            skills = []
             for skill_data in skills_tested['skills']:
                 topic_name = skill_data.get('topic', 'General')
+                if topic_name == "Pair of Linear Equations":
+                    topic_name = "Pair of Linear Equations in Two Variables"
+                skills.append((topic_name, skill_data))
+
+            # Only this question's topics are read (and locked); the student's
+            # other topics and older questions are never touched.
+            topic_names = sorted({topic for topic, _ in skills})
+            rows = {
+                (row.topic_name, row.skill_name): row
+                for row in (
+                    db.query(StudentSkillScore)
+                    .filter(
+                        StudentSkillScore.user_id == user_id,
+                        StudentSkillScore.topic_name.in_(topic_names),
+                    )
+                    .with_for_update()
+                    .all()
+                )
+            }
+            known_topics = {topic for topic, _ in rows}
+            values: Dict[tuple, Dict] = {}
+
+            # Process each skill tested
+            for topic_name, skill_data in skills:
                 skill_name = skill_data.get('skill_name', 'Unknown')
                 skill_difficulty = skill_data.get('difficulty', 0.5)
                 weight = skill_data.get('weight', 1.0)
-                
-                if topic_name == "Pair of Linear Equations":
-                    topic_name = "Pair of Linear Equations in Two Variables"
-                
-                # Find or create topic
-                topic_found = False
-                for topic_obj in profile['subjects']['mathematics']['topics']:
-                    if topic_obj['topic_name'] == topic_name:
-                        topic_found = True
-                        
-                        # Update or create skill
-                        if skill_name not in topic_obj['skills']:
-                            topic_obj['skills'][skill_name] = {
-                                'score': 50,  # Default starting score
-                                'questions': []
-                            }
-                        
-                        # Get current skill score
-                        current_score = topic_obj['skills'][skill_name]['score']
-                        
-                        # Calculate expected performance
-                        expected_score = KnowledgeProfileService.calculate_expected_performance(
-                            current_score, skill_difficulty
-                        )
-                        
-                        # Calculate performance gap
-                        performance_gap = (actual_score * 100) - expected_score
-                        
-                        # Get difficulty multiplier
-                        difficulty_multiplier = KnowledgeProfileService.get_difficulty_multiplier(
-                            skill_difficulty, actual_score
-                        )
-                        
-                        # Update score using difficulty-aware algorithm
-                        learning_rate = 0.2
-                        score_change = learning_rate * weight * performance_gap * difficulty_multiplier
-                        new_score = current_score + score_change
-                        
-                        # Clamp to 0-100 range
-                        new_score = max(0, min(100, int(new_score)))
-                        
-                        # Update skill data
-                        topic_obj['skills'][skill_name]['score'] = new_score
-                        topic_obj['skills'][skill_name]['questions'].append(str(question_id))
-                        
-                        print(f"Updated {skill_name}: {current_score} -> {new_score} (gap: {performance_gap:.1f}, mult: {difficulty_multiplier:.2f})")
-                        
-                        # Update topic overall proficiency (average of all skills)
-                        skill_scores = [s['score'] for s in topic_obj['skills'].values()]
-                        topic_obj['overall_proficiency'] = int(sum(skill_scores) / len(skill_scores))
-                        
-                        break
-                
-                # Create new topic if not found
-                if not topic_found:
-                    initial_score = max(10, min(60, int(actual_score * 100)))
-                    new_topic = {
-                        'topic_name': topic_name,
-                        'overall_proficiency': initial_score,
-                        'skills': {
-                            skill_name: {
-                                'score': initial_score,
-                                'questions': [str(question_id)]
-                            }
-                        }
-                    }
-                    print(type(profile["subjects"]["mathematics"]["topics"]))
-                    profile['subjects']['mathematics']['topics'].append(new_topic)
-                    print(f"Created new topic: {topic_name} with skill: {skill_name} (score: {initial_score})")
-            
-            # Save updated profile
-            print("established profile")
-            user.knowledge_profile = profile
+                key = (topic_name, skill_name)
+
+                if topic_name not in known_topics:
+                    # New topic: seed from this attempt
+                    known_topics.add(topic_name)
+                    new_score = max(10, min(60, int(actual_score * 100)))
+                    values[key] = {"score": new_score, "n_questions": 1}
+                    print(f"Created new topic: {topic_name} with skill: {skill_name} (score: {new_score})")
+                    continue
+
+                if key in values:
+                    current_score, n_questions = values[key]["score"], values[key]["n_questions"]
+                elif key in rows:
+                    current_score, n_questions = rows[key].score, rows[key].n_questions
+                else:
+                    current_score, n_questions = 50, 0  # Default starting score
+
+                # Calculate expected performance
+                expected_score = KnowledgeProfileService.calculate_expected_performance(
+                    current_score, skill_difficulty
+                )
+
+                # Calculate performance gap
+                performance_gap = (actual_score * 100) - expected_score
+
+                # Get difficulty multiplier
+                difficulty_multiplier = KnowledgeProfileService.get_difficulty_multiplier(
+                    skill_difficulty, actual_score
+                )
+
+                # Update score using difficulty-aware algorithm
+                learning_rate = 0.2
+                score_change = learning_rate * weight * performance_gap * difficulty_multiplier
+                new_score = max(0, min(100, int(current_score + score_change)))
+                values[key] = {"score": new_score, "n_questions": n_questions + 1}
+
+                print(f"Updated {skill_name}: {current_score} -> {new_score} (gap: {performance_gap:.1f}, mult: {difficulty_multiplier:.2f})")
+
+            KnowledgeProfileService._upsert_skill_scores(db, user_id, question_id, values)
             db.commit()
-            
-            return profile
-            
+            invalidate_profile(user_id)
+
+            return KnowledgeProfileService.get_student_profile(db, user_id)
+
         except Exception as e:
             print(f"Error updating knowledge profile: {e}")
             db.rollback()
             return None
     
+    @staticmethod
+    def _upsert_skill_scores(db: Session, user_id: int, question_id: int, values: Dict[tuple, Dict]) -> None:
+        """Write the new (topic, skill) scores in one upsert on the
+        (user_id, topic_name, skill_name) key."""
+        if not values:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "topic_name": topic_name,
+                "skill_name": skill_name,
+                "score": v["score"],
+                "n_questions": v["n_questions"],
+                "last_question_id": question_id,
+                "updated_at": now,
+            }
+            for (topic_name, skill_name), v in values.items()
+        ]
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            stmt = insert(StudentSkillScore).values(rows)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["user_id", "topic_name", "skill_name"],
+                    set_={
+                        col: stmt.excluded[col]
+                        for col in ("score", "n_questions", "last_question_id", "updated_at")
+                    },
+                )
+            )
+        else:
+            for row in rows:
+                db.merge(StudentSkillScore(**row))
+
+    @staticmethod
+    def project_profile_from_skill_scores(db: Session, user_id: int) -> Optional[Dict]:
+        """Legacy profile JSON built from `student_skill_scores` (topics in the
+        order they were first seen). None if the student has no rows."""
+        rows = (
+            db.query(StudentSkillScore)
+            .filter(StudentSkillScore.user_id == user_id)
+            .order_by(StudentSkillScore.id)
+            .all()
+        )
+        if not rows:
+            return None
+
+        topics: Dict[str, Dict] = {}
+        for row in rows:
+            topic = topics.setdefault(row.topic_name, {"topic_name": row.topic_name, "skills": {}})
+            topic["skills"][row.skill_name] = {
+                "score": row.score,
+                "question_count": row.n_questions,
+                "last_question_id": row.last_question_id,
+            }
+        for topic in topics.values():
+            scores = [skill["score"] for skill in topic["skills"].values()]
+            topic["overall_proficiency"] = int(sum(scores) / len(scores))
+
+        last_updated = max((row.updated_at for row in rows if row.updated_at), default=datetime.utcnow())
+        return {
+            "last_updated": last_updated.isoformat(),
+            "subjects": {"mathematics": {"topics": list(topics.values())}},
+        }
+
     @staticmethod
     def get_student_profile(db: Session, user_id: int) -> Dict:
-        """Get student's current knowledge profile"""
+        """Get student's current knowledge profile.
+
+        A cached projection of `student_skill_scores`; students with no rows
+        yet get their stored legacy JSON, or a blank profile."""
         try:
-            user = db.query(StudentUser).filter(StudentUser.id == user_id).first()
-            if not user:
-                return None
-            
-            if not user.knowledge_profile:
-                # Initialize blank profile
-                profile = KnowledgeProfileService.initialize_blank_profile()
-                user.knowledge_profile = profile
-                db.commit()
+            profile = _cached_profile(user_id)
+            if profile is not None:
                 return profile
-            
-            return user.knowledge_profile
+
+            profile = KnowledgeProfileService.project_profile_from_skill_scores(db, user_id)
+            if profile is None:
+                user = db.query(StudentUser).filter(StudentUser.id == user_id).first()
+                if not user:
+                    return None
+                profile = user.knowledge_profile or KnowledgeProfileService.initialize_blank_profile()
+
+            _store_profile(user_id, profile)
+            return profile
 
         except Exception as e:
             print(f"Error getting student profile: {e}")
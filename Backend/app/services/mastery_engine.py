@@ -0,0 +1,331 @@
+"""
+Vectorized BKT + forgetting-curve engine for bulk mastery work.
+
+`mastery_service` updates one (student, KC) row per graded attempt; this module
+does the same math over NumPy arrays of states at once, for the jobs that touch
+every student: rebuilding mastery from the attempt log (`attempt_replay`),
+nightly decay snapshots, and class-wide mastery reads. The formulas are exactly
+`mastery_service.bkt_update` / `decay_mastery` (tests pin them to the scalar
+versions), with each row carrying its own `BktParams` from its KC's tier.
+
+Replay processes events in "rounds": round r applies every state's r-th attempt
+in one vectorized step, so the Python loop runs max-attempts-per-state times,
+not once per event. `replay_attempts` also applies the prerequisite-graph
+evidence, with rounds per student instead of per state.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database.models import GradingSession, KCMastery, KnowledgeComponent, QuestionKC
+from app.services.kc_graph import propagate_batch
+from app.services.kc_registry import get_registry
+from app.services.mastery_service import (
+    FORGET_FLOOR,
+    MIN_STABILITY_FRACTION,
+    STABILITY_BASE_DAYS,
+    BktParams,
+    _DEFAULT_PARAMS,
+    _TIER_PARAMS,
+    score_to_correct,
+)
+
+_SECONDS_PER_DAY = 86400.0
+_EPOCH = datetime(1970, 1, 1)
+
+# Column order of a params matrix.
+P_L0, P_T, P_S, P_G = range(4)
+
+
+def _row(params: BktParams) -> Tuple[float, float, float, float]:
+    return (params.p_L0, params.p_T, params.p_S, params.p_G)
+
+
+def params_matrix(
+    tiers: Sequence[Optional[str]], overrides: Optional[Dict[str, BktParams]] = None
+) -> np.ndarray:
+    """`(n, 4)` float64 matrix of [p_L0, p_T, p_S, p_G] per row's difficulty tier
+    (unknown tiers get the defaults). `overrides` replaces per-tier params,
+    e.g. when re-scoring with newly fitted values."""
+    table = {tier: _row(p) for tier, p in _TIER_PARAMS.items()}
+    for tier, p in (overrides or {}).items():
+        table[tier] = _row(p)
+    default = _row(_DEFAULT_PARAMS)
+    return np.array([table.get(tier, default) for tier in tiers], dtype=np.float64).reshape(-1, 4)
+
+
+def kc_params_matrix(
+    db: Session, kc_ids: Sequence[int], overrides: Optional[Dict[str, BktParams]] = None
+) -> np.ndarray:
+    """`(n, 4)` params per KC as `params_for_kc` resolves them (fitted, then
+    tier, then default); `overrides` replaces whole tiers."""
+    registry = get_registry(db)
+    overrides = overrides or {}
+    rows = []
+    for kc_id in kc_ids:
+        tier = getattr(registry.by_id.get(kc_id), "difficulty_tier", None)
+        rows.append(_row(overrides[tier] if tier in overrides else registry.params(kc_id)))
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def bkt_update_batch(p_L: np.ndarray, correct: np.ndarray, params: np.ndarray) -> np.ndarray:
+    """`bkt_update` over arrays: posterior given each row's evidence, then the
+    learning transition."""
+    p_L = np.asarray(p_L, dtype=np.float64)
+    correct = np.asarray(correct, dtype=bool)
+    p_T, p_S, p_G = params[:, P_T], params[:, P_S], params[:, P_G]
+    num = np.where(correct, p_L * (1 - p_S), p_L * p_S)
+    denom = num + np.where(correct, (1 - p_L) * p_G, (1 - p_L) * (1 - p_G))
+    posterior = np.divide(num, denom, out=p_L.copy(), where=denom > 0)
+    return posterior + (1 - posterior) * p_T
+
+
+def decay_batch(p_L: np.ndarray, days: np.ndarray, floor: float = FORGET_FLOOR) -> np.ndarray:
+    """`decay_mastery` over arrays. NaN days (never practiced) and days <= 0
+    leave the value unchanged."""
+    p_L = np.asarray(p_L, dtype=np.float64)
+    days = np.asarray(days, dtype=np.float64)
+    stability = STABILITY_BASE_DAYS * np.maximum(p_L, MIN_STABILITY_FRACTION)
+    elapsed = np.where(np.isnan(days) | (days <= 0), 0.0, days)
+    return np.where(elapsed > 0, floor + (p_L - floor) * np.exp(-elapsed / stability), p_L)
+
+
+def to_epoch(values: Iterable[Optional[datetime]]) -> np.ndarray:
+    """Naive-UTC datetimes -> float seconds since the epoch (NaN for None)."""
+    return np.array(
+        [(v - _EPOCH).total_seconds() if v is not None else np.nan for v in values],
+        dtype=np.float64,
+    )
+
+
+@dataclass
+class ReplayResult:
+    p_mastery: np.ndarray      # BKT posterior after the last attempt (not decayed)
+    n_attempts: np.ndarray
+    n_correct: np.ndarray
+    last_practiced: np.ndarray  # epoch seconds, NaN if never practiced
+
+
+def replay(
+    state: np.ndarray,
+    correct: np.ndarray,
+    timestamps: np.ndarray,
+    params: np.ndarray,
+    p_init: Optional[np.ndarray] = None,
+    last_practiced: Optional[np.ndarray] = None,
+) -> ReplayResult:
+    """Apply attempt events to `len(params)` states, exactly as a sequence of
+    `record_attempt` calls would (decay for the gap since the previous attempt,
+    then the BKT update).
+
+    `state[i]` is the state row event i belongs to, `timestamps` are epoch
+    seconds; events need not be sorted. States start at their tier's p_L0
+    unless `p_init` / `last_practiced` continue from stored values.
+    """
+    n = params.shape[0]
+    p = params[:, P_L0].copy() if p_init is None else np.asarray(p_init, dtype=np.float64).copy()
+    last = np.full(n, np.nan) if last_practiced is None else np.asarray(last_practiced, dtype=np.float64).copy()
+    n_attempts = np.zeros(n, dtype=np.int64)
+    n_correct = np.zeros(n, dtype=np.int64)
+
+    state = np.asarray(state, dtype=np.int64)
+    if state.size == 0:
+        return ReplayResult(p, n_attempts, n_correct, last)
+    correct = np.asarray(correct, dtype=bool)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    order = np.lexsort((timestamps, state))
+    state, correct, timestamps = state[order], correct[order], timestamps[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(state)) + 1]
+    rank = np.arange(state.size) - np.repeat(starts, np.diff(np.r_[starts, state.size]))
+
+    by_round = np.argsort(rank, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+    for r in range(len(bounds) - 1):
+        events = by_round[bounds[r]:bounds[r + 1]]
+        idx, ok, t = state[events], correct[events], timestamps[events]
+        before = decay_batch(p[idx], (t - last[idx]) / _SECONDS_PER_DAY)
+        p[idx] = bkt_update_batch(before, ok, params[idx])
+        last[idx] = t
+        n_attempts[idx] += 1
+        n_correct[idx] += ok
+    return ReplayResult(p, n_attempts, n_correct, last)
+
+
+def _by_round(rounds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices grouped by round, and the group bounds."""
+    return np.argsort(rounds, kind="stable"), np.r_[0, np.cumsum(np.bincount(rounds))]
+
+
+def replay_attempts(
+    event_user: np.ndarray,
+    event_correct: np.ndarray,
+    event_time: np.ndarray,
+    direct_event: np.ndarray,
+    direct_state: np.ndarray,
+    spread_event: np.ndarray,
+    spread_state: np.ndarray,
+    spread_weight: np.ndarray,
+    params: np.ndarray,
+) -> ReplayResult:
+    """`replay` plus the prerequisite-graph evidence `record_attempt` spreads.
+
+    Events are attempts (`event_*`, in attempt order within each student);
+    `direct_*` lists the states each one practices and `spread_*` the nearby
+    states `kc_graph.spread` weights for it. After an attempt's direct
+    updates, every spread state the student had already practiced takes the
+    discounted posterior (`kc_graph.propagate_batch`), without counting as
+    practice — exactly the live sequence. Propagation ties a student's states
+    together, so round r applies every student's r-th attempt rather than
+    every state's r-th update.
+    """
+    n = params.shape[0]
+    p = params[:, P_L0].copy()
+    last = np.full(n, np.nan)
+    n_attempts = np.zeros(n, dtype=np.int64)
+    n_correct = np.zeros(n, dtype=np.int64)
+
+    event_user = np.asarray(event_user, dtype=np.int64)
+    if event_user.size == 0:
+        return ReplayResult(p, n_attempts, n_correct, last)
+    event_correct = np.asarray(event_correct, dtype=bool)
+    event_time = np.asarray(event_time, dtype=np.float64)
+    direct_event = np.asarray(direct_event, dtype=np.int64)
+    direct_state = np.asarray(direct_state, dtype=np.int64)
+    spread_event = np.asarray(spread_event, dtype=np.int64)
+    spread_state = np.asarray(spread_state, dtype=np.int64)
+    spread_weight = np.asarray(spread_weight, dtype=np.float64)
+
+    # Each event's position in its student's sequence.
+    order = np.argsort(event_user, kind="stable")
+    sorted_users = event_user[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_users)) + 1]
+    rank = np.empty(event_user.size, dtype=np.int64)
+    rank[order] = np.arange(event_user.size) - np.repeat(starts, np.diff(np.r_[starts, event_user.size]))
+
+    direct_order, direct_bounds = _by_round(rank[direct_event])
+    spread_order, spread_bounds = _by_round(rank[spread_event])
+    for r in range(int(rank.max()) + 1):
+        if r + 1 < len(direct_bounds):
+            entries = direct_order[direct_bounds[r]:direct_bounds[r + 1]]
+            idx, ev = direct_state[entries], direct_event[entries]
+            ok, t = event_correct[ev], event_time[ev]
+            before = decay_batch(p[idx], (t - last[idx]) / _SECONDS_PER_DAY)
+            p[idx] = bkt_update_batch(before, ok, params[idx])
+            last[idx] = t
+            n_attempts[idx] += 1
+            n_correct[idx] += ok
+        if r + 1 < len(spread_bounds):
+            entries = spread_order[spread_bounds[r]:spread_bounds[r + 1]]
+            entries = entries[n_attempts[spread_state[entries]] > 0]
+            for correct in (True, False):
+                hit = entries[event_correct[spread_event[entries]] == correct]
+                if hit.size:
+                    idx = spread_state[hit]
+                    p[idx] = propagate_batch(p[idx], correct, spread_weight[hit], params[idx])
+    return ReplayResult(p, n_attempts, n_correct, last)
+
+
+# ---- DB-backed bulk operations ----
+
+
+@dataclass
+class MasteryFrame:
+    """Stored `kc_mastery` rows as parallel arrays."""
+
+    user_id: np.ndarray
+    kc_id: np.ndarray
+    p_mastery: np.ndarray
+    last_practiced: np.ndarray  # epoch seconds, NaN if never
+    tier: List[str]
+
+    def decayed(self, now: Optional[datetime] = None) -> np.ndarray:
+        """Read-time mastery for every row (`decayed_value`, vectorized)."""
+        now_s = to_epoch([now or datetime.utcnow()])[0]
+        return decay_batch(self.p_mastery, (now_s - self.last_practiced) / _SECONDS_PER_DAY)
+
+
+def load_frame(db: Session, user_ids: Optional[Sequence[int]] = None) -> MasteryFrame:
+    """One column-only query for the stored mastery of `user_ids` (all if None)."""
+    stmt = select(
+        KCMastery.user_id,
+        KCMastery.kc_id,
+        KCMastery.p_mastery,
+        KCMastery.last_practiced_at,
+        KnowledgeComponent.difficulty_tier,
+    ).join(KnowledgeComponent, KCMastery.kc_id == KnowledgeComponent.id)
+    if user_ids is not None:
+        stmt = stmt.where(KCMastery.user_id.in_(list(user_ids)))
+    rows = db.execute(stmt).all()
+    return MasteryFrame(
+        user_id=np.array([r[0] for r in rows], dtype=np.int64),
+        kc_id=np.array([r[1] for r in rows], dtype=np.int64),
+        p_mastery=np.array([r[2] for r in rows], dtype=np.float64),
+        last_practiced=to_epoch(r[3] for r in rows),
+        tier=[r[4] for r in rows],
+    )
+
+
+def mastery_matrix(
+    db: Session, user_ids: Sequence[int], now: Optional[datetime] = None
+) -> Tuple[List[int], List[int], np.ndarray]:
+    """Class-wide decayed mastery as a `(students, KCs)` matrix; NaN where a
+    student has no row for a KC. Returns `(user_ids, kc_ids, matrix)`."""
+    frame = load_frame(db, user_ids)
+    users = list(user_ids)
+    kcs = sorted(set(frame.kc_id.tolist()))
+    matrix = np.full((len(users), len(kcs)), np.nan)
+    if kcs:
+        row_of = {u: i for i, u in enumerate(users)}
+        col_of = {k: j for j, k in enumerate(kcs)}
+        rows = np.fromiter((row_of[u] for u in frame.user_id.tolist()), dtype=np.int64, count=frame.user_id.size)
+        cols = np.fromiter((col_of[k] for k in frame.kc_id.tolist()), dtype=np.int64, count=frame.kc_id.size)
+        matrix[rows, cols] = frame.decayed(now)
+    return users, kcs, matrix
+
+
+def grading_history(
+    db: Session, user_ids: Optional[Sequence[int]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Completed grading sessions expanded to per-KC attempt events:
+    `(user_id, kc_id, correct, epoch_seconds)` arrays. Unmapped or ungradable
+    sessions are skipped, as in `record_attempt`."""
+    kcs_of: Dict[Tuple[int, str], List[int]] = {}
+    for question_id, mode, kc_id in db.execute(
+        select(QuestionKC.question_id, QuestionKC.practice_mode, QuestionKC.kc_id)
+    ):
+        kcs_of.setdefault((question_id, mode), []).append(kc_id)
+
+    stmt = select(
+        GradingSession.user_id,
+        GradingSession.question_id,
+        GradingSession.practice_mode,
+        GradingSession.grading_result,
+        GradingSession.image_uploaded_at,
+        GradingSession.created_at,
+    ).where(GradingSession.status == "completed")
+    if user_ids is not None:
+        stmt = stmt.where(GradingSession.user_id.in_(list(user_ids)))
+
+    users, kc_ids, outcomes, times = [], [], [], []
+    for user_id, question_id, mode, result, uploaded_at, created_at in db.execute(stmt):
+        correct = score_to_correct(result or {})
+        kcs = kcs_of.get((question_id, mode))
+        if correct is None or not kcs:
+            continue
+        for kc_id in kcs:
+            users.append(user_id)
+            kc_ids.append(kc_id)
+            outcomes.append(correct)
+            times.append(uploaded_at or created_at)
+    return (
+        np.array(users, dtype=np.int64),
+        np.array(kc_ids, dtype=np.int64),
+        np.array(outcomes, dtype=bool),
+        to_epoch(times),
+    )
+
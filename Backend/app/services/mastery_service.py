@@ -5,17 +5,33 @@ Mastery is a Bayesian Knowledge Tracing (BKT) posterior that updates on every
 graded attempt, and a forgetting curve decays it between attempts. Together they
 replace the old static 0-100 skill score with a calibrated, time-aware
 probability. See docs/tasa-knowledge-model.md.
+
+Reads go through a per-student snapshot of the stored rows, versioned like the
+TASA state snapshots: `record_attempt` bumps the student's version after it
+commits, and a snapshot is only served at the version it was loaded at. Decay
+depends only on the stored timestamps, so it is re-applied on every read and
+nothing needs the DB between attempts.
 """
+import json
 import math
+import os
+import threading
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.database.models import KCMastery, KnowledgeComponent
+from app.database.models import AttemptEvent, KCMastery
+from app.services import kc_graph
 from app.services.kc_mapping import resolve_kcs
+from app.services.kc_registry import get_registry
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
 
 # A grade at/above this fraction counts as a correct attempt for BKT evidence.
 CORRECT_THRESHOLD = 0.6
@@ -25,6 +41,16 @@ FORGET_FLOOR = 0.10
 STABILITY_BASE_DAYS = 30.0  # a fully-mastered skill's ~1/e decay time
 MIN_STABILITY_FRACTION = 0.15  # keep stability > 0 for near-zero mastery
 
+# Upper bound on how long a snapshot can miss another worker's write when
+# Redis (which shares versions across workers) is down.
+SNAPSHOT_TTL_SECONDS = int(os.getenv("MASTERY_SNAPSHOT_TTL_SECONDS", "600"))
+_REDIS_PREFIX = "mastery:"
+_EPOCH = datetime(1970, 1, 1)
+
+_snapshots = TTLCache(maxsize=4096, ttl=SNAPSHOT_TTL_SECONDS)
+_versions: Dict[int, int] = {}
+_versions_lock = threading.Lock()
+
 
 @dataclass(frozen=True)
 class BktParams:
@@ -75,10 +101,7 @@ def decay_mastery(p_L: float, days_since: float, floor: float = FORGET_FLOOR) ->
 
 
 def params_for_kc(db: Session, kc_id: int) -> BktParams:
-    kc = db.query(KnowledgeComponent).filter(KnowledgeComponent.id == kc_id).first()
-    if kc is None:
-        return _DEFAULT_PARAMS
-    return _TIER_PARAMS.get(kc.difficulty_tier, _DEFAULT_PARAMS)
+    return get_registry(db).params(kc_id)
 
 
 def score_to_correct(grading_result: Dict) -> Optional[bool]:
@@ -98,33 +121,81 @@ def score_to_correct(grading_result: Dict) -> Optional[bool]:
     return (got / out_of) >= CORRECT_THRESHOLD
 
 
-def _get_or_create_mastery(
-    db: Session, user_id: int, kc_id: int, prior: float
-) -> KCMastery:
-    """Fetch the (student, KC) mastery row, locking it, or create it. Retries
-    once on the create race so a concurrent insert doesn't crash the update."""
-    row = (
-        db.query(KCMastery)
-        .filter(KCMastery.user_id == user_id, KCMastery.kc_id == kc_id)
-        .with_for_update()
-        .first()
-    )
-    if row is not None:
-        return row
+# Rows per multi-VALUES INSERT, well under the drivers' bind-parameter limits.
+_INSERT_BATCH = 500
 
-    row = KCMastery(user_id=user_id, kc_id=kc_id, p_mastery=prior, n_attempts=0, n_correct=0)
-    db.add(row)
-    try:
-        db.flush()
-        return row
-    except IntegrityError:
-        db.rollback()
-        return (
-            db.query(KCMastery)
-            .filter(KCMastery.user_id == user_id, KCMastery.kc_id == kc_id)
-            .with_for_update()
-            .first()
+
+def _lock_mastery_rows(
+    db: Session, user_id: int, priors: Dict[int, float], existing_only: Sequence[int] = ()
+) -> List[tuple]:
+    """Make sure the student has a `kc_mastery` row for every KC in `priors`
+    (creating missing ones at their prior), then lock and return them all,
+    plus whichever of `existing_only` the student already has rows for.
+
+    Two statements regardless of how many KCs: a bulk insert that skips rows
+    that already exist — so a concurrent first attempt can't make it fail — and
+    one `SELECT ... FOR UPDATE` ordered by KC, so concurrent graders lock in the
+    same order. Rows are `(id, kc_id, p_mastery, n_attempts, n_correct,
+    last_practiced_at)` tuples.
+    """
+    insert_missing_rows(db, [
+        {"user_id": user_id, "kc_id": kc_id, "p_mastery": prior, "n_attempts": 0, "n_correct": 0}
+        for kc_id, prior in priors.items()
+    ])
+    return db.execute(
+        select(
+            KCMastery.id,
+            KCMastery.kc_id,
+            KCMastery.p_mastery,
+            KCMastery.n_attempts,
+            KCMastery.n_correct,
+            KCMastery.last_practiced_at,
         )
+        .where(KCMastery.user_id == user_id, KCMastery.kc_id.in_([*priors, *existing_only]))
+        .order_by(KCMastery.kc_id)
+        .with_for_update()
+    ).all()
+
+
+_MASTERY = KCMastery.__table__
+_UPDATE_BY_ID = update(_MASTERY).where(_MASTERY.c.id == bindparam("_id"))
+
+
+def insert_missing_rows(db: Session, rows: List[Dict]) -> None:
+    """Insert kc_mastery rows, skipping any (user_id, kc_id) that already
+    exists, so a concurrent first attempt can't make it fail; callers lock
+    the rows afterwards. `rows` carry the same keys in every row."""
+    dialect = db.get_bind().dialect.name
+    for start in range(0, len(rows), _INSERT_BATCH):
+        batch = rows[start:start + _INSERT_BATCH]
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            db.execute(insert(KCMastery).values(batch).on_conflict_do_nothing(index_elements=["user_id", "kc_id"]))
+            continue
+        existing = set(
+            db.execute(
+                select(KCMastery.user_id, KCMastery.kc_id).where(
+                    KCMastery.user_id.in_(list({row["user_id"] for row in batch})),
+                    KCMastery.kc_id.in_(list({row["kc_id"] for row in batch})),
+                )
+            ).tuples()
+        )
+        for row in batch:
+            if (row["user_id"], row["kc_id"]) in existing:
+                continue
+            try:
+                with db.begin_nested():
+                    db.execute(KCMastery.__table__.insert().values(**row))
+            except IntegrityError:
+                pass  # created concurrently; the caller's lock picks it up
+
+
+def update_mastery_rows(db: Session, rows: List[Dict]) -> None:
+    """One executemany UPDATE of kc_mastery rows by primary key. `rows` carry
+    an "id" plus the columns to set (the same keys in every row). A Core
+    statement, since ORM bulk UPDATE by primary key needs SQLAlchemy 2.0."""
+    if rows:
+        db.execute(_UPDATE_BY_ID, [{"_id": row["id"], **{k: v for k, v in row.items() if k != "id"}} for row in rows])
 
 
 def _days_since(dt: Optional[datetime]) -> Optional[float]:
@@ -140,76 +211,224 @@ def decayed_value(row: KCMastery) -> float:
     return row.p_mastery if days is None else decay_mastery(row.p_mastery, days)
 
 
-def current_mastery(db: Session, user_id: int) -> List[Dict]:
-    """Per-KC decayed mastery snapshot for reads (MCP profile, retrieval)."""
+def _snapshot_key(user_id: int) -> str:
+    return f"{_REDIS_PREFIX}snap:{user_id}"
+
+
+def _version_key(user_id: int) -> str:
+    return f"{_REDIS_PREFIX}ver:{user_id}"
+
+
+def invalidate_snapshot(user_id: int) -> None:
+    """Bump the student's mastery version so the next read reloads from the DB."""
+    with _versions_lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+    _snapshots.pop(user_id)
+    client = get_redis()
+    if client is not None:
+        try:
+            client.incr(_version_key(user_id))
+        except Exception as err:
+            redis_failed(err)
+
+
+def _lookup_snapshot(user_id: int) -> Tuple[int, Optional[Dict]]:
+    """(current version, stored snapshot) in one Redis round trip."""
+    client = get_redis()
+    if client is not None:
+        try:
+            version, blob = client.mget([_version_key(user_id), _snapshot_key(user_id)])
+            return int(version or 0), json.loads(blob) if blob is not None else _snapshots.get(user_id)
+        except Exception as err:
+            redis_failed(err)
+    with _versions_lock:
+        version = _versions.get(user_id, 0)
+    return version, _snapshots.get(user_id)
+
+
+def _store_snapshot(user_id: int, snapshot: Dict) -> None:
+    _snapshots.set(user_id, snapshot)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(_snapshot_key(user_id), SNAPSHOT_TTL_SECONDS, json.dumps(snapshot))
+    except Exception as err:
+        redis_failed(err)
+
+
+def _load_snapshot_rows(db: Session, user_id: int) -> List[Dict]:
+    """The student's stored (undecayed) mastery rows, with KC names from the
+    registry rather than a join."""
+    registry = get_registry(db)
     rows = (
-        db.query(KCMastery, KnowledgeComponent)
-        .join(KnowledgeComponent, KCMastery.kc_id == KnowledgeComponent.id)
+        db.query(KCMastery.kc_id, KCMastery.p_mastery, KCMastery.last_practiced_at, KCMastery.n_attempts)
         .filter(KCMastery.user_id == user_id)
         .all()
     )
     snapshot: List[Dict] = []
-    for mastery, kc in rows:
-        days = _days_since(mastery.last_practiced_at)
+    for kc_id, p_mastery, last_practiced_at, n_attempts in rows:
+        kc = registry.by_id.get(kc_id)
+        if kc is None:
+            continue
         snapshot.append(
             {
-                "kc_id": kc.id,
+                "kc_id": kc_id,
                 "kc_slug": kc.slug,
                 "kc_name": kc.name,
                 "domain": kc.domain,
-                "mastery": round(decayed_value(mastery), 3),
-                "raw_mastery": round(mastery.p_mastery, 3),
-                "days_since_practice": round(days, 1) if days is not None else None,
-                "n_attempts": mastery.n_attempts,
+                "p_mastery": p_mastery,
+                "last_practiced": (
+                    (last_practiced_at - _EPOCH).total_seconds() if last_practiced_at is not None else None
+                ),
+                "n_attempts": n_attempts,
             }
         )
     return snapshot
 
 
+def current_mastery(db: Session, user_id: int) -> List[Dict]:
+    """Per-KC decayed mastery snapshot for reads (MCP profile, retrieval).
+
+    Served from the student's cached rows while their version is unchanged;
+    decay is applied here, per call, from the stored timestamps."""
+    version, snapshot = _lookup_snapshot(user_id)
+    if snapshot is None or snapshot["version"] != version:
+        snapshot = {"version": version, "rows": _load_snapshot_rows(db, user_id)}
+        _store_snapshot(user_id, snapshot)
+
+    now = (datetime.utcnow() - _EPOCH).total_seconds()
+    result: List[Dict] = []
+    for row in snapshot["rows"]:
+        last = row["last_practiced"]
+        days = (now - last) / 86400.0 if last is not None else None
+        result.append(
+            {
+                "kc_id": row["kc_id"],
+                "kc_slug": row["kc_slug"],
+                "kc_name": row["kc_name"],
+                "domain": row["domain"],
+                "mastery": round(row["p_mastery"] if days is None else decay_mastery(row["p_mastery"], days), 3),
+                "raw_mastery": round(row["p_mastery"], 3),
+                "days_since_practice": round(days, 1) if days is not None else None,
+                "n_attempts": row["n_attempts"],
+            }
+        )
+    return result
+
+
 def record_attempt(
     db: Session,
     user_id: int,
     question_id: int,
     practice_mode: str,
     grading_result: Dict,
+    grading_session_id: Optional[int] = None,
 ) -> List[Dict]:
     """Update per-KC mastery for one graded attempt.
 
-    Resolves the question's KCs, then for each KC decays the stored mastery for
-    elapsed time and applies the BKT update. Returns a per-KC change log (also
-    handy for tests). Returns [] when the question is unmapped or ungradable.
+    Appends the attempt to `attempt_events`, resolves the question's KCs, locks
+    (creating if needed) all of the student's rows for them at once, then for
+    each KC decays the stored mastery for elapsed time and applies the BKT
+    update; the new values go back in one batched UPDATE, so the round trips
+    don't grow with the number of KCs. The event commits with the update.
+
+    The attempt is also weaker evidence about the KCs around the practiced ones
+    in the prerequisite graph (`kc_graph.spread`). Those of them the student
+    already has rows for are locked in the same statement and take a
+    discounted posterior in one vectorized step, without counting as practice:
+    attempts and `last_practiced_at` are untouched, so read-time decay carries
+    on from the real last attempt. Returns a per-KC change log (also handy for
+    tests; propagated entries carry their `weight`). Returns [] when the
+    question is unmapped (the event is still logged, for a later remap) or
+    ungradable.
     """
     correct = score_to_correct(grading_result)
     if correct is None:
         return []
 
+    now = datetime.utcnow()
     kcs = resolve_kcs(db, question_id, practice_mode)
+    db.add(
+        AttemptEvent(
+            user_id=user_id,
+            question_id=question_id,
+            practice_mode=practice_mode,
+            correct=correct,
+            kc_weights=[[kc_id, weight] for kc_id, weight in kcs],
+            grading_session_id=grading_session_id,
+            attempted_at=now,
+        )
+    )
     if not kcs:
+        db.commit()
         return []
 
-    now = datetime.utcnow()
-    changes: List[Dict] = []
-
-    for kc_id, _weight in kcs:
-        params = params_for_kc(db, kc_id)
-        row = _get_or_create_mastery(db, user_id, kc_id, params.p_L0)
+    params = {kc_id: params_for_kc(db, kc_id) for kc_id, _weight in kcs}
+    spread = kc_graph.get_graph(db).spread(list(params), correct) if kc_graph.PROPAGATION_ENABLED else {}
+    rows = _lock_mastery_rows(db, user_id, {kc_id: p.p_L0 for kc_id, p in params.items()}, list(spread))
 
-        if row.last_practiced_at is not None:
-            days = (now - row.last_practiced_at).total_seconds() / 86400.0
-            p_before = decay_mastery(row.p_mastery, days)
+    changes: List[Dict] = []
+    updates: List[Dict] = []
+    indirect: List[tuple] = []
+
+    for row_id, kc_id, p_mastery, n_attempts, n_correct, last_practiced_at in rows:
+        if kc_id not in params:
+            indirect.append((row_id, kc_id, p_mastery, n_attempts, n_correct, last_practiced_at))
+            continue
+        if last_practiced_at is not None:
+            days = (now - last_practiced_at).total_seconds() / 86400.0
+            p_before = decay_mastery(p_mastery, days)
         else:
-            p_before = row.p_mastery
-
-        p_after = bkt_update(p_before, correct, params)
-
-        row.p_mastery = p_after
-        row.n_attempts += 1
-        row.n_correct += 1 if correct else 0
-        row.last_practiced_at = now
+            p_before = p_mastery
+        p_after = bkt_update(p_before, correct, params[kc_id])
 
+        updates.append(
+            {
+                "id": row_id,
+                "p_mastery": p_after,
+                "n_attempts": n_attempts + 1,
+                "n_correct": n_correct + (1 if correct else 0),
+                "last_practiced_at": now,
+                "updated_at": now,
+            }
+        )
         changes.append(
             {"kc_id": kc_id, "p_before": round(p_before, 4), "p_after": round(p_after, 4), "correct": correct}
         )
 
+    if indirect:
+        registry = get_registry(db)
+        kc_params = [registry.params(row[1]) for row in indirect]
+        before = np.array([row[2] for row in indirect])
+        weights = np.array([spread[row[1]] for row in indirect])
+        after = kc_graph.propagate_batch(
+            before, correct, weights, np.array([(p.p_L0, p.p_T, p.p_S, p.p_G) for p in kc_params])
+        )
+        for row, p_after, weight in zip(indirect, after.tolist(), weights.tolist()):
+            row_id, kc_id, p_before, n_attempts, n_correct, last_practiced_at = row
+            # Same keys as the direct updates, so it all stays one executemany.
+            updates.append(
+                {
+                    "id": row_id,
+                    "p_mastery": p_after,
+                    "n_attempts": n_attempts,
+                    "n_correct": n_correct,
+                    "last_practiced_at": last_practiced_at,
+                    "updated_at": now,
+                }
+            )
+            changes.append(
+                {
+                    "kc_id": kc_id,
+                    "p_before": round(p_before, 4),
+                    "p_after": round(p_after, 4),
+                    "correct": correct,
+                    "weight": round(weight, 4),
+                }
+            )
+
+    update_mastery_rows(db, updates)
     db.commit()
+    invalidate_snapshot(user_id)
     return changes
@@ -15,9 +15,12 @@ from typing import List, Optional
 import google.generativeai as genai
 from sqlalchemy.orm import Session
 
-from app.database.models import KnowledgeComponent, StudentMemoryEvent
+from app.database.models import StudentMemoryEvent
+from app.services import gemini_client, kc_index, misconception_library, vector_repo
+from app.services.vector_store import get_vector_store
 from app.services.embedding_service import embed_document_async
 from app.services.kc_mapping import resolve_kcs
+from app.services.kc_registry import get_registry
 from app.services.mastery_service import score_to_correct
 
 _SYSTEM = (
@@ -45,10 +48,7 @@ def _get_model() -> genai.GenerativeModel:
 
 def _kc_slugs(db: Session, question_id: int, practice_mode: str) -> List[str]:
     kc_ids = [kc_id for kc_id, _ in resolve_kcs(db, question_id, practice_mode)]
-    if not kc_ids:
-        return []
-    kcs = db.query(KnowledgeComponent).filter(KnowledgeComponent.id.in_(kc_ids)).all()
-    return [kc.slug for kc in kcs]
+    return get_registry(db).slugs_for(kc_ids)
 
 
 async def _summarize(question_text: str, grading_result: dict) -> str:
@@ -58,7 +58,7 @@ async def _summarize(question_text: str, grading_result: dict) -> str:
         f"Grading result (JSON): {json.dumps(grading_result)[:2000]}\n\n"
         "Write the one-sentence episode note."
     )
-    resp = await asyncio.to_thread(model.generate_content, prompt)
+    resp = await gemini_client.generate_content(model, prompt)
     return (resp.text or "").strip()
 
 
@@ -97,5 +97,13 @@ async def generate_event(
         source_grading_id=source_grading_id,
     )
     db.add(event)
+    db.flush()
+    get_vector_store().add(db, vector_repo.MEMORY, user_id, event.id, embedding)
+    kc_index.index_entry(db, vector_repo.MEMORY, user_id, event.id, slugs)
     db.commit()
+    # Indexing can retrain the IVF lists (a k-means pass): keep it off the loop.
+    await asyncio.to_thread(
+        misconception_library.record_event,
+        event.id, event.user_id, slugs, summary, embedding,
+    )
     return event
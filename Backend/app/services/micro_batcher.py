@@ -0,0 +1,88 @@
+"""
+Asyncio micro-batcher: coalesce concurrent single-item calls into one batch call.
+
+Callers `await batcher.submit(item)` as if it were a single call. The first item
+opens a short window (a few ms); everything submitted from any request on the
+same event loop before the window closes — or until `max_batch` items queue up —
+goes upstream as one `batch_fn(items)` call in a worker thread. `batch_fn`
+returns one result per item, where an `Exception` instance fails only that
+item's caller (per-item error isolation). At most `max_concurrency` batches are
+in flight at once; later batches wait their turn.
+"""
+import asyncio
+from typing import Callable, Generic, List, Optional, Sequence, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BatchFn = Callable[[List[T]], Sequence[Union[R, Exception]]]
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        max_concurrency: int = 4,
+    ) -> None:
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._inflight: set = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        items = [item for item, _ in batch]
+        async with self._slots:
+            self.batches += 1
+            self.items += len(items)
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as err:
+                results = [err] * len(items)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():  # caller was cancelled
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else None,
+        }
@@ -0,0 +1,223 @@
+"""
+Cross-student misconception library over every L3 memory event.
+
+Each `StudentMemoryEvent` is an embedded one-line mistake episode, but the
+per-student banks in `vector_store` only ever answer "what has *this* student
+done". This module holds one process-wide view of all events:
+
+  * a global `vector_repo.IVFIndex` over every event embedding, so "which
+    episodes look like this one" probes a few inverted lists instead of
+    scanning `student_memory_events`;
+  * per-KC-slug clusters of near-duplicate episodes (greedy leader clustering:
+    an event joins the closest existing cluster of that KC if its leader has
+    cosine >= `CLUSTER_THRESHOLD`, else it starts a new one), tracking
+    how many events and distinct students each misconception has.
+
+The library is built lazily by streaming the table in id-ordered chunks, then
+kept current two ways: `memory_service.generate_event` records new events
+directly, and every read first pulls any rows above the high-water id (cheap
+primary-key range scan) so events written by other workers show up too.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database.models import StudentMemoryEvent
+from app.services import vector_repo
+
+# Cosine above which two episodes on the same KC count as the same mistake.
+CLUSTER_THRESHOLD = float(os.getenv("MISCONCEPTION_CLUSTER_THRESHOLD", "0.88"))
+# Inverted lists probed per ANN query; more = better recall, slower.
+NPROBE = int(os.getenv("MISCONCEPTION_NPROBE", "8"))
+_CHUNK = 2000
+
+
+@dataclass
+class Misconception:
+    """One cluster of near-duplicate episodes on a single KC."""
+
+    kc_slug: str
+    leader_id: int  # the event that founded the cluster; its summary labels it
+    summary: str
+    event_ids: List[int] = field(default_factory=list)
+    students: Set[int] = field(default_factory=set)
+
+    def to_dict(self) -> dict:
+        return {
+            "kc_slug": self.kc_slug,
+            "summary": self.summary,
+            "events": len(self.event_ids),
+            "students": len(self.students),
+            "example_event_id": self.leader_id,
+        }
+
+
+class MisconceptionLibrary:
+    def __init__(self, threshold: float = CLUSTER_THRESHOLD, nprobe: int = NPROBE) -> None:
+        self.threshold = threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ann = vector_repo.IVFIndex(nprobe=self.nprobe)
+        self._owner: Dict[int, int] = {}  # event id -> user id
+        self._leaders: Dict[str, vector_repo.VectorIndex] = {}  # kc slug -> leader vectors
+        self._clusters: Dict[Tuple[str, int], Misconception] = {}  # (kc, leader id)
+        self._membership: Dict[int, List[Tuple[str, int]]] = {}  # event id -> its clusters
+        self._high_water = 0
+
+    def __len__(self) -> int:
+        return len(self._owner)
+
+    # ---- writes ----
+
+    def add(
+        self,
+        event_id: int,
+        user_id: int,
+        kc_slugs: Optional[Sequence[str]],
+        summary: str,
+        vec: Optional[Sequence[float]],
+    ) -> None:
+        """Index one event and file it under a cluster for each of its KCs.
+        Events without an embedding are skipped; re-adding is a no-op."""
+        if vec is None or len(vec) == 0:
+            return
+        with self._lock:
+            if event_id in self._owner:
+                return
+            self._owner[event_id] = user_id
+            self._ann.add(event_id, vec)
+            if self._ann.needs_retrain:
+                self._ann.train()
+
+            unit = self._ann.vector(event_id)
+            clusters = []
+            for slug in dict.fromkeys(kc_slugs or []):
+                leaders = self._leaders.setdefault(slug, vector_repo.VectorIndex())
+                best = leaders.search(unit, 1)
+                if best and best[0][1] >= self.threshold:
+                    leader_id = best[0][0]
+                else:
+                    leader_id = event_id
+                    leaders.add(event_id, unit)
+                    self._clusters[(slug, event_id)] = Misconception(slug, event_id, summary)
+                cluster = self._clusters[(slug, leader_id)]
+                cluster.event_ids.append(event_id)
+                cluster.students.add(user_id)
+                clusters.append((slug, leader_id))
+            self._membership[event_id] = clusters
+
+    def record(self, event: StudentMemoryEvent) -> None:
+        """Write hook for a freshly committed event."""
+        self.add(event.id, event.user_id, event.concept_keywords, event.summary, event.embedding)
+
+    def refresh(self, db: Session) -> int:
+        """Pull every event above the high-water id in keyset chunks; returns
+        how many rows were read. The first call builds the whole library."""
+        seen = 0
+        while True:
+            with self._lock:
+                last_id = self._high_water
+            rows = (
+                db.query(
+                    StudentMemoryEvent.id,
+                    StudentMemoryEvent.user_id,
+                    StudentMemoryEvent.concept_keywords,
+                    StudentMemoryEvent.summary,
+                    StudentMemoryEvent.embedding,
+                )
+                .filter(StudentMemoryEvent.id > last_id)
+                .order_by(StudentMemoryEvent.id)
+                .limit(_CHUNK)
+                .all()
+            )
+            if not rows:
+                return seen
+            with self._lock:
+                for event_id, user_id, slugs, summary, vec in rows:
+                    self.add(event_id, user_id, slugs, summary, vec)
+                self._high_water = max(self._high_water, rows[-1][0])
+            seen += len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    # ---- reads ----
+
+    def similar_events(
+        self, query_vec: Sequence[float], k: int = 10, exclude_user: Optional[int] = None
+    ) -> List[Tuple[int, int, float]]:
+        """Approximate top `k` `(event_id, user_id, score)` across all students."""
+        with self._lock:
+            hits = self._ann.search(query_vec, k + (k if exclude_user is not None else 0))
+            out = [
+                (event_id, self._owner[event_id], score)
+                for event_id, score in hits
+                if self._owner[event_id] != exclude_user
+            ]
+        return out[:k]
+
+    def students_with_same_mistake(self, event_id: int, kc_slug: Optional[str] = None) -> List[int]:
+        """Other students whose episodes landed in the same cluster(s) as
+        `event_id`, optionally restricted to one KC; most-shared first."""
+        with self._lock:
+            owner = self._owner.get(event_id)
+            counts: Dict[int, int] = {}
+            for slug, leader_id in self._membership.get(event_id, []):
+                if kc_slug is not None and slug != kc_slug:
+                    continue
+                for student in self._clusters[(slug, leader_id)].students:
+                    if student != owner:
+                        counts[student] = counts.get(student, 0) + 1
+        return sorted(counts, key=lambda s: (-counts[s], s))
+
+    def top_misconceptions(self, kc_slug: str, n: int = 5) -> List[Misconception]:
+        """The `n` clusters on `kc_slug` shared by the most students."""
+        with self._lock:
+            leaders = self._leaders.get(kc_slug)
+            if leaders is None:
+                return []
+            clusters = [self._clusters[(kc_slug, leader_id)] for leader_id in leaders.ids]
+        clusters.sort(key=lambda c: (len(c.students), len(c.event_ids)), reverse=True)
+        return clusters[:n]
+
+
+_library: Optional[MisconceptionLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_library(db: Optional[Session] = None) -> MisconceptionLibrary:
+    """The process-wide library; with `db`, caught up to the table first."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = MisconceptionLibrary()
+    if db is not None:
+        _library.refresh(db)
+    return _library
+
+
+def record_event(
+    event_id: int,
+    user_id: int,
+    kc_slugs: Optional[Sequence[str]],
+    summary: str,
+    vec: Optional[Sequence[float]],
+) -> None:
+    """Best-effort write hook for a freshly committed event; only updates a
+    library that is already loaded (an unloaded one will stream the row in on
+    its first read). Takes plain values rather than the ORM row so it can run
+    in a worker thread (`asyncio.to_thread`): adding can retrain the IVF
+    lists, which is too much CPU for the event loop."""
+    if _library is None:
+        return
+    try:
+        _library.add(event_id, user_id, kc_slugs, summary, vec)
+    except Exception as e:
+        print(f"misconception_library: failed to record event {event_id}: {e}")
@@ -6,7 +6,6 @@ masteries + recent mistake episodes) into 1-3 short natural-language persona
 lines, each tagged with the KC slugs it concerns and embedded for retrieval.
 See docs/tasa-knowledge-model.md.
 """
-import asyncio
 import json
 import os
 from datetime import datetime
@@ -21,8 +20,10 @@ from app.database.models import (
     StudentMemoryEvent,
     StudentPersona,
 )
-from app.services.embedding_service import embed_document_async
-from app.services.kc_mapping import load_taxonomy
+from app.services import gemini_client, kc_index, vector_repo
+from app.services.embedding_service import embed_documents_batch_async
+from app.services.kc_registry import get_registry
+from app.services.vector_store import get_vector_store
 
 # Regenerate the persona bank once every this many recorded memory events.
 PERSONA_EVERY = 5
@@ -120,21 +121,28 @@ async def regenerate_personas(db: Session, user_id: int) -> List[StudentPersona]
     Replaces the bank (personas are a whole-trajectory summary, not append-only).
     Best-effort: returns [] if there's nothing to summarize or the LLM fails.
     """
-    valid_slugs = {kc["id"] for kc in load_taxonomy()}
+    valid_slugs = get_registry().slugs
     prompt = (
         f"Current mastery:\n{_mastery_block(db, user_id)}\n\n"
         f"Recent mistakes/episodes:\n{_events_block(db, user_id)}\n\n"
         "Write the persona JSON array."
     )
-    resp = await asyncio.to_thread(_get_model().generate_content, prompt)
+    resp = await gemini_client.generate_content(_get_model(), prompt)
     personas = _parse_personas(resp.text or "", valid_slugs)
     if not personas:
         return []
 
+    personas = personas[:PERSONA_CAP]
+    # One batched round trip for the whole bank; a line that fails to embed is
+    # still stored (keyword-only retrieval) rather than dropping the bank.
+    embeddings = await embed_documents_batch_async([p["description"] for p in personas])
+
+    store = get_vector_store()
     db.query(StudentPersona).filter(StudentPersona.user_id == user_id).delete()
+    store.reset(db, vector_repo.PERSONA, user_id)
+    kc_index.reset(db, vector_repo.PERSONA, user_id)
     created: List[StudentPersona] = []
-    for item in personas[:PERSONA_CAP]:
-        embedding = await embed_document_async(item["description"])
+    for item, embedding in zip(personas, embeddings):
         row = StudentPersona(
             user_id=user_id,
             description=item["description"],
@@ -144,6 +152,10 @@ async def regenerate_personas(db: Session, user_id: int) -> List[StudentPersona]
         )
         db.add(row)
         created.append(row)
+    db.flush()
+    for row, embedding in zip(created, embeddings):
+        store.add(db, vector_repo.PERSONA, user_id, row.id, embedding)
+        kc_index.index_entry(db, vector_repo.PERSONA, user_id, row.id, row.concept_keywords)
     db.commit()
     return created
 
@@ -0,0 +1,189 @@
+"""
+Write-side materialization of the TASA state block.
+
+`build_state` costs a query embedding plus an LLM rewrite, which used to sit on
+the latency-sensitive next-question request. Instead, grading materializes the
+student's state right after the write path (mastery update, memory event,
+persona refresh) and stores a versioned snapshot; `get_state_block` is then one
+lookup.
+
+Versioning: every write bumps a per-student version (`invalidate`) before the
+snapshot is rebuilt, and a snapshot is only served if it was built at the
+current version, so a read between a write and its materialization falls back
+to a live build instead of returning pre-write state. Staleness: mastery in a
+served snapshot is re-decayed for the time elapsed since it was built, and
+snapshots older than `SNAPSHOT_MAX_AGE_SECONDS` are rebuilt (the persona/memory
+rewrites were made for the retention at build time). A snapshot is built
+around the KCs of the question just graded (`question_kc_ids`, which drive
+`build_state`'s KC-index prefilter), and a read that names a question is only
+served a snapshot built for the same KCs.
+
+Snapshots and versions live in Redis (`state:`) when available, with the
+in-process tier as fallback; without Redis each worker only sees its own
+writes, bounded by the max age.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.services import student_state_service as sss
+from app.services.kc_mapping import resolve_kcs
+from app.services.mastery_service import decay_mastery
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
+
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("STATE_SNAPSHOT_MAX_AGE_SECONDS", str(24 * 3600)))
+_REDIS_PREFIX = "state:"
+
+_snapshots = TTLCache(maxsize=4096, ttl=SNAPSHOT_MAX_AGE_SECONDS)
+_versions: Dict[int, int] = {}
+_versions_lock = threading.Lock()
+
+
+def next_question_query(was_correct: bool) -> str:
+    """The retrieval query used when selecting the next practice question."""
+    return (
+        "Recommend the next practice question for this student. Their last "
+        f"attempt was {'correct' if was_correct else 'incorrect'}."
+    )
+
+
+def question_kc_ids(db: Session, question_id: Optional[int], practice_mode: Optional[str]) -> List[int]:
+    """KC ids of the question the state is built around ([] if unknown or unmapped)."""
+    if question_id is None or not practice_mode:
+        return []
+    return sorted(kc_id for kc_id, _ in resolve_kcs(db, question_id, practice_mode))
+
+
+def _snapshot_key(user_id: int) -> str:
+    return f"{_REDIS_PREFIX}snap:{user_id}"
+
+
+def _version_key(user_id: int) -> str:
+    return f"{_REDIS_PREFIX}ver:{user_id}"
+
+
+def invalidate(user_id: int) -> int:
+    """Bump the student's state version; any existing snapshot stops being served."""
+    with _versions_lock:
+        version = _versions.get(user_id, 0) + 1
+        _versions[user_id] = version
+    client = get_redis()
+    if client is not None:
+        try:
+            version = int(client.incr(_version_key(user_id)))
+            with _versions_lock:
+                _versions[user_id] = max(_versions.get(user_id, 0), version)
+        except Exception as err:
+            redis_failed(err)
+    return version
+
+
+def _lookup(user_id: int) -> Tuple[int, Optional[Dict]]:
+    """(current version, stored snapshot) in one Redis round trip."""
+    client = get_redis()
+    if client is not None:
+        try:
+            version, blob = client.mget([_version_key(user_id), _snapshot_key(user_id)])
+            if blob is not None:
+                return int(version or 0), json.loads(blob)
+            return int(version or 0), _snapshots.get(user_id)
+        except Exception as err:
+            redis_failed(err)
+    with _versions_lock:
+        version = _versions.get(user_id, 0)
+    return version, _snapshots.get(user_id)
+
+
+def _store(user_id: int, snapshot: Dict) -> None:
+    _snapshots.set(user_id, snapshot)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(_snapshot_key(user_id), SNAPSHOT_MAX_AGE_SECONDS, json.dumps(snapshot))
+    except Exception as err:
+        redis_failed(err)
+
+
+def redecay(state: Dict, elapsed_seconds: float) -> Dict:
+    """Copy of `state` with mastery decayed for `elapsed_seconds` more time."""
+    elapsed_days = max(elapsed_seconds, 0.0) / 86400.0
+    mastery = []
+    for m in state.get("mastery") or []:
+        m = dict(m)
+        if m.get("days_since_practice") is not None:
+            days = m["days_since_practice"] + elapsed_days
+            m["mastery"] = round(decay_mastery(m["raw_mastery"], days), 3)
+            m["days_since_practice"] = round(days, 1)
+        mastery.append(m)
+    return {**state, "mastery": mastery}
+
+
+async def materialize(
+    db: Session, user_id: int, was_correct: bool, kc_ids: Optional[List[int]] = None
+) -> Optional[Dict]:
+    """Rebuild and store the student's snapshot at a fresh version, around the
+    graded question's `kc_ids`. Best-effort: returns None (and leaves reads on
+    the live path) on failure."""
+    version = await asyncio.to_thread(invalidate, user_id)
+    kc_ids = sorted(kc_ids or [])
+    try:
+        state = await sss.build_state(db, user_id, next_question_query(was_correct), query_kc_ids=kc_ids)
+    except Exception as err:
+        print(f"state snapshot build failed for user {user_id}: {err}")
+        return None
+    snapshot = {
+        "version": version,
+        "built_at": time.time(),
+        "was_correct": bool(was_correct),
+        "kc_ids": kc_ids,
+        "state": state,
+    }
+    await asyncio.to_thread(_store, user_id, snapshot)
+    return snapshot
+
+
+async def get_state(
+    db: Session, user_id: int, was_correct: bool, kc_ids: Optional[List[int]] = None
+) -> Dict:
+    """The student's state: the stored snapshot (re-decayed) when it is current
+    and fresh, else a live `build_state` that is stored for next time. `source`
+    says which ("snapshot" / "live"). `kc_ids` (the last question's KCs, when
+    known) must match the snapshot's."""
+    kc_ids = sorted(kc_ids) if kc_ids is not None else None
+    version, snapshot = await asyncio.to_thread(_lookup, user_id)
+    if snapshot is not None:
+        age = time.time() - snapshot["built_at"]
+        if (
+            snapshot["version"] == version
+            and snapshot["was_correct"] == bool(was_correct)
+            and (kc_ids is None or snapshot.get("kc_ids", []) == kc_ids)
+            and age <= SNAPSHOT_MAX_AGE_SECONDS
+        ):
+            return {**redecay(snapshot["state"], age), "source": "snapshot"}
+
+    state = await sss.build_state(db, user_id, next_question_query(was_correct), query_kc_ids=kc_ids)
+    await asyncio.to_thread(
+        _store,
+        user_id,
+        {
+            "version": version,
+            "built_at": time.time(),
+            "was_correct": bool(was_correct),
+            "kc_ids": kc_ids or [],
+            "state": state,
+        },
+    )
+    return {**state, "source": "live"}
+
+
+async def get_state_block(
+    db: Session, user_id: int, was_correct: bool, kc_ids: Optional[List[int]] = None
+) -> str:
+    """`format_state_for_prompt` of `get_state`."""
+    return sss.format_state_for_prompt(await get_state(db, user_id, was_correct, kc_ids))
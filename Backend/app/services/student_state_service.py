@@ -4,24 +4,53 @@ The TASA read path: assemble a student's current state for tutoring/selection.
 Combines L1 (decayed per-KC mastery), and the top persona/memory entries
 retrieved by hybrid similarity (semantic + KC-keyword) and rewritten to reflect
 current retention via the forgetting curve. See docs/tasa-knowledge-model.md.
+
+The DB reads (one worker thread, on the request's session) and the query
+embedding start together, and both banks are rewritten in one LLM call, so a
+request pays roughly max(db, embed) + rank + one rewrite. `build_state` returns
+a per-stage `timings_ms` breakdown alongside the state.
+
+Rewrites are cached per note: the LLM only ever sees the note text plus its
+*bucketed* retention (0.1 steps) and staleness (day ranges), so the output is a
+function of (note, buckets) and is keyed on exactly that. Replacing a note
+changes its id/text hash, and mastery crossing a bucket boundary changes the
+bucket, so both simply miss; everything else skips the LLM.
 """
 import asyncio
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional, Sequence
+import time
+from typing import Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
 import google.generativeai as genai
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy.orm import Session, defer
 
 from app.database.models import StudentMemoryEvent, StudentPersona
+from app.services import gemini_client, kc_index, vector_repo
 from app.services.embedding_service import embed_query_async
 from app.services.mastery_service import current_mastery
-from app.services.vector_repo import cosine
+from app.services.ttl_cache import TTLCache, get_redis, redis_failed
+from app.services.vector_store import get_vector_store
+
+T = TypeVar("T")
 
 # Hybrid retrieval weighting: mostly semantic, partly exact KC-keyword overlap.
 LAMBDA = 0.7
 TOP_N = 3
-_MEMORY_POOL = 50  # most-recent events considered before ranking
+_MEMORY_POOL = 50  # most-recent events always considered before ranking
+
+# Rewrite cache buckets: retention to the nearest RETENTION_STEP, staleness into
+# day ranges starting at each edge (the last one open-ended).
+RETENTION_STEP = 0.1
+_STALENESS_EDGES = (0, 1, 3, 7, 14, 30, 60, 90)
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "8192"))
+REWRITE_CACHE_TTL_SECONDS = int(os.getenv("REWRITE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+_REDIS_PREFIX = "rw:"
+_REWRITE_MODEL = "gemini-2.5-flash"
+
+_rewrites = TTLCache(REWRITE_CACHE_SIZE, REWRITE_CACHE_TTL_SECONDS)
 
 _SYSTEM = (
     "You adjust a tutor's notes about a student to reflect memory decay. Given "
@@ -44,29 +73,45 @@ def _get_model() -> genai.GenerativeModel:
     if not api_key:
         raise ValueError("GEMINI_API_KEY is required for forgetting-aware rewrite")
     genai.configure(api_key=api_key)
-    _model = genai.GenerativeModel("gemini-2.5-flash", system_instruction=_SYSTEM)
+    _model = genai.GenerativeModel(_REWRITE_MODEL, system_instruction=_SYSTEM)
     return _model
 
 
-def _keyword_overlap(query_slugs: set, entry_slugs: Optional[Sequence[str]]) -> float:
-    if not query_slugs or not entry_slugs:
+def _keyword_overlap(hits: int, entry_slugs: Optional[Sequence[str]]) -> float:
+    """Fraction of the entry's KCs that the query asks about; `hits` is the
+    entry's matched-slug count from the inverted index."""
+    if not hits or not entry_slugs:
         return 0.0
-    entry = set(entry_slugs)
-    return len(query_slugs & entry) / len(entry)
+    return hits / len(set(entry_slugs))
+
+
+def _hybrid_rank(db, bank, user_id, query_vec, kc_hits, entries, top_n):
+    if not entries:
+        return []
+    sem = get_vector_store().similarities(
+        db, bank, user_id, query_vec, [entry.id for entry in entries]
+    )
+    kw = np.fromiter(
+        (_keyword_overlap(kc_hits.get(entry.id, 0), entry.concept_keywords) for entry in entries),
+        dtype=np.float32,
+        count=len(entries),
+    )
+    scores = LAMBDA * sem + (1 - LAMBDA) * kw
+    return [entries[i] for i in vector_repo.top_indices(scores, top_n)]
 
 
-def _hybrid_rank(query_vec, query_slugs, entries, top_n):
-    scored = []
-    for entry in entries:
-        sem = cosine(query_vec, entry.embedding or [])
-        kw = _keyword_overlap(query_slugs, entry.concept_keywords)
-        scored.append((entry, LAMBDA * sem + (1 - LAMBDA) * kw))
-    scored.sort(key=lambda pair: pair[1], reverse=True)
-    return [entry for entry, _ in scored[:top_n]]
+def _staleness_bucket(days: Optional[float]) -> Optional[str]:
+    if days is None:
+        return None
+    lower = max(edge for edge in _STALENESS_EDGES if edge <= max(days, 0))
+    i = _STALENESS_EDGES.index(lower)
+    if i == len(_STALENESS_EDGES) - 1:
+        return f"{lower}+"
+    return f"{lower}-{_STALENESS_EDGES[i + 1] - 1}"
 
 
 def _retention_note(entry, mastery_by_slug: Dict[str, Dict]) -> Dict:
-    """Weakest-link retention + staleness across the entry's KCs."""
+    """Weakest-link retention + staleness across the entry's KCs, bucketed."""
     retentions, days = [], []
     for slug in entry.concept_keywords or []:
         m = mastery_by_slug.get(slug)
@@ -76,13 +121,51 @@ def _retention_note(entry, mastery_by_slug: Dict[str, Dict]) -> Dict:
         if m["days_since_practice"] is not None:
             days.append(m["days_since_practice"])
     return {
-        "min_retention": round(min(retentions), 2) if retentions else None,
-        "max_days_since_practice": max(days) if days else None,
+        "min_retention": (
+            round(round(min(retentions) / RETENTION_STEP) * RETENTION_STEP, 2) if retentions else None
+        ),
+        "max_days_since_practice": _staleness_bucket(max(days)) if days else None,
     }
 
 
-async def _rewrite(notes: List[str], retentions: List[Dict]) -> List[str]:
-    """One batched forgetting-aware rewrite; falls back to the raw notes."""
+def _rewrite_key(bank: str, entry_id: int, note: str, retention: Dict) -> str:
+    payload = json.dumps([_REWRITE_MODEL, bank, entry_id, note, retention], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _redis_rewrites(keys: List[str]) -> List[Optional[str]]:
+    client = get_redis()
+    if client is None or not keys:
+        return [None] * len(keys)
+    try:
+        values = client.mget([_REDIS_PREFIX + key for key in keys])
+    except Exception as err:
+        redis_failed(err)
+        return [None] * len(keys)
+    return [value.decode("utf-8") if value is not None else None for value in values]
+
+
+def _store_rewrites(pairs: List[tuple]) -> None:
+    for key, text in pairs:
+        _rewrites.set(key, text)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        for key, text in pairs:
+            pipe.setex(_REDIS_PREFIX + key, REWRITE_CACHE_TTL_SECONDS, text.encode("utf-8"))
+        pipe.execute()
+    except Exception as err:
+        redis_failed(err)
+
+
+def rewrite_cache_stats() -> Dict:
+    return _rewrites.stats()
+
+
+async def _rewrite(notes: List[str], retentions: List[Dict]) -> Optional[List[str]]:
+    """One batched forgetting-aware rewrite; None if the LLM call fails."""
     if not notes:
         return []
     payload = [
@@ -93,7 +176,7 @@ async def _rewrite(notes: List[str], retentions: List[Dict]) -> List[str]:
         "Return the JSON array of rewritten notes."
     )
     try:
-        resp = await asyncio.to_thread(_get_model().generate_content, prompt)
+        resp = await gemini_client.generate_content(_get_model(), prompt)
         text = (resp.text or "").strip()
         if text.startswith("```"):
             text = text.strip("`").split("\n", 1)[-1].rsplit("```", 1)[0].strip()
@@ -102,56 +185,142 @@ async def _rewrite(notes: List[str], retentions: List[Dict]) -> List[str]:
             return [str(r) for r in rewritten]
     except Exception as err:
         print(f"forgetting-aware rewrite failed, using raw notes: {err}")
-    return notes
+    return None
 
 
-async def build_state(
-    db: Session,
-    user_id: int,
-    query: str,
-    query_kc_ids: Optional[List[int]] = None,
-) -> Dict:
-    """Return `{mastery, persona, memory}` for the current turn.
+async def _rewrite_cached(
+    keys: List[str], notes: List[str], retentions: List[Dict]
+) -> List[str]:
+    """Cached rewrites (process, then Redis); one LLM call for the misses.
+    Failed rewrites fall back to the raw note and are not cached."""
+    out: List[Optional[str]] = [_rewrites.get(key) for key in keys]
+    missing = [i for i, text in enumerate(out) if text is None]
+    if missing:
+        shared = await asyncio.to_thread(_redis_rewrites, [keys[i] for i in missing])
+        for i, text in zip(missing, shared):
+            if text is not None:
+                _rewrites.set(keys[i], text)
+                out[i] = text
+        missing = [i for i in missing if out[i] is None]
+    if missing:
+        fresh = await _rewrite([notes[i] for i in missing], [retentions[i] for i in missing])
+        if fresh is None:
+            fresh = [notes[i] for i in missing]
+        else:
+            await asyncio.to_thread(_store_rewrites, [(keys[i], text) for i, text in zip(missing, fresh)])
+        for i, text in zip(missing, fresh):
+            out[i] = text
+    return out
 
-    `mastery` is the full decayed per-KC snapshot. `persona`/`memory` are the
-    top-3 hybrid-retrieved entries, rewritten for current retention. Best-effort:
-    on any embedding/LLM failure it degrades to raw entries rather than raising.
+
+async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable[T]) -> T:
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _load_rows(
+    db: Session, user_id: int, query_kc_ids: Optional[List[int]]
+) -> Tuple[List[Dict], list, list, Dict[str, Dict[int, int]]]:
+    """Mastery snapshot, the candidate persona/memory rows, and per-bank
+    inverted-index hits for the query's KCs.
+
+    Memory candidates are the recent pool plus every older event the KC index
+    says mentions a query KC, so relevant history is reachable however long
+    it is. Semantic scores come from the vector store (cached index / SQL), so
+    the rows are loaded without their embeddings.
     """
     mastery = current_mastery(db, user_id)
-    mastery_by_slug = {m["kc_slug"]: m for m in mastery}
-
-    personas = db.query(StudentPersona).filter(StudentPersona.user_id == user_id).all()
+    query_slugs = kc_index.slugs_for_kc_ids(db, query_kc_ids)
+    kc_hits = {
+        bank: kc_index.lookup(db, bank, user_id, query_slugs)
+        for bank in (vector_repo.PERSONA, vector_repo.MEMORY)
+    }
+    personas = (
+        db.query(StudentPersona)
+        .options(defer(StudentPersona.embedding))
+        .filter(StudentPersona.user_id == user_id)
+        .all()
+    )
     memories = (
         db.query(StudentMemoryEvent)
+        .options(defer(StudentMemoryEvent.embedding))
         .filter(StudentMemoryEvent.user_id == user_id)
         .order_by(StudentMemoryEvent.event_at.desc())
         .limit(_MEMORY_POOL)
         .all()
     )
-    if not personas and not memories:
-        return {"mastery": mastery, "persona": [], "memory": []}
+    recent = {m.id for m in memories}
+    older = [entry_id for entry_id in kc_hits[vector_repo.MEMORY] if entry_id not in recent]
+    if older:
+        memories += (
+            db.query(StudentMemoryEvent)
+            .options(defer(StudentMemoryEvent.embedding))
+            .filter(StudentMemoryEvent.user_id == user_id, StudentMemoryEvent.id.in_(older))
+            .all()
+        )
+    return mastery, personas, memories, kc_hits
 
+
+async def _embed_or_none(query: str) -> Optional[List[float]]:
     try:
-        query_vec = await embed_query_async(query)
+        return await embed_query_async(query)
     except Exception as err:
         print(f"query embed failed, skipping retrieval: {err}")
-        return {"mastery": mastery, "persona": [], "memory": []}
+        return None
 
-    query_slugs = {
-        m["kc_slug"] for m in mastery if query_kc_ids and m.get("kc_id") in query_kc_ids
-    }
-    top_personas = _hybrid_rank(query_vec, query_slugs, personas, TOP_N)
-    top_memories = _hybrid_rank(query_vec, query_slugs, memories, TOP_N)
 
-    persona_text = await _rewrite(
-        [p.description for p in top_personas],
-        [_retention_note(p, mastery_by_slug) for p in top_personas],
+async def build_state(
+    db: Session,
+    user_id: int,
+    query: str,
+    query_kc_ids: Optional[List[int]] = None,
+) -> Dict:
+    """Return `{mastery, persona, memory}` for the current turn.
+
+    `mastery` is the full decayed per-KC snapshot. `persona`/`memory` are the
+    top-3 hybrid-retrieved entries, rewritten for current retention, and
+    `timings_ms` has the per-stage latencies (db and embed overlap). Best-effort:
+    on any embedding/LLM failure it degrades to raw entries rather than raising.
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+
+    def done(persona: List[str], memory: List[str]) -> Dict:
+        timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+        return {"mastery": mastery, "persona": persona, "memory": memory, "timings_ms": timings}
+
+    (mastery, personas, memories, kc_hits), query_vec = await asyncio.gather(
+        _timed(timings, "db", asyncio.to_thread(_load_rows, db, user_id, query_kc_ids)),
+        _timed(timings, "embed", _embed_or_none(query)),
     )
-    memory_text = await _rewrite(
-        [m.summary for m in top_memories],
-        [_retention_note(m, mastery_by_slug) for m in top_memories],
+    if (not personas and not memories) or query_vec is None:
+        return done([], [])
+
+    rank_start = time.perf_counter()
+    mastery_by_slug = {m["kc_slug"]: m for m in mastery}
+    top_personas = _hybrid_rank(
+        db, vector_repo.PERSONA, user_id, query_vec, kc_hits[vector_repo.PERSONA], personas, TOP_N
     )
-    return {"mastery": mastery, "persona": persona_text, "memory": memory_text}
+    top_memories = _hybrid_rank(
+        db, vector_repo.MEMORY, user_id, query_vec, kc_hits[vector_repo.MEMORY], memories, TOP_N
+    )
+    timings["rank"] = round((time.perf_counter() - rank_start) * 1000, 1)
+
+    # Both banks go through a single rewrite round trip (for the cache misses),
+    # then split back.
+    notes = [p.description for p in top_personas] + [m.summary for m in top_memories]
+    retentions = [_retention_note(e, mastery_by_slug) for e in top_personas + top_memories]
+    banks = [vector_repo.PERSONA] * len(top_personas) + [vector_repo.MEMORY] * len(top_memories)
+    keys = [
+        _rewrite_key(bank, e.id, note, ret)
+        for bank, e, note, ret in zip(banks, top_personas + top_memories, notes, retentions)
+    ]
+    rewritten = await _timed(timings, "rewrite", _rewrite_cached(keys, notes, retentions))
+    split = len(top_personas)
+    return done(rewritten[:split], rewritten[split:])
 
 
 def format_state_for_prompt(state: Dict) -> str:
@@ -0,0 +1,117 @@
+"""
+Small process-local caching primitives shared by the service layer.
+
+`TTLCache` is a thread-safe LRU with per-entry expiry and hit/miss counters
+(service code runs both on the event loop and in `asyncio.to_thread` workers).
+`get_redis` hands out one lazily-connected binary Redis client for the
+cross-process tier; it returns None while Redis is unreachable so callers fall
+back to the in-process tier instead of failing the request.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import redis
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU map whose entries also expire `ttl` seconds after insert."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Back off this long after a Redis connection error before trying again, so a
+# missing Redis costs one failed connect per window rather than one per call.
+_REDIS_RETRY_SECONDS = 30.0
+
+_redis_client: Optional[redis.Redis] = None
+_redis_down_until = 0.0
+_redis_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """Shared binary (non-decoding) Redis client, or None if unavailable."""
+    global _redis_client, _redis_down_until
+    if _redis_client is not None:
+        return _redis_client
+    if time.monotonic() < _redis_down_until:
+        return None
+    with _redis_lock:
+        if _redis_client is not None:
+            return _redis_client
+        url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        try:
+            client = redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=0.5)
+            client.ping()
+        except Exception as err:
+            print(f"Redis unavailable at {url}, using in-process cache only: {err}")
+            _redis_down_until = time.monotonic() + _REDIS_RETRY_SECONDS
+            return None
+        _redis_client = client
+        return client
+
+
+def redis_failed(err: Exception) -> None:
+    """Report a failed Redis call: drop the client and back off for a while."""
+    global _redis_client, _redis_down_until
+    print(f"Redis call failed, falling back to in-process cache: {err}")
+    _redis_client = None
+    _redis_down_until = time.monotonic() + _REDIS_RETRY_SECONDS
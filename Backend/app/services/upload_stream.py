@@ -0,0 +1,141 @@
+"""
+Streaming multipart reader for photo uploads.
+
+Declaring `File(...)`/`Form(...)` parameters makes FastAPI parse the whole
+body before the handler runs, with Starlette spooling any file part over 1MB
+to a temporary file. The grading upload instead reads `request.stream()`
+chunk by chunk through python-multipart: each part is buffered in memory and
+the size caps are enforced on the bytes actually received, so an oversized
+upload is rejected as soon as it crosses the cap (or up front, from its
+Content-Length) rather than after it has been read and stored. One file part
+is accepted, and the whole body, file and fields together, is capped at
+`max_file_bytes` plus `MAX_PARTS` small fields, so a request can't buffer
+more than that no matter how it splits its parts.
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+
+try:  # python-multipart >= 0.0.13 renamed its import package
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # pragma: no cover - depends on the installed version
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.getenv("GRADING_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PARTS = 16
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadedFile:
+    filename: str
+    content_type: str
+    data: bytes
+
+
+class _Part:
+    def __init__(self) -> None:
+        self.headers: Dict[bytes, bytes] = {}
+        self.name: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.data = bytearray()
+
+
+async def read_multipart(
+    request: Request,
+    max_file_bytes: int = MAX_UPLOAD_BYTES,
+    max_field_bytes: int = MAX_FIELD_BYTES,
+) -> Tuple[Dict[str, str], Dict[str, UploadedFile]]:
+    """(fields, files) of a multipart/form-data request, read incrementally.
+    Raises `UploadRejected` (413 for size, 400 for malformed bodies)."""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(400, "Expected a multipart/form-data upload")
+    max_body_bytes = max_file_bytes + MAX_PARTS * max_field_bytes
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_body_bytes:
+        raise UploadRejected(413, "File too large")
+
+    fields: Dict[str, str] = {}
+    files: Dict[str, UploadedFile] = {}
+    state = {"part": _Part(), "header": b"", "value": b"", "parts": 0, "received": 0}
+
+    def on_part_begin() -> None:
+        state["parts"] += 1
+        if state["parts"] > MAX_PARTS:
+            raise UploadRejected(400, "Too many form parts")
+        state["part"] = _Part()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        state["header"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        state["value"] += data[start:end]
+
+    def on_header_end() -> None:
+        state["part"].headers[state["header"].lower()] = state["value"]
+        state["header"], state["value"] = b"", b""
+
+    def on_headers_finished() -> None:
+        part = state["part"]
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadRejected(400, "Form part without a name")
+        part.name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            if files:
+                raise UploadRejected(400, "Only one file may be uploaded")
+            part.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        part = state["part"]
+        limit = max_file_bytes if part.filename is not None else max_field_bytes
+        if len(part.data) + (end - start) > limit:
+            raise UploadRejected(413, "File too large" if part.filename is not None else "Form field too large")
+        part.data += data[start:end]
+
+    def on_part_end() -> None:
+        part = state["part"]
+        if part.filename is None:
+            fields[part.name] = part.data.decode("utf-8", "replace")
+        else:
+            files[part.name] = UploadedFile(
+                filename=part.filename,
+                content_type=part.headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+                data=bytes(part.data),
+            )
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    try:
+        async for chunk in request.stream():
+            state["received"] += len(chunk)
+            if state["received"] > max_body_bytes:
+                raise UploadRejected(413, "File too large")
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejected:
+        raise
+    except Exception as err:
+        raise UploadRejected(400, f"Malformed upload: {err}")
+    return fields, files
@@ -1,20 +1,42 @@
 """
-Tiny in-process vector search: pure-Python cosine over JSON-stored embeddings.
+Tiny in-process vector search over the persona / event-memory embeddings.
 
-At current student/entry counts a brute-force scan is trivially fast and keeps
-Phase 1 dependency-free (no pgvector, no numpy). The public surface is kept
-storage-agnostic so a pgvector-backed implementation can drop in later without
-touching call sites.
+`cosine` / `top_k` are the original pure-Python helpers. `VectorIndex` keeps one
+student's embeddings as a contiguous, pre-normalized float32 matrix so a whole
+bank is scored with a single matrix-vector product instead of a Python loop,
+and the decoded vectors survive across requests instead of being re-decoded
+from the row every read. Indexes are cached per (bank, student) and kept current
+incrementally by the write paths (`memory_service`, `persona_service`).
+
+`QuantizedVectorIndex` is the int8 variant for larger pools (4x less memory,
+exact float32 re-scoring of the shortlist). Call sites go through
+`vector_store`, which picks between the in-process float32 index, its int8
+`QuantizedVectorIndex` variant, a pure-Python scan and pgvector.
 """
 import math
-from typing import Callable, List, Sequence, Tuple, TypeVar
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Type, TypeVar
+
+import numpy as np
 
 T = TypeVar("T")
 
+# Bank names used as the first half of the index cache key.
+PERSONA = "persona"
+MEMORY = "memory"
+
+# Per-process cap on cached student indexes; least-recently-used are dropped
+# and simply rebuilt from the DB on their next read.
+MAX_CACHED_INDEXES = 2048
+_INITIAL_CAPACITY = 16
+# Rows of int8 codes widened to float32 per BLAS call in `QuantizedVectorIndex`;
+# small enough for the widened block to stay in cache.
+_DOT_BLOCK = 256
+
 
 def cosine(a: Sequence[float], b: Sequence[float]) -> float:
     """Cosine similarity in [-1, 1]; 0.0 for a zero or mismatched vector."""
-    if not a or not b or len(a) != len(b):
+    if a is None or b is None or len(a) == 0 or len(b) == 0 or len(a) != len(b):
         return 0.0
 
     dot = 0.0
@@ -38,6 +60,451 @@ def top_k(
 ) -> List[Tuple[T, float]]:
     """Rank `items` by cosine to `query_vec`, returning the top `k` as
     `(item, score)` pairs, highest score first."""
-    scored = [(item, cosine(query_vec, embedding_of(item))) for item in items]
-    scored.sort(key=lambda pair: pair[1], reverse=True)
-    return scored[:k]
+    index = VectorIndex()
+    for i, item in enumerate(items):
+        index.add(i, embedding_of(item))
+    return [(items[i], score) for i, score in index.search(query_vec, k)]
+
+
+def _normalize(vec: Sequence[float]) -> np.ndarray:
+    """float32 unit vector; a zero vector stays zero so it scores 0.0."""
+    arr = np.asarray(vec, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm > 0.0 else arr
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the `k` largest scores, highest first (argpartition + sort
+    of just the k survivors)."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < scores.size:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(scores.size)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+class VectorIndex:
+    """One student's bank as a growable `(n, dim)` float32 matrix of unit rows.
+
+    Rows are addressed by an opaque id (the ORM primary key). `add` replaces an
+    existing id in place; `remove` swaps the last row into the hole so the live
+    rows stay contiguous. Mismatched-dimension or empty vectors are stored as
+    zero rows, matching `cosine`'s 0.0-for-garbage behaviour.
+    """
+
+    _DTYPE = np.float32
+
+    def __init__(self, dim: Optional[int] = None) -> None:
+        self.dim = dim
+        self._ids: List[Hashable] = []
+        self._pos: Dict[Hashable, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id: Hashable) -> bool:
+        return item_id in self._pos
+
+    @property
+    def ids(self) -> List[Hashable]:
+        return list(self._ids)
+
+    def missing(self, ids: Iterable[Hashable]) -> List[Hashable]:
+        """The subset of `ids` not indexed yet (to be loaded by the caller)."""
+        return [i for i in ids if i not in self._pos]
+
+    def _row(self, vec: Optional[Sequence[float]]) -> np.ndarray:
+        if vec is None or len(vec) == 0:
+            return np.zeros(self.dim or 0, dtype=np.float32)
+        row = _normalize(vec)
+        if self.dim is None:
+            self.dim = row.size
+        if row.size != self.dim:
+            return np.zeros(self.dim, dtype=np.float32)
+        return row
+
+    def add(self, item_id: Hashable, vec: Optional[Sequence[float]]) -> None:
+        row = self._row(vec)
+        if self.dim is None:
+            # Nothing to size the matrix by yet; remember the id as a zero row.
+            if item_id not in self._pos:
+                self._pos[item_id] = len(self._ids)
+                self._ids.append(item_id)
+            return
+
+        if self._matrix is None:
+            self._grow(max(_INITIAL_CAPACITY, len(self._ids) * 2))
+
+        pos = self._pos.get(item_id)
+        if pos is None:
+            pos = len(self._ids)
+            if pos == self._matrix.shape[0]:
+                self._grow(pos * 2)
+            self._ids.append(item_id)
+            self._pos[item_id] = pos
+        self._put(pos, row)
+
+    # Storage hooks, overridden by `QuantizedVectorIndex`.
+
+    def _grow(self, capacity: int) -> None:
+        grown = np.zeros((capacity, self.dim), dtype=self._DTYPE)
+        if self._matrix is not None:
+            grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+        self._matrix = grown
+
+    def _put(self, pos: int, row: np.ndarray) -> None:
+        self._matrix[pos] = row
+
+    def _move(self, src: int, dst: int) -> None:
+        self._matrix[dst] = self._matrix[src]
+
+    def _dot(self, rows, q: np.ndarray) -> np.ndarray:
+        """Scores of stored `rows` (a slice or position list) against unit `q`."""
+        return self._matrix[rows] @ q
+
+    def add_many(self, pairs: Iterable[Tuple[Hashable, Optional[Sequence[float]]]]) -> None:
+        for item_id, vec in pairs:
+            self.add(item_id, vec)
+
+    def remove(self, item_id: Hashable) -> None:
+        pos = self._pos.pop(item_id, None)
+        if pos is None:
+            return
+        last = len(self._ids) - 1
+        if pos != last:
+            moved = self._ids[last]
+            self._ids[pos] = moved
+            self._pos[moved] = pos
+            if self._matrix is not None:
+                self._move(last, pos)
+        self._ids.pop()
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._pos.clear()
+        self._matrix = None
+
+    def _live(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.zeros((len(self._ids), self.dim or 0), dtype=np.float32)
+        return self._matrix[: len(self._ids)]
+
+    def _query(self, query_vec: Sequence[float]) -> Optional[np.ndarray]:
+        q = _normalize(query_vec) if query_vec is not None and len(query_vec) else None
+        if q is None or self.dim is None or q.size != self.dim:
+            return None
+        return q
+
+    def similarities(self, query_vec: Sequence[float], ids: Sequence[Hashable]) -> np.ndarray:
+        """Cosine of `query_vec` against each of `ids` (aligned; 0.0 for ids
+        not in the index) — one gathered mat-vec."""
+        out = np.zeros(len(ids), dtype=np.float32)
+        q = self._query(query_vec)
+        if q is None or not ids:
+            return out
+        slots = [(i, self._pos[item_id]) for i, item_id in enumerate(ids) if item_id in self._pos]
+        if not slots:
+            return out
+        where, rows = zip(*slots)
+        out[list(where)] = self._dot(list(rows), q)
+        return out
+
+    def vector(self, item_id: Hashable) -> Optional[np.ndarray]:
+        """The stored unit row for `item_id` (a copy), or None if absent."""
+        pos = self._pos.get(item_id)
+        if pos is None or self._matrix is None:
+            return None
+        return self._matrix[pos].copy()
+
+    def search(self, query_vec: Sequence[float], k: int) -> List[Tuple[Hashable, float]]:
+        """Top `k` `(id, score)` pairs over the whole bank, highest first."""
+        if not self._ids:
+            return []
+        q = self._query(query_vec)
+        if q is None:
+            return [(item_id, 0.0) for item_id in self._ids[:k]]
+        scores = self._dot(slice(0, len(self._ids)), q)
+        return [(self._ids[i], float(scores[i])) for i in top_indices(scores, k)]
+
+
+class QuantizedVectorIndex(VectorIndex):
+    """`VectorIndex` holding int8 codes instead of float32 rows (4x smaller).
+
+    Each unit row is scaled so its largest component maps to ±127 and the
+    float32 scale is kept alongside, so a score is `scale · (codes @ q)` with
+    the query left in float32. Quantized scores are only used to pick a
+    shortlist: given a `rescore(ids) -> [(id, vec)]` loader, `similarities`
+    and `search` recompute the `shortlist` best candidates exactly in float32
+    from the source vectors, so the head of the ranking matches `VectorIndex`.
+    """
+
+    _DTYPE = np.int8
+
+    def __init__(self, dim: Optional[int] = None, shortlist: int = 32) -> None:
+        super().__init__(dim)
+        self.shortlist = shortlist
+        self._scales: Optional[np.ndarray] = None
+
+    @property
+    def nbytes(self) -> int:
+        if self._matrix is None:
+            return 0
+        return self._matrix.nbytes + self._scales.nbytes
+
+    def _grow(self, capacity: int) -> None:
+        scales = np.zeros(capacity, dtype=np.float32)
+        if self._scales is not None:
+            scales[: len(self._ids)] = self._scales[: len(self._ids)]
+        self._scales = scales
+        super()._grow(capacity)
+
+    def _put(self, pos: int, row: np.ndarray) -> None:
+        peak = float(np.abs(row).max()) if row.size else 0.0
+        scale = peak / 127.0 if peak > 0.0 else 1.0
+        self._matrix[pos] = np.rint(row / scale).astype(np.int8)
+        self._scales[pos] = scale
+
+    def _move(self, src: int, dst: int) -> None:
+        super()._move(src, dst)
+        self._scales[dst] = self._scales[src]
+
+    def _dot(self, rows, q: np.ndarray) -> np.ndarray:
+        # Widen a block at a time so the mat-vec runs in BLAS without ever
+        # materializing the whole bank as float32.
+        codes, scales = self._matrix[rows], self._scales[rows]
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _DOT_BLOCK):
+            block = slice(start, start + _DOT_BLOCK)
+            out[block] = codes[block].astype(np.float32) @ q
+        return out * scales
+
+    def clear(self) -> None:
+        super().clear()
+        self._scales = None
+
+    def _live(self) -> np.ndarray:
+        if self._matrix is None:
+            return super()._live()
+        n = len(self._ids)
+        return self._matrix[:n].astype(np.float32) * self._scales[:n, None]
+
+    def vector(self, item_id: Hashable) -> Optional[np.ndarray]:
+        pos = self._pos.get(item_id)
+        if pos is None or self._matrix is None:
+            return None
+        return self._matrix[pos].astype(np.float32) * self._scales[pos]
+
+    def _rescore(
+        self,
+        q: np.ndarray,
+        ids: Sequence[Hashable],
+        scores: np.ndarray,
+        rescore: Callable[[List[Hashable]], Iterable[Tuple[Hashable, Optional[Sequence[float]]]]],
+        shortlist: int,
+    ) -> None:
+        """Overwrite the top-`shortlist` entries of `scores` with exact cosines."""
+        head = top_indices(scores, shortlist)
+        exact = {item_id: vec for item_id, vec in rescore([ids[i] for i in head])}
+        for i in head:
+            vec = exact.get(ids[i])
+            if vec is not None and len(vec) == q.size:
+                scores[i] = float(_normalize(vec) @ q)
+
+    def similarities(
+        self,
+        query_vec: Sequence[float],
+        ids: Sequence[Hashable],
+        rescore: Optional[Callable] = None,
+        shortlist: Optional[int] = None,
+    ) -> np.ndarray:
+        out = super().similarities(query_vec, ids)
+        q = self._query(query_vec)
+        if rescore is not None and q is not None and len(ids):
+            self._rescore(q, ids, out, rescore, shortlist or self.shortlist)
+        return out
+
+    def search(
+        self, query_vec: Sequence[float], k: int, rescore: Optional[Callable] = None
+    ) -> List[Tuple[Hashable, float]]:
+        q = self._query(query_vec)
+        if rescore is None or q is None:
+            return super().search(query_vec, k)
+        scores = self._dot(slice(0, len(self._ids)), q)
+        self._rescore(q, self._ids, scores, rescore, max(k, self.shortlist))
+        return [(self._ids[i], float(scores[i])) for i in top_indices(scores, k)]
+
+
+class IVFIndex:
+    """Approximate nearest neighbours over a large, growing pool (inverted file).
+
+    A spherical k-means coarse quantizer splits unit vectors into `nlist`
+    cells, each its own `VectorIndex`; a query scans only the `nprobe` cells
+    whose centroids are closest, so cost grows with ~n/nlist·nprobe instead of
+    n. Adds are incremental (nearest-centroid assignment). Below
+    `min_train` vectors everything lives in one cell, i.e. exact search;
+    `needs_retrain` turns true once the pool has doubled since the centroids
+    were fit, and `train` re-buckets every vector in place.
+    """
+
+    def __init__(self, nprobe: int = 8, min_train: int = 512, seed: int = 0) -> None:
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._cells: List[VectorIndex] = [VectorIndex()]
+        self._cell_of: Dict[Hashable, int] = {}
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, item_id: Hashable) -> bool:
+        return item_id in self._cell_of
+
+    @property
+    def nlist(self) -> int:
+        return len(self._cells)
+
+    @property
+    def needs_retrain(self) -> bool:
+        n = len(self._cell_of)
+        if self._centroids is None:
+            return n >= self.min_train
+        return n >= 2 * self._trained_size
+
+    def _nearest_cells(self, q: np.ndarray, count: int) -> np.ndarray:
+        if self._centroids is None:
+            return np.zeros(1, dtype=np.intp)
+        return top_indices(self._centroids @ q, count)
+
+    def add(self, item_id: Hashable, vec: Optional[Sequence[float]]) -> None:
+        self.remove(item_id)
+        cell = 0
+        if self._centroids is not None and vec is not None and len(vec) == self._centroids.shape[1]:
+            cell = int(self._nearest_cells(_normalize(vec), 1)[0])
+        self._cells[cell].add(item_id, vec)
+        self._cell_of[item_id] = cell
+
+    def remove(self, item_id: Hashable) -> None:
+        cell = self._cell_of.pop(item_id, None)
+        if cell is not None:
+            self._cells[cell].remove(item_id)
+
+    def vector(self, item_id: Hashable) -> Optional[np.ndarray]:
+        cell = self._cell_of.get(item_id)
+        return None if cell is None else self._cells[cell].vector(item_id)
+
+    def train(self, nlist: Optional[int] = None, iterations: int = 10) -> None:
+        """Fit `nlist` centroids (default ~4·sqrt(n)) on a sample, then
+        re-bucket every stored vector."""
+        ids: List[Hashable] = []
+        rows: List[np.ndarray] = []
+        for cell in self._cells:
+            if len(cell) and cell.dim is not None:
+                ids.extend(cell.ids)
+                rows.append(cell._live())
+        if not rows:
+            return
+        data = np.vstack(rows)
+        n = data.shape[0]
+        nlist = min(nlist or max(1, int(4 * math.sqrt(n))), n, 4096)
+
+        sample_size = min(n, 64 * nlist)
+        sample = data[self._rng.choice(n, size=sample_size, replace=False)]
+        centroids = sample[self._rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = float(np.linalg.norm(centroid))
+                    if norm > 0.0:
+                        centroids[c] = centroid / norm
+
+        assign = np.argmax(data @ centroids.T, axis=1)
+        cells = [VectorIndex(dim=data.shape[1]) for _ in range(nlist)]
+        cell_of: Dict[Hashable, int] = {}
+        for item_id, row, c in zip(ids, data, assign):
+            cells[c].add(item_id, row)
+            cell_of[item_id] = int(c)
+        for item_id in self._cell_of:
+            if item_id not in cell_of:  # zero/empty vectors: park in cell 0
+                cells[0].add(item_id, None)
+                cell_of[item_id] = 0
+        self._centroids, self._cells, self._cell_of = centroids, cells, cell_of
+        self._trained_size = n
+
+    def search(
+        self, query_vec: Sequence[float], k: int, nprobe: Optional[int] = None
+    ) -> List[Tuple[Hashable, float]]:
+        """Approximate top `k` `(id, score)` pairs, highest first."""
+        if not self._cell_of or query_vec is None or len(query_vec) == 0:
+            return []
+        q = _normalize(query_vec)
+        if self._centroids is not None and q.size != self._centroids.shape[1]:
+            return []
+        hits: List[Tuple[Hashable, float]] = []
+        for cell in self._nearest_cells(q, nprobe or self.nprobe):
+            hits.extend(self._cells[int(cell)].search(q, k))
+        hits.sort(key=lambda pair: pair[1], reverse=True)
+        return hits[:k]
+
+
+_INDEXES: "OrderedDict[Tuple[str, int], VectorIndex]" = OrderedDict()
+
+
+def get_index(bank: str, user_id: int, kind: Type[VectorIndex] = VectorIndex) -> VectorIndex:
+    """The cached index for one student's bank, created empty on first use
+    (or rebuilt if the cached one is a different `kind`)."""
+    key = (bank, user_id)
+    index = _INDEXES.get(key)
+    if index is None or type(index) is not kind:
+        index = kind()
+        _INDEXES[key] = index
+        while len(_INDEXES) > MAX_CACHED_INDEXES:
+            _INDEXES.popitem(last=False)
+    else:
+        _INDEXES.move_to_end(key)
+    return index
+
+
+def index_add(bank: str, user_id: int, item_id: Hashable, vec: Optional[Sequence[float]]) -> None:
+    """Write-path hook: add/replace one row in an already-cached index. A cold
+    student is left alone — the read path builds the index lazily."""
+    index = _INDEXES.get((bank, user_id))
+    if index is not None:
+        index.add(item_id, vec)
+
+
+def index_remove(bank: str, user_id: int, item_id: Hashable) -> None:
+    index = _INDEXES.get((bank, user_id))
+    if index is not None:
+        index.remove(item_id)
+
+
+def index_reset(bank: str, user_id: int) -> None:
+    """Drop a student's cached bank (e.g. the persona bank is replaced wholesale)."""
+    index = _INDEXES.get((bank, user_id))
+    if index is not None:
+        index.clear()
+
+
+def ensure_indexed(
+    bank: str,
+    user_id: int,
+    ids: Sequence[Hashable],
+    load: Callable[[List[Hashable]], Iterable[Tuple[Hashable, Optional[Sequence[float]]]]],
+    kind: Type[VectorIndex] = VectorIndex,
+) -> VectorIndex:
+    """Return the student's index with every id in `ids` present, calling
+    `load(missing_ids)` once for whatever isn't cached yet. Rows written by
+    another worker process are picked up here."""
+    index = get_index(bank, user_id, kind)
+    missing = index.missing(ids)
+    if missing:
+        index.add_many(load(missing))
+    return index
@@ -0,0 +1,269 @@
+"""
+Pluggable vector storage/ranking backends for the persona and memory banks.
+
+Every backend answers the same two read questions for one student's bank —
+"cosine of this query against these rows" and "top-k rows for this query" — and
+gets the same write hooks, so `student_state_service` and the write paths never
+know which one is active. Selected by `VECTOR_STORE_BACKEND`:
+
+  numpy     (default) cached per-student float32 matrices (`vector_repo.VectorIndex`)
+  int8      the same cache as int8 codes (`vector_repo.QuantizedVectorIndex`); the
+            top `VECTOR_RESCORE_SHORTLIST` candidates are re-scored exactly from
+            the stored float32 blobs
+  python    brute-force pure-Python cosine over the stored rows; works on any DB
+            (SQLite included) and is the reference the others are tested against
+  pgvector  Postgres `vector` column + HNSW index; cosine ranking and the
+            `user_id` filter run in SQL so rows never leave the database (small
+            banks are ranked by an exact scan, see `PgVectorStore.search`)
+"""
+import os
+from typing import Hashable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database.models import StudentMemoryEvent, StudentPersona
+from app.services import vector_repo
+
+BANK_MODELS = {
+    vector_repo.PERSONA: StudentPersona,
+    vector_repo.MEMORY: StudentMemoryEvent,
+}
+
+
+class VectorStore(Protocol):
+    name: str
+
+    def similarities(
+        self, db: Session, bank: str, user_id: int, query_vec: Sequence[float], ids: Sequence[int]
+    ) -> np.ndarray:
+        """Cosine of `query_vec` against each of `ids` (aligned; 0.0 when a row
+        has no usable embedding)."""
+        ...
+
+    def search(
+        self, db: Session, bank: str, user_id: int, query_vec: Sequence[float], k: int
+    ) -> List[Tuple[int, float]]:
+        """Top `k` `(id, score)` pairs over the student's whole bank."""
+        ...
+
+    def add(self, db: Session, bank: str, user_id: int, item_id: int, vec: Optional[Sequence[float]]) -> None:
+        """Write hook, called after the row is flushed and before commit."""
+        ...
+
+    def reset(self, db: Session, bank: str, user_id: int) -> None:
+        """Write hook: the student's bank is being replaced wholesale."""
+        ...
+
+
+RESCORE_SHORTLIST = int(os.getenv("VECTOR_RESCORE_SHORTLIST", "32"))
+# pgvector: banks up to this many rows skip the HNSW index for an exact scan;
+# larger ones walk it with at least this `hnsw.ef_search` (pgvector caps it at 1000).
+PG_EXACT_SCAN_ROWS = int(os.getenv("PGVECTOR_EXACT_SCAN_ROWS", "2000"))
+PG_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "200"))
+
+
+def _load_embeddings(db: Session, bank: str, ids: Sequence[Hashable]):
+    model = BANK_MODELS[bank]
+    return db.query(model.id, model.embedding).filter(model.id.in_(ids)).all()
+
+
+def _user_ids(db: Session, bank: str, user_id: int) -> List[int]:
+    model = BANK_MODELS[bank]
+    return [row_id for (row_id,) in db.query(model.id).filter(model.user_id == user_id)]
+
+
+class PythonVectorStore:
+    """Reads every candidate row and scores it with `vector_repo.cosine`."""
+
+    name = "python"
+
+    def similarities(self, db, bank, user_id, query_vec, ids):
+        if not ids:
+            return np.zeros(0, dtype=np.float32)
+        by_id = dict(_load_embeddings(db, bank, ids))
+        return np.array(
+            [vector_repo.cosine(query_vec, by_id.get(i)) for i in ids], dtype=np.float32
+        )
+
+    def search(self, db, bank, user_id, query_vec, k):
+        model = BANK_MODELS[bank]
+        rows = db.query(model.id, model.embedding).filter(model.user_id == user_id).all()
+        scored = [(row_id, vector_repo.cosine(query_vec, vec)) for row_id, vec in rows]
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:k]
+
+    def add(self, db, bank, user_id, item_id, vec):
+        pass
+
+    def reset(self, db, bank, user_id):
+        pass
+
+
+class NumpyVectorStore:
+    """Process-local `VectorIndex` per (bank, student), filled lazily from the DB
+    and kept current by the write hooks."""
+
+    name = "numpy"
+    index_kind = vector_repo.VectorIndex
+
+    def _index(self, db, bank, user_id, ids):
+        return vector_repo.ensure_indexed(
+            bank, user_id, ids, lambda missing: _load_embeddings(db, bank, missing), self.index_kind
+        )
+
+    def similarities(self, db, bank, user_id, query_vec, ids):
+        if not ids:
+            return np.zeros(0, dtype=np.float32)
+        return self._index(db, bank, user_id, ids).similarities(query_vec, ids)
+
+    def search(self, db, bank, user_id, query_vec, k):
+        ids = _user_ids(db, bank, user_id)
+        if not ids:
+            return []
+        index = self._index(db, bank, user_id, ids)
+        sims = index.similarities(query_vec, ids)
+        return [(ids[i], float(sims[i])) for i in vector_repo.top_indices(sims, k)]
+
+    def add(self, db, bank, user_id, item_id, vec):
+        vector_repo.index_add(bank, user_id, item_id, vec)
+
+    def reset(self, db, bank, user_id):
+        vector_repo.index_reset(bank, user_id)
+
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """`NumpyVectorStore` over int8 indexes; quantized dot products pick the
+    shortlist, which is then re-scored exactly from the DB rows."""
+
+    name = "int8"
+    index_kind = vector_repo.QuantizedVectorIndex
+
+    def similarities(self, db, bank, user_id, query_vec, ids, shortlist=None):
+        if not ids:
+            return np.zeros(0, dtype=np.float32)
+        return self._index(db, bank, user_id, ids).similarities(
+            query_vec, ids, lambda head: _load_embeddings(db, bank, head), shortlist or RESCORE_SHORTLIST
+        )
+
+    def search(self, db, bank, user_id, query_vec, k):
+        ids = _user_ids(db, bank, user_id)
+        if not ids:
+            return []
+        sims = self.similarities(db, bank, user_id, query_vec, ids, max(k, RESCORE_SHORTLIST))
+        return [(ids[i], float(sims[i])) for i in vector_repo.top_indices(sims, k)]
+
+
+def _pg_literal(vec: Sequence[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in np.asarray(vec, dtype=np.float32)) + "]"
+
+
+class PgVectorStore:
+    """Postgres + pgvector. Needs migration d4e5f6a7b8c9 (the `embedding_vec`
+    column and HNSW index); rows are mirrored into it by `add`."""
+
+    name = "pgvector"
+
+    def similarities(self, db, bank, user_id, query_vec, ids):
+        out = np.zeros(len(ids), dtype=np.float32)
+        if not ids or query_vec is None or len(query_vec) == 0:
+            return out
+        table = BANK_MODELS[bank].__tablename__
+        rows = db.execute(
+            text(
+                f"SELECT id, 1 - (embedding_vec <=> CAST(:q AS vector)) FROM {table} "
+                "WHERE user_id = :user_id AND id = ANY(:ids) AND embedding_vec IS NOT NULL"
+            ),
+            {"q": _pg_literal(query_vec), "user_id": user_id, "ids": list(ids)},
+        ).fetchall()
+        pos = {item_id: i for i, item_id in enumerate(ids)}
+        for row_id, score in rows:
+            out[pos[row_id]] = score
+        return out
+
+    def search(self, db, bank, user_id, query_vec, k):
+        """The HNSW index covers every student's rows and the `user_id` filter
+        is applied to what it returns, so for a small bank the graph walk can
+        come back with fewer than `k` of the student's rows. Banks up to
+        `PG_EXACT_SCAN_ROWS` are ranked exactly; larger ones walk the index
+        with `hnsw.ef_search` raised and fall back to the exact scan if the
+        walk still comes up short."""
+        if query_vec is None or len(query_vec) == 0 or k <= 0:
+            return []
+        table = BANK_MODELS[bank].__tablename__
+        params = {"q": _pg_literal(query_vec), "user_id": user_id, "k": k}
+        count = db.execute(
+            text(f"SELECT count(*) FROM {table} WHERE user_id = :user_id AND embedding_vec IS NOT NULL"),
+            params,
+        ).scalar()
+        if count <= PG_EXACT_SCAN_ROWS:
+            return self._exact_search(db, table, params)
+
+        # SET LOCAL lasts until the end of the session's current transaction.
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {min(max(PG_EF_SEARCH, k), 1000)}"))
+        rows = db.execute(
+            text(
+                f"SELECT id, 1 - (embedding_vec <=> CAST(:q AS vector)) AS score FROM {table} "
+                "WHERE user_id = :user_id AND embedding_vec IS NOT NULL "
+                "ORDER BY embedding_vec <=> CAST(:q AS vector) LIMIT :k"
+            ),
+            params,
+        ).fetchall()
+        if len(rows) < min(k, count):
+            return self._exact_search(db, table, params)
+        return [(row_id, float(score)) for row_id, score in rows]
+
+    @staticmethod
+    def _exact_search(db, table, params):
+        # Ordering by the score expression rather than the bare distance
+        # operator keeps the planner off the HNSW index: the student's rows
+        # are found through `user_id` and ranked exactly.
+        rows = db.execute(
+            text(
+                f"SELECT id, 1 - (embedding_vec <=> CAST(:q AS vector)) AS score FROM {table} "
+                "WHERE user_id = :user_id AND embedding_vec IS NOT NULL "
+                "ORDER BY score DESC LIMIT :k"
+            ),
+            params,
+        ).fetchall()
+        return [(row_id, float(score)) for row_id, score in rows]
+
+    def add(self, db, bank, user_id, item_id, vec):
+        if vec is None or len(vec) == 0:
+            return
+        table = BANK_MODELS[bank].__tablename__
+        db.execute(
+            text(f"UPDATE {table} SET embedding_vec = CAST(:v AS vector) WHERE id = :id"),
+            {"v": _pg_literal(vec), "id": item_id},
+        )
+
+    def reset(self, db, bank, user_id):
+        pass  # rows (and their vectors) are deleted by the caller
+
+
+_BACKENDS = {
+    "python": PythonVectorStore,
+    "numpy": NumpyVectorStore,
+    "int8": QuantizedVectorStore,
+    "pgvector": PgVectorStore,
+}
+
+_store: Optional[VectorStore] = None
+
+
+def make_vector_store(name: str) -> VectorStore:
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown VECTOR_STORE_BACKEND {name!r}; expected one of {sorted(_BACKENDS)}"
+        )
+
+
+def get_vector_store() -> VectorStore:
+    """The process-wide backend named by `VECTOR_STORE_BACKEND` (default numpy)."""
+    global _store
+    if _store is None:
+        _store = make_vector_store(os.getenv("VECTOR_STORE_BACKEND", "numpy").lower())
+    return _store
@@ -0,0 +1,124 @@
+"""
+Side-by-side eval of grading-image preprocessing (`app.services.image_preprocessing`).
+
+For each photo in a manifest, reports the bytes and time preprocessing takes,
+and with --grade, grades the photo twice through Gemini: once as uploaded,
+once preprocessed. The summary gives grade agreement between the two arms,
+mean |grade difference|, error against a reference grade when the manifest
+has one, and mean model latency per arm. Use it to tune the settings before
+changing them in production.
+
+Manifest: a JSON list of
+  {"image": "path/relative/to/manifest.jpg", "question_text": "...",
+   "correct_solution": "...", "expected_grade": "7/10"}   # expected_grade optional
+
+Usage:
+  python scripts/eval_image_preprocessing.py photos/manifest.json                 # sizes only
+  GEMINI_API_KEY=... python scripts/eval_image_preprocessing.py photos/manifest.json --grade
+  python scripts/eval_image_preprocessing.py photos/manifest.json --max-edge 1200 --quality 70
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from statistics import mean
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services import image_preprocessing
+
+
+def _points(grade: Optional[str]) -> Optional[float]:
+    try:
+        got, _, out_of = str(grade).partition("/")
+        return float(got) / (float(out_of) or 10.0) * 10.0
+    except (TypeError, ValueError):
+        return None
+
+
+async def _grade(service, item: Dict, path: Path, preprocess: bool) -> Dict:
+    start = time.perf_counter()
+    result = await service.generate_photo_grading(
+        item["question_text"], item["correct_solution"], str(path), preprocess=preprocess
+    )
+    return {"grade": result.get("grade"), "seconds": time.perf_counter() - start}
+
+
+async def run(manifest: Path, grade: bool, out: Optional[Path]) -> None:
+    items: List[Dict] = json.loads(manifest.read_text())
+    service = None
+    if grade:
+        from app.services.gemini_service import GeminiService
+
+        service = GeminiService()
+
+    rows = []
+    for item in items:
+        path = manifest.parent / item["image"]
+        processed = image_preprocessing.preprocess(path.read_bytes())
+        row = {
+            "image": item["image"],
+            "bytes_raw": processed.original_bytes,
+            "bytes_processed": len(processed.data),
+            "preprocess_ms": round(processed.elapsed_ms, 1),
+            "steps": processed.steps,
+            "expected": item.get("expected_grade"),
+        }
+        if service is not None:
+            raw, small = await asyncio.gather(_grade(service, item, path, False), _grade(service, item, path, True))
+            row.update(
+                grade_raw=raw["grade"], grade_processed=small["grade"],
+                seconds_raw=round(raw["seconds"], 2), seconds_processed=round(small["seconds"], 2),
+            )
+        rows.append(row)
+        print(json.dumps(row))
+
+    if out is not None:
+        out.write_text("".join(json.dumps(r) + "\n" for r in rows))
+
+    raw_total = sum(r["bytes_raw"] for r in rows)
+    processed_total = sum(r["bytes_processed"] for r in rows)
+    print(f"\n{len(rows)} images: {raw_total / 1e6:.1f}MB -> {processed_total / 1e6:.1f}MB "
+          f"({(1 - processed_total / max(raw_total, 1)) * 100:.0f}% saved), "
+          f"mean preprocess {mean(r['preprocess_ms'] for r in rows):.0f}ms")
+    if service is None:
+        return
+
+    pairs = [(_points(r["grade_raw"]), _points(r["grade_processed"]), _points(r["expected"])) for r in rows]
+    graded = [(a, b, e) for a, b, e in pairs if a is not None and b is not None]
+    if graded:
+        print(f"grade agreement: {sum(a == b for a, b, _ in graded) / len(graded):.0%}, "
+              f"mean |raw - processed| = {mean(abs(a - b) for a, b, _ in graded):.2f} points")
+    labelled = [(a, b, e) for a, b, e in graded if e is not None]
+    if labelled:
+        print(f"MAE vs expected: raw {mean(abs(a - e) for a, _, e in labelled):.2f}, "
+              f"processed {mean(abs(b - e) for _, b, e in labelled):.2f}")
+    print(f"mean model latency: raw {mean(r['seconds_raw'] for r in rows):.2f}s, "
+          f"processed {mean(r['seconds_processed'] for r in rows):.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", type=Path)
+    parser.add_argument("--grade", action="store_true", help="grade both arms through Gemini")
+    parser.add_argument("--max-edge", type=int, default=image_preprocessing.MAX_EDGE)
+    parser.add_argument("--quality", type=int, default=image_preprocessing.JPEG_QUALITY)
+    parser.add_argument("--no-gray", action="store_true")
+    parser.add_argument("--no-crop", action="store_true")
+    parser.add_argument("--out", type=Path, help="write per-image rows as JSONL")
+    args = parser.parse_args()
+
+    # The settings under test apply to both this script's preprocessing and
+    # the grading call's.
+    image_preprocessing.MAX_EDGE = args.max_edge
+    image_preprocessing.JPEG_QUALITY = args.quality
+    image_preprocessing.GRAYSCALE = not args.no_gray
+    image_preprocessing.CROP = not args.no_crop
+    asyncio.run(run(args.manifest, args.grade, args.out))
+
+
+if __name__ == "__main__":
+    main()
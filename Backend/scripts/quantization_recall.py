@@ -0,0 +1,121 @@
+"""
+Recall@k report for int8-quantized vector search against the exact float32 path.
+
+For each query, the exact top-k (`vector_repo.VectorIndex`) is compared with
+  * int8 only      — `QuantizedVectorIndex` ranking by quantized scores
+  * int8+rescore   — the same, with the shortlist re-scored exactly in float32
+and the report prints mean recall@k, per-query latency and index memory.
+
+Vectors come from a bank in the database (queries are held-out rows of the same
+bank), or from a synthetic clustered pool with --synthetic N.
+
+Usage:
+  DATABASE_URL=... python scripts/quantization_recall.py --bank memory --k 10
+  python scripts/quantization_recall.py --synthetic 50000 --dim 768 --k 10 --shortlist 64
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.services.vector_repo import QuantizedVectorIndex, VectorIndex
+from app.services.vector_store import BANK_MODELS
+
+
+def get_engine():
+    db_url = os.environ.get("DATABASE_URL", "sqlite:///./kc_mapping_test.db")
+    connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+    return create_engine(db_url, connect_args=connect_args)
+
+
+def load_bank(bank: str, limit: int) -> np.ndarray:
+    model = BANK_MODELS[bank]
+    session = Session(get_engine())
+    try:
+        rows = (
+            session.query(model.embedding)
+            .filter(model.embedding.isnot(None))
+            .order_by(model.id)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        session.close()
+    return np.array([vec for (vec,) in rows], dtype=np.float32)
+
+
+def synthetic(n: int, dim: int, seed: int) -> np.ndarray:
+    """Clustered Gaussian pool, closer to real embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 200), dim))
+    return (centers[rng.integers(0, len(centers), size=n)] + 0.5 * rng.normal(size=(n, dim))).astype(
+        np.float32
+    )
+
+
+def timed(fn) -> Tuple[list, float]:
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def report(data: np.ndarray, queries: int, k: int, shortlist: int) -> None:
+    queries = min(queries, len(data) // 2)
+    held_out, pool = data[:queries], data[queries:]
+    exact, quant = VectorIndex(), QuantizedVectorIndex(shortlist=shortlist)
+    for i, vec in enumerate(pool):
+        exact.add(i, vec)
+        quant.add(i, vec)
+    rescore = lambda head: [(i, pool[i]) for i in head]
+
+    recall = {"int8 only": [], "int8+rescore": []}
+    ms = {"exact": 0.0, "int8 only": 0.0, "int8+rescore": 0.0}
+    for query in held_out:
+        truth, t = timed(lambda: exact.search(query, k))
+        ms["exact"] += t
+        truth_ids = {i for i, _ in truth}
+        for label, run in (
+            ("int8 only", lambda: quant.search(query, k)),
+            ("int8+rescore", lambda: quant.search(query, k, rescore=rescore)),
+        ):
+            hits, t = timed(run)
+            ms[label] += t
+            recall[label].append(len(truth_ids & {i for i, _ in hits}) / k)
+
+    print(f"pool={len(pool)} dim={pool.shape[1]} queries={queries} k={k} shortlist={shortlist}")
+    print(f"memory: float32 {exact._matrix.nbytes / 1e6:.1f} MB, int8 {quant.nbytes / 1e6:.1f} MB")
+    print(f"{'path':<14} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{'exact':<14} {1.0:>9.4f} {ms['exact'] / queries:>9.3f}")
+    for label, values in recall.items():
+        print(f"{label:<14} {float(np.mean(values)):>9.4f} {ms[label] / queries:>9.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall@k of int8 vs exact vector search")
+    parser.add_argument("--bank", choices=list(BANK_MODELS), default="memory", help="DB bank to read")
+    parser.add_argument("--limit", type=int, default=100000, help="Max rows to read from the bank")
+    parser.add_argument("--synthetic", type=int, default=None, help="Use N synthetic vectors instead")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out query vectors")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shortlist", type=int, default=32, help="Candidates re-scored in float32")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = synthetic(args.synthetic, args.dim, args.seed) if args.synthetic else load_bank(args.bank, args.limit)
+    if len(data) < 2 * args.k:
+        sys.exit(f"need at least {2 * args.k} vectors, found {len(data)}")
+    np.random.default_rng(args.seed).shuffle(data)
+    report(data, args.queries, args.k, max(args.shortlist, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Rebuild `kc_mastery` from the `attempt_events` log (`app.services.attempt_replay`),
+e.g. after fitting new BKT params, fixing the update, or remapping questions.
+
+Streams students in chunks, committing each chunk with its progress in
+`mastery_rebuilds`; if interrupted, --resume continues the latest unfinished
+rebuild after the last committed student.
+
+Usage:
+  DATABASE_URL=... python scripts/rebuild_mastery.py
+  DATABASE_URL=... python scripts/rebuild_mastery.py --remap --chunk-users 200
+  DATABASE_URL=... python scripts/rebuild_mastery.py --resume
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.services import attempt_replay
+
+
+def get_engine():
+    db_url = os.environ.get("DATABASE_URL", "sqlite:///./kc_mapping_test.db")
+    connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+    return create_engine(db_url, connect_args=connect_args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild kc_mastery from attempt_events")
+    parser.add_argument("--remap", action="store_true", help="Use today's question_kc, not the logged KC weights")
+    parser.add_argument("--resume", action="store_true", help="Continue the latest unfinished rebuild")
+    parser.add_argument("--chunk-users", type=int, default=attempt_replay.CHUNK_USERS)
+    parser.add_argument("--max-chunks", type=int, help="Stop after this many chunks (resume later)")
+    args = parser.parse_args()
+
+    session = Session(get_engine())
+    try:
+        rebuild = attempt_replay.latest_unfinished(session) if args.resume else None
+        if args.resume and rebuild is None:
+            print("no unfinished rebuild to resume")
+            return
+        if rebuild is None:
+            rebuild = attempt_replay.start(session, remap=args.remap)
+        print(f"rebuild {rebuild.id} (remap={rebuild.remap}) from user > {rebuild.last_user_id}")
+
+        start = time.perf_counter()
+        report = lambda r: print(
+            f"  through user {r.last_user_id}: {r.n_users} students, {r.n_events} events "
+            f"({time.perf_counter() - start:.1f}s)"
+        )
+        rebuild = attempt_replay.run(
+            session, rebuild, chunk_users=args.chunk_users, max_chunks=args.max_chunks, progress=report
+        )
+        print("finished" if rebuild.finished_at else "stopped early (pass --resume to continue)")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
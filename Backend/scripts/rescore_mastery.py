@@ -0,0 +1,79 @@
+"""
+Dry run of a mastery rebuild: replays `attempt_events` exactly as
+`scripts/rebuild_mastery.py` would (`app.services.attempt_replay`) and reports
+how far the rebuilt rows are from the stored ones, e.g. to judge new BKT
+parameters or a remap before applying them. Never writes; apply with
+`rebuild_mastery.py`.
+
+Usage:
+  DATABASE_URL=... python scripts/rescore_mastery.py
+  DATABASE_URL=... python scripts/rescore_mastery.py --user 12 --user 40
+  DATABASE_URL=... python scripts/rescore_mastery.py --remap
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.services import attempt_replay, mastery_engine
+
+
+def get_engine():
+    db_url = os.environ.get("DATABASE_URL", "sqlite:///./kc_mapping_test.db")
+    connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+    return create_engine(db_url, connect_args=connect_args)
+
+
+def _chunks(session: Session, users, chunk_users: int):
+    if users:
+        for start in range(0, len(users), chunk_users):
+            yield sorted(users)[start:start + chunk_users]
+        return
+    after = 0
+    while True:
+        chunk = attempt_replay.next_users(session, after, chunk_users)
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report what a kc_mastery rebuild would change (dry run)")
+    parser.add_argument("--user", type=int, action="append", help="Limit to these student ids")
+    parser.add_argument("--remap", action="store_true", help="Use today's question_kc, not the logged KC weights")
+    parser.add_argument("--chunk-users", type=int, default=attempt_replay.CHUNK_USERS)
+    args = parser.parse_args()
+
+    session = Session(get_engine())
+    try:
+        start = time.perf_counter()
+        diffs, n_states, n_new, n_orphaned = [], 0, 0, 0
+        for user_ids in _chunks(session, args.user, args.chunk_users):
+            rebuilt = attempt_replay.preview(session, user_ids, remap=args.remap)
+            stored = mastery_engine.load_frame(session, user_ids)
+            before = {(u, k): p for u, k, p in zip(stored.user_id.tolist(), stored.kc_id.tolist(), stored.p_mastery)}
+            n_states += len(rebuilt)
+            n_new += sum(1 for pair in rebuilt if pair not in before)
+            n_orphaned += sum(1 for pair in before if pair not in rebuilt)
+            diffs.extend(abs(row["p_mastery"] - before[pair]) for pair, row in rebuilt.items() if pair in before)
+        elapsed = time.perf_counter() - start
+
+        print(f"replayed into {n_states} states in {elapsed:.2f}s: {n_new} new rows, {n_orphaned} rows would be deleted")
+        if diffs:
+            diffs = np.array(diffs)
+            print(f"|rebuilt - stored| mean {diffs.mean():.4f}, max {diffs.max():.4f} over {diffs.size} rows")
+        print("dry run (apply with scripts/rebuild_mastery.py)")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
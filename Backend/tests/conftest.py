@@ -0,0 +1,35 @@
+"""Shared fixtures: a fresh in-memory SQLite schema per test, with Redis
+switched off for the mastery snapshots and the process-wide KC registry and
+snapshot caches reset around it. Test files add only their seed data."""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database.models import Base
+from app.services import kc_registry, mastery_service
+
+
+def _reset_caches() -> None:
+    kc_registry.invalidate()
+    mastery_service._snapshots.clear()
+    mastery_service._versions.clear()
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """One in-memory database shared by every session and thread of the test."""
+    monkeypatch.setattr(mastery_service, "get_redis", lambda: None)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    _reset_caches()
+    yield engine
+    _reset_caches()
+    engine.dispose()
+
+
+@pytest.fixture
+def empty_db(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
@@ -0,0 +1,83 @@
+"""Offline BKT EM: parameter recovery, held-out report, and the params table."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.database.models import (
+    FittedBktParams,
+    GradingSession,
+    KnowledgeComponent,
+    QuestionKC,
+    StudentUser,
+)
+from app.services import bkt_fitting as bf
+from app.services.mastery_service import _TIER_PARAMS, params_for_kc
+
+TRUE = np.array([[0.30, 0.12, 0.08, 0.22], [0.15, 0.08, 0.12, 0.15]])
+START = np.full((2, 4), [0.25, 0.15, 0.10, 0.20])
+
+
+def test_em_recovers_generating_params():
+    groups = np.arange(6000) % 2
+    chain, correct, times = bf.simulate(TRUE, groups, length=15, seed=1)
+    chains = bf.Chains.build(chain, groups, correct, times)
+
+    fitted, ll, iterations = bf.fit_em(chains, START)
+    assert np.abs(fitted - TRUE).max() < 0.03
+    assert ll > bf.log_likelihood(chains, START)
+    assert iterations < 100
+
+
+def test_chains_ignore_event_order():
+    groups = np.zeros(50, dtype=np.int64)
+    chain, correct, times = bf.simulate(TRUE[:1], groups, length=8, seed=2)
+    shuffled = np.random.default_rng(0).permutation(chain.size)
+    in_order = bf.Chains.build(chain, groups, correct, times)
+    scrambled = bf.Chains.build(chain[shuffled], groups, correct[shuffled], times[shuffled])
+    assert bf.log_likelihood(scrambled, TRUE[:1]) == pytest.approx(bf.log_likelihood(in_order, TRUE[:1]))
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    n_students, length = 60, 12
+    session.add(KnowledgeComponent(
+        id=1, slug="kc1", name="KC 1", ib_topic_ref="1.1", domain="Algebra",
+        description="d", difficulty_tier="SL_core",
+    ))
+    session.add(QuestionKC(question_id=10, practice_mode="seed-problems", kc_id=1))
+    chain, correct, _ = bf.simulate(TRUE[:1], np.zeros(n_students, dtype=np.int64), length, seed=3)
+    start = datetime(2026, 1, 1)
+    for uid in range(1, n_students + 1):
+        session.add(StudentUser(id=uid, name=f"s{uid}", email=f"s{uid}@example.com"))
+    for i, (c, ok) in enumerate(zip(chain.tolist(), correct.tolist())):
+        at = start + timedelta(hours=i)
+        session.add(GradingSession(
+            session_id=f"g{i}", user_id=c + 1, question_id=10, question_text="q", correct_solution="a",
+            practice_mode="seed-problems", subject="math", grade="11", status="completed",
+            grading_result={"grade": "9/10" if ok else "2/10"}, created_at=at, expires_at=at,
+        ))
+    session.commit()
+    return session
+
+
+def test_fit_history_reports_and_saves_per_kc(db):
+    report = bf.fit_history(db, by="kc", holdout=0.25, min_attempts=100)
+    assert [g.key for g in report.groups] == [1]
+    group = report.groups[0]
+    assert group.n_train + group.n_heldout == 60 * 12
+    assert group.current == _TIER_PARAMS["SL_core"]
+    assert group.heldout_ll is not None and group.baseline_ll is not None
+
+    assert bf.save(db, report) == 1
+    db.commit()
+    stored = db.query(FittedBktParams).one()
+    assert stored.kc_id == 1 and stored.difficulty_tier is None
+    assert params_for_kc(db, 1) == group.fitted
+
+
+def test_thin_groups_are_skipped(db):
+    report = bf.fit_history(db, by="tier", min_attempts=10_000)
+    assert report.groups == [] and list(report.skipped) == ["SL_core"]
+    assert bf.save(db, report) == 0
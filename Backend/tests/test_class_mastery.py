@@ -0,0 +1,86 @@
+"""Class heatmap: one paged read, vectorized decay, per-page cache."""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.models import ClassEnrollment, KCMastery, KnowledgeComponent, StudentUser, TeacherUser
+from app.services import class_mastery_service as cms
+from app.services.mastery_service import decay_mastery
+
+NOW = datetime(2026, 3, 1)
+N_KCS = 42
+TEACHER, OTHER_TEACHER = 1, 2
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    for kc_id in range(1, N_KCS + 1):
+        session.add(KnowledgeComponent(
+            id=kc_id, slug=f"kc{kc_id}", name=f"KC {kc_id}", ib_topic_ref="1.1",
+            domain="Algebra", description="d", difficulty_tier="SL_core",
+        ))
+    for tid in (TEACHER, OTHER_TEACHER):
+        session.add(TeacherUser(id=tid, name=f"t{tid}", email=f"t{tid}@example.com", hashed_password="x"))
+    for uid in range(1, 41):
+        session.add(StudentUser(id=uid, name=f"s{uid}", email=f"s{uid}@example.com", grade="11"))
+        session.add(ClassEnrollment(teacher_id=TEACHER, student_id=uid))
+        for kc_id in range(1, N_KCS + 1, 2):
+            session.add(KCMastery(
+                user_id=uid, kc_id=kc_id, p_mastery=0.8, n_attempts=1, n_correct=1,
+                last_practiced_at=NOW - timedelta(days=uid % 7),
+            ))
+    session.add(StudentUser(id=99, name="other", email="o@example.com", grade="12"))
+    session.add(ClassEnrollment(teacher_id=TEACHER, student_id=99))
+    session.add(StudentUser(id=100, name="elsewhere", email="e@example.com", grade="11"))
+    session.add(ClassEnrollment(teacher_id=OTHER_TEACHER, student_id=100))
+    session.commit()
+    cms.clear_cache()
+    yield session
+    cms.clear_cache()
+
+
+def test_heatmap_decays_and_leaves_gaps(db):
+    heatmap = cms.class_heatmap(db, TEACHER, grade="11", limit=50, now=NOW)
+    assert len(heatmap["students"]) == 40 and len(heatmap["kcs"]) == N_KCS
+    assert heatmap["next_after_id"] is None
+
+    col = {kc["id"]: j for j, kc in enumerate(heatmap["kcs"])}
+    row3 = heatmap["mastery"][2]  # student 3, practiced 3 days ago
+    assert row3[col[1]] == pytest.approx(round(decay_mastery(0.8, 3.0), 3))
+    assert row3[col[2]] is None
+    assert heatmap["kc_students_practiced"][col[1]] == 40
+    assert heatmap["kc_students_practiced"][col[2]] == 0 and heatmap["kc_means"][col[2]] is None
+
+
+def test_pages_by_student_and_filters_by_grade(db):
+    first = cms.class_heatmap(db, TEACHER, grade="11", limit=15, now=NOW)
+    assert [s["id"] for s in first["students"]] == list(range(1, 16))
+    assert first["next_after_id"] == 15
+    rest = cms.class_heatmap(db, TEACHER, grade="11", after_id=35, limit=15, now=NOW)
+    assert [s["id"] for s in rest["students"]] == list(range(36, 41)) and rest["next_after_id"] is None
+
+    everyone = cms.class_heatmap(db, TEACHER, limit=200, now=NOW)
+    assert everyone["students"][-1] == {"id": 99, "name": "other"}
+    assert everyone["mastery"][-1] == [None] * N_KCS
+
+
+def test_cached_page_is_redecayed_and_fast(db):
+    start = time.perf_counter()
+    cold = cms.class_heatmap(db, TEACHER, grade="11", now=NOW)
+    cold_ms = (time.perf_counter() - start) * 1000
+    later = cms.class_heatmap(db, TEACHER, grade="11", now=NOW + timedelta(days=10))
+    assert not cold["cached"] and later["cached"]
+    assert later["mastery"][0][0] < cold["mastery"][0][0]
+    assert cold_ms < 500  # generous for CI; typically a few ms
+
+
+def test_teachers_only_see_their_roster(db):
+    assert [s["id"] for s in cms.class_heatmap(db, OTHER_TEACHER, now=NOW)["students"]] == [100]
+    assert cms.class_heatmap(db, 3, now=NOW)["students"] == []  # a fresh account sees nobody
+
+    assert cms.unenroll(db, TEACHER, 99) and not cms.unenroll(db, TEACHER, 99)
+    assert 99 not in [s["id"] for s in cms.class_heatmap(db, TEACHER, limit=200, now=NOW)["students"]]
+    assert cms.enroll(db, OTHER_TEACHER, 1) and not cms.enroll(db, OTHER_TEACHER, 1)
+    assert [s["id"] for s in cms.class_heatmap(db, OTHER_TEACHER, now=NOW)["students"]] == [1, 100]
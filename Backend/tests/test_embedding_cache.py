@@ -0,0 +1,163 @@
+"""Tests for the two-tier content-addressed embedding cache (upstream faked)."""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+from app.services import embedding_service as es
+from app.services.micro_batcher import MicroBatcher
+from app.services.ttl_cache import TTLCache
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.store: Dict[str, bytes] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.store.get(key)
+
+    def setex(self, key: str, ttl: int, value: bytes) -> None:
+        self.store[key] = value
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls: List[Dict] = []
+
+    def fake_embed_content(model, content, task_type, title=None):
+        calls.append({"content": content, "task_type": task_type, "title": title})
+        return {"embedding": [float(len(content)), 1.0, 0.5]}
+
+    redis = FakeRedis()
+    monkeypatch.setattr(es, "_configured", True)
+    monkeypatch.setattr(es.genai, "embed_content", fake_embed_content)
+    monkeypatch.setattr(es, "get_redis", lambda: redis)
+    monkeypatch.setattr(es, "_local", TTLCache(maxsize=8, ttl=60))
+    monkeypatch.setattr(es, "_redis_hits", 0)
+    monkeypatch.setattr(es, "_redis_misses", 0)
+    return calls, redis
+
+
+def test_ttl_cache_lru_eviction_and_counters():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recent
+    cache.set("c", 3)           # evicts "b"
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=4, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_repeat_query_hits_local_tier(upstream):
+    calls, _ = upstream
+    first = es.embed_query("last attempt was correct")
+    second = es.embed_query("last attempt was correct")
+
+    assert first == second
+    assert len(calls) == 1
+    assert es.cache_stats()["local"]["hits"] == 1
+
+
+def test_key_separates_task_type_and_title(upstream):
+    calls, _ = upstream
+    es.embed_query("same text")
+    es.embed_document("same text")
+    es.embed_document("same text", title="t")
+    assert len(calls) == 3
+
+
+def test_redis_tier_refills_local(upstream, monkeypatch):
+    calls, redis = upstream
+    es.embed_document("persona line")
+    monkeypatch.setattr(es, "_local", TTLCache(maxsize=8, ttl=60))  # new worker
+
+    vec = es.embed_document("persona line")
+    assert len(calls) == 1
+    assert vec == pytest.approx([12.0, 1.0, 0.5])
+    assert es.cache_stats()["redis"]["hits"] == 1
+    assert es.embed_document("persona line") == pytest.approx(vec)
+    assert es.cache_stats()["local"]["hits"] == 1
+
+
+async def test_async_query_uses_cache(upstream):
+    calls, _ = upstream
+    await es.embed_query_async("q")
+    await es.embed_query_async("q")
+    assert len(calls) == 1
+
+
+# ─────────────────────────── batching ───────────────────────────
+
+
+@pytest.fixture
+def batch_upstream(monkeypatch, upstream):
+    calls, redis = upstream
+
+    def fake_embed_content(model, content, task_type, title=None):
+        texts = content if isinstance(content, list) else [content]
+        calls.append({"content": texts, "task_type": task_type, "title": title})
+        if any(t == "boom" for t in texts):
+            raise RuntimeError("upstream rejected input")
+        vectors = [[float(len(t)), 1.0, 0.5] for t in texts]
+        return {"embedding": vectors if isinstance(content, list) else vectors[0]}
+
+    monkeypatch.setattr(es.genai, "embed_content", fake_embed_content)
+    return calls
+
+
+def test_batch_embeds_misses_in_one_call(batch_upstream):
+    calls = batch_upstream
+    es.embed_document("cached")
+    vectors = es.embed_documents_batch(["cached", "a", "bb", "a"])
+
+    assert [v[0] for v in vectors] == [6.0, 1.0, 2.0, 1.0]
+    assert len(calls) == 2
+    assert calls[1]["content"] == ["a", "bb"]  # deduplicated, cache hit skipped
+
+
+def test_batch_isolates_failing_item(batch_upstream):
+    vectors = es.embed_documents_batch(["ok", "boom", "fine"])
+    assert vectors[0][0] == 2.0
+    assert vectors[1] is None
+    assert vectors[2][0] == 4.0
+
+
+async def test_micro_batcher_coalesces_concurrent_calls(batch_upstream, monkeypatch):
+    calls = batch_upstream
+    monkeypatch.setattr(es, "_batchers", es.weakref.WeakKeyDictionary())
+
+    results = await asyncio.gather(
+        *(es.embed_document_async(text) for text in ["x", "yy", "zzz", "boom"]),
+        return_exceptions=True,
+    )
+
+    assert [r[0] for r in results[:3]] == [1.0, 2.0, 3.0]
+    assert isinstance(results[3], RuntimeError)
+    batched = [c for c in calls if len(c["content"]) > 1]
+    assert len(batched) == 1 and sorted(batched[0]["content"]) == ["boom", "x", "yy", "zzz"]
+
+
+async def test_micro_batcher_respects_max_batch():
+    seen: List[List[int]] = []
+
+    def double(items):
+        seen.append(list(items))
+        return [i * 2 for i in items]
+
+    batcher = MicroBatcher(double, max_batch=3, max_wait_ms=50)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    assert results == [i * 2 for i in range(7)]
+    assert [len(batch) for batch in seen] == [3, 3, 1]
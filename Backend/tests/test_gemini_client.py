@@ -0,0 +1,69 @@
+"""Gemini client wrapper: off-loop calls, per-model limits, timeouts, metrics."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import gemini_client
+
+
+class SlowModel:
+    model_name = "models/fake"
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.options = []
+
+    def generate_content(self, contents, request_options=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        self.options.append(request_options)
+        time.sleep(self.delay)  # a blocking SDK call
+        with self.lock:
+            self.active -= 1
+        return f"re: {contents}"
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    gemini_client.reset_stats()
+    yield
+    gemini_client.reset_stats()
+
+
+async def test_blocking_call_leaves_the_loop_free():
+    model = SlowModel(0.2)
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    beat = asyncio.ensure_future(heartbeat())
+    assert await gemini_client.generate_content(model, "hi") == "re: hi"
+    beat.cancel()
+    assert ticks >= 10
+    assert model.options == [{"timeout": gemini_client.TIMEOUT_SECONDS}]
+
+
+async def test_per_model_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(gemini_client, "MAX_CONCURRENCY", 2)
+    model = SlowModel(0.05)
+    await asyncio.gather(*[gemini_client.generate_content(model, i) for i in range(6)])
+    assert model.peak == 2
+    assert gemini_client.stats()["models/fake"]["calls"] == 6
+
+
+async def test_timeout_is_counted():
+    with pytest.raises(asyncio.TimeoutError):
+        await gemini_client.generate_content(SlowModel(0.3), "hi", timeout=0.05)
+    stats = gemini_client.stats()["models/fake"]
+    assert (stats["timeouts"], stats["errors"], stats["in_flight"]) == (1, 1, 0)
+    assert stats["p50_ms"] is not None
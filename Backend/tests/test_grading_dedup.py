@@ -0,0 +1,62 @@
+"""Grading dedup: perceptual hashes, per-question buckets, TTL, hit-rate stats."""
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services import grading_dedup as gd
+
+RESULT = {"grade": "7/10", "feedback": "ok", "corrections": [], "strengths": []}
+
+
+@pytest.fixture(autouse=True)
+def local_only(monkeypatch):
+    monkeypatch.setattr(gd, "get_redis", lambda: None)
+    gd.clear()
+    yield
+    gd.clear()
+
+
+def _page(lines=range(80, 1100, 60), quality=85) -> bytes:
+    image = Image.new("L", (1200, 1600), 235)
+    draw = ImageDraw.Draw(image)
+    for y in lines:  # handwriting
+        draw.line((60, y, 1100, y + 6), fill=25, width=5)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def test_reencoded_copy_is_near_and_different_work_is_far():
+    original = gd.image_hash(_page())
+    assert gd.distance(original, gd.image_hash(_page())) == 0
+    assert gd.distance(original, gd.image_hash(_page(quality=60))) <= gd.MAX_DISTANCE
+    assert gd.distance(original, gd.image_hash(_page(lines=range(140, 1500, 45)))) > 4 * gd.MAX_DISTANCE
+
+
+def test_lookup_is_scoped_to_student_question_and_solution():
+    fingerprint = gd.image_hash(_page())
+    assert gd.lookup(1, 10, "x = 2", fingerprint) is None
+    gd.store(1, 10, "x = 2", fingerprint, RESULT)
+
+    assert gd.lookup(1, 10, "x = 2", gd.image_hash(_page(quality=60))) == RESULT
+    assert gd.lookup(1, 11, "x = 2", fingerprint) is None
+    assert gd.lookup(1, 10, "x = 3", fingerprint) is None  # the solution was edited
+    assert gd.lookup(2, 10, "x = 2", fingerprint) is None  # never another student's grade
+    assert gd.stats() == {"hits": 1, "misses": 4, "stored": 1, "unhashable": 0, "hit_rate": 0.2}
+
+
+def test_expired_results_are_not_served(monkeypatch):
+    fingerprint = gd.image_hash(_page())
+    now = [1000.0]
+    monkeypatch.setattr(gd.time, "time", lambda: now[0])
+    gd.store(1, 10, "x = 2", fingerprint, RESULT)
+    now[0] += gd.TTL_SECONDS + 1
+    assert gd.lookup(1, 10, "x = 2", fingerprint) is None
+
+
+def test_undecodable_images_skip_the_cache():
+    assert gd.image_hash(b"not an image") is None
+    gd.store(1, 10, "x = 2", None, RESULT)
+    assert gd.lookup(1, 10, "x = 2", None) is None
+    assert gd.stats()["unhashable"] == 1 and gd.stats()["hit_rate"] is None
@@ -0,0 +1,164 @@
+"""Grading queue: bounded workers, retries with dead letters, status tracking."""
+import asyncio
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models import GradingSession, StudentUser
+from app.services import grading_dedup
+from app.services import grading_queue as gq
+
+NOW = datetime(2026, 3, 1, 12)
+
+
+@pytest.fixture
+def session_factory(engine, monkeypatch):
+    monkeypatch.setattr(gq, "get_redis", lambda: None)
+    monkeypatch.setattr(grading_dedup, "get_redis", lambda: None)
+    grading_dedup.clear()
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(StudentUser(id=1, name="s", email="s@example.com"))
+    for i, status in enumerate(["image_uploaded", "grading", "completed"]):
+        db.add(GradingSession(
+            session_id=f"g{i}", user_id=1, question_id=10, question_text="q", correct_solution="s",
+            practice_mode="pyq", subject="math", grade="11", status=status,
+            image_uploaded_at=NOW - timedelta(minutes=30), expires_at=NOW + timedelta(minutes=5),
+        ))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _status(factory, session_id):
+    db = factory()
+    try:
+        return db.query(GradingSession).filter_by(session_id=session_id).one()
+    finally:
+        db.close()
+
+
+async def _no_followups(db, session, result):
+    pass
+
+
+async def _idle(job):
+    pass
+
+
+async def test_workers_run_jobs_concurrently_up_to_the_pool_size():
+    async def handler(job):
+        await asyncio.sleep(0.05)
+
+    queue = gq.GradingQueue(handler, workers=4)
+    start = time.perf_counter()
+    for i in range(8):
+        queue.enqueue(f"job{i}")
+    await queue.join()
+    assert queue.completed == 8
+    assert time.perf_counter() - start < 0.3  # two waves of four, not eight in a row
+    await queue.stop()
+
+
+async def test_retries_then_dead_letters():
+    calls, dead = {}, []
+
+    async def handler(job):
+        calls[job.job_id] = calls.get(job.job_id, 0) + 1
+        if job.job_id == "bad" or calls[job.job_id] < 2:
+            raise RuntimeError("gemini timeout")
+
+    async def on_dead(job):
+        dead.append(job.job_id)
+
+    queue = gq.GradingQueue(handler, on_dead, workers=2, max_retries=2, backoff_seconds=0)
+    queue.enqueue("flaky")
+    queue.enqueue("bad")
+    await queue.join()
+    assert calls == {"flaky": 2, "bad": 3} and dead == ["bad"]
+    stats = queue.stats()
+    assert (stats["completed"], stats["retried"], stats["failed"]) == (1, 3, 1)
+    assert stats["dead_letters"] == [{"job_id": "bad", "attempts": 3, "error": "gemini timeout"}]
+    await queue.stop()
+
+
+async def test_enqueue_is_bounded():
+    queue = gq.GradingQueue(_idle, workers=0, maxsize=1)
+    queue.enqueue("a")
+    with pytest.raises(gq.QueueFull):
+        queue.enqueue("b")
+    await queue.stop()
+
+
+async def test_process_job_tracks_status_and_is_claimed_once(session_factory):
+    seen = []
+
+    async def grader(question, solution, image):
+        seen.append((_status(session_factory, "g0").status, image))
+        return {"grade": "7/10"}
+
+    job = gq.GradingJob("g0", image=b"jpeg")
+    await gq.process_job(job, session_factory, grader, _no_followups)
+    done = _status(session_factory, "g0")
+    assert seen == [("grading", b"jpeg")] and job.image is None and done.status == "completed" and done.grading_result == {"grade": "7/10"}
+
+    await gq.process_job(job, session_factory, grader, _no_followups)  # a duplicate is a no-op
+    assert len(seen) == 1
+
+
+async def test_grader_failure_releases_the_session_for_retry(session_factory):
+    async def grader(question, solution, image):
+        raise RuntimeError("503 from model")
+
+    job = gq.GradingJob("g0", image=b"jpeg")
+    with pytest.raises(RuntimeError):
+        await gq.process_job(job, session_factory, grader, _no_followups)
+    assert _status(session_factory, "g0").status == "image_uploaded"
+
+    job.attempts, job.last_error = 3, "503 from model"
+    await gq.mark_failed(job, session_factory)
+    failed = _status(session_factory, "g0")
+    assert failed.status == "failed" and failed.grading_result["attempts"] == 3
+
+
+async def test_recover_requeues_unfinished_submissions(session_factory):
+    queue = gq.GradingQueue(_idle, workers=0)
+    db = session_factory()
+    assert gq.recover(db, queue, now=NOW) == 2  # the queued one, and the stale mid-grading one
+    assert _status(session_factory, "g1").status == "image_uploaded"
+    assert gq.recover(db, queue, now=NOW + timedelta(hours=2)) == 0
+    db.close()
+    await queue.stop()
+
+
+async def test_job_without_its_image_fails_without_grading(session_factory):
+    async def grader(question, solution, image):
+        raise AssertionError("nothing to grade")
+
+    await gq.process_job(gq.GradingJob("g0"), session_factory, grader, _no_followups)  # stash expired
+    failed = _status(session_factory, "g0")
+    assert failed.status == "failed" and failed.grading_result["error"] == "image no longer available"
+
+
+async def test_duplicate_photo_reuses_the_grade(session_factory):
+    photo = io.BytesIO()
+    Image.new("L", (400, 300), 200).save(photo, "JPEG")
+    db = session_factory()
+    db.query(GradingSession).filter_by(session_id="g2").update({"status": "image_uploaded"})
+    db.commit()
+    db.close()
+    graded = []
+
+    async def grader(question, solution, image):
+        graded.append(image)
+        return {"grade": "7/10"}
+
+    for session_id in ("g0", "g2"):  # the same question, resubmitted
+        await gq.process_job(gq.GradingJob(session_id, image=photo.getvalue()), session_factory, grader, _no_followups)
+    assert len(graded) == 1
+    assert _status(session_factory, "g2").grading_result == {"grade": "7/10"}
+    assert grading_dedup.stats()["hits"] == 1
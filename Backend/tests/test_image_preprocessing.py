@@ -0,0 +1,65 @@
+"""Grading-image preprocessing: orientation, paper crop, downscale, re-encode."""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services import image_preprocessing as ip
+
+
+def _photo(width=2400, height=1800, page=(500, 300, 1900, 1500), orientation=None) -> bytes:
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(40, 90, (height, width, 3)).astype("uint8"))  # desk
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(page, fill=(235, 235, 228))
+    for y in range(page[1] + 80, page[3] - 40, 60):  # handwriting
+        draw.line((page[0] + 60, y, page[2] - 60, y + 4), fill=(20, 20, 60), width=4)
+    out = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def test_crops_to_the_page_downscales_and_saves_bytes():
+    result = ip.preprocess(_photo(), max_edge=800)
+    assert result.steps == ["crop", "resize", "gray"]
+    # The draft keeps enough resolution that the cropped page fills the cap.
+    assert max(result.width, result.height) == 800
+    # The 1400x1200 page (plus a small margin) keeps its aspect ratio.
+    assert result.width / result.height == pytest.approx(1400 / 1200, rel=0.05)
+    image = Image.open(io.BytesIO(result.data))
+    assert image.format == "JPEG" and image.mode == "L"
+    assert result.bytes_saved > 0.8 * result.original_bytes
+
+
+def test_applies_exif_orientation():
+    result = ip.preprocess(_photo(orientation=6), max_edge=800, crop=False)
+    assert "orient" in result.steps
+    assert result.height > result.width  # landscape sensor data, portrait photo
+
+
+def test_full_frame_page_is_not_cropped():
+    result = ip.preprocess(_photo(page=(0, 0, 2399, 1799)), max_edge=800)
+    assert "crop" not in result.steps
+
+
+def test_undecodable_bytes_fall_back_to_the_original():
+    before = ip.stats()["failed"]
+    result = ip.preprocess_or_original(b"not an image")
+    assert result.data == b"not an image" and result.bytes_saved == 0
+    assert result.mime_type == "application/octet-stream"
+    assert ip.stats()["failed"] == before + 1
+
+
+def test_fallback_keeps_the_real_mime_type(monkeypatch):
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(out, "PNG")
+
+    def broken(data, **kwargs):
+        raise RuntimeError("preprocessing bug")
+
+    monkeypatch.setattr(ip, "preprocess", broken)
+    assert ip.preprocess_or_original(out.getvalue()).mime_type == "image/png"
@@ -0,0 +1,94 @@
+"""Prerequisite closure bitsets and evidence propagation in record_attempt."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.database.models import KCMastery, KnowledgeComponent, QuestionKC, StudentUser
+from app.services import kc_graph, kc_registry
+from app.services.mastery_service import _TIER_PARAMS, record_attempt
+
+# alg-sequences-arithmetic -> alg-binomial-theorem -> stat-binomial, plus a
+# sibling (alg-sequences-geometric) that shares only the first prerequisite.
+SLUGS = {1: "alg-sequences-arithmetic", 2: "alg-binomial-theorem", 3: "stat-binomial", 4: "alg-sequences-geometric"}
+LAST = datetime(2026, 3, 1)
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add(StudentUser(id=1, name="s", email="s@example.com"))
+    for kc_id, slug in SLUGS.items():
+        session.add(KnowledgeComponent(
+            id=kc_id, slug=slug, name=slug, ib_topic_ref="1.1",
+            domain="Algebra", description="d", difficulty_tier="SL_core",
+        ))
+    session.add(QuestionKC(question_id=10, practice_mode="pyq", kc_id=2))
+    for kc_id in (1, 3):
+        session.add(KCMastery(user_id=1, kc_id=kc_id, p_mastery=0.5, n_attempts=2, n_correct=1, last_practiced_at=LAST))
+    session.commit()
+    return session
+
+
+def test_closure_is_topological_and_follows_the_registry(db):
+    graph = kc_graph.get_graph(db)
+    assert graph.prerequisites_of("stat-binomial")[0] == "alg-sequences-arithmetic"
+    assert "alg-binomial-theorem" in graph.prerequisites_of("stat-binomial")
+    assert "stat-binomial" in graph.dependents_of("alg-sequences-arithmetic")
+    assert all(graph.index[p] < graph.index[s] for s in graph.slugs for p in graph.prerequisites_of(s))
+    assert kc_graph.get_graph(db) is graph
+
+    kc_registry.invalidate()
+    assert kc_graph.get_graph(db) is not graph
+
+
+def test_spread_discounts_by_hops_and_direction(db):
+    graph = kc_graph.get_graph(db)
+    assert graph.spread([2], True) == {1: 0.5, 3: 0.1}
+    assert graph.spread([2], False) == {1: 0.2, 3: 0.5}
+    assert graph.spread([1], True) == pytest.approx({2: 0.1, 4: 0.1, 3: 0.01})
+
+
+def test_attempt_propagates_to_existing_neighbours_only(db):
+    seen = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: seen.append(args[2]))
+    changes = record_attempt(db, 1, 10, "pyq", {"grade": "9/10"})
+    assert len([s for s in seen if "kc_mastery" in s]) == 3  # insert, lock, one batched update
+
+    by_kc = {c["kc_id"]: c for c in changes}
+    assert set(by_kc) == {1, 2, 3} and "weight" not in by_kc[2]
+    p = _TIER_PARAMS["SL_core"]
+    posterior = 0.5 * (1 - p.p_S) / (0.5 * (1 - p.p_S) + 0.5 * p.p_G)
+    assert by_kc[1]["p_after"] == pytest.approx(0.5 + 0.5 * (posterior - 0.5), abs=1e-4)
+    assert 0.5 < by_kc[3]["p_after"] < by_kc[1]["p_after"]
+
+    db.expire_all()
+    prereq = db.query(KCMastery).filter_by(user_id=1, kc_id=1).one()
+    assert (prereq.n_attempts, prereq.last_practiced_at) == (2, LAST)  # evidence, not practice
+    assert db.query(KCMastery).filter_by(kc_id=4).count() == 0
+
+
+def test_weak_prerequisites_come_from_the_snapshot(db):
+    db.query(KCMastery).filter_by(kc_id=1).update({"p_mastery": 0.95, "last_practiced_at": datetime.utcnow()})
+    db.commit()
+    weak = kc_graph.weak_prerequisites(db, 1, "stat-binomial", threshold=0.6)
+    assert "alg-sequences-arithmetic" not in weak
+    assert weak == [s for s in kc_graph.get_graph(db).prerequisites_of("stat-binomial") if s != SLUGS[1]]
+
+    seen = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: seen.append(args[2]))
+    kc_graph.weak_prerequisites(db, 1, "alg-binomial-theorem", threshold=0.6)
+    assert seen == []
+    assert kc_graph.get_graph(db).weak_prerequisites("alg-binomial-theorem", 0) == []
+
+
+def test_identify_skill_gaps_tool_uses_the_graph(db):
+    from app.services.education_mcp_server import EducationMCPServer
+
+    server = EducationMCPServer(db)
+    result = server.execute_tool("identify_skill_gaps", {"user_id": 1, "target_skill": "stat-binomial"})
+    assert [g["skill"] for g in result["gaps"]] == kc_graph.weak_prerequisites(db, 1, "stat-binomial")
+    assert result["total_gaps"] == len(result["gaps"]) > 0
+
+    unknown = server.execute_tool("identify_skill_gaps", {"user_id": 1, "target_skill": "quadratic_formula"})
+    assert unknown["gaps"] == [] and unknown["total_gaps"] == 0
@@ -0,0 +1,59 @@
+"""KC registry: taxonomy + DB ids in one cached snapshot, rebuilt on change."""
+import pytest
+
+from app.database.models import KnowledgeComponent
+from app.services import kc_registry
+from app.services.mastery_service import _DEFAULT_PARAMS, _TIER_PARAMS, params_for_kc
+
+
+def _kc(kc_id, slug, tier="SL_core"):
+    return KnowledgeComponent(
+        id=kc_id, slug=slug, name=slug, ib_topic_ref="1.1", domain="Algebra",
+        description="d", difficulty_tier=tier,
+    )
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add_all([_kc(1, "alg-binomial-theorem", "HL_core"), _kc(2, "alg-sequences-arithmetic")])
+    session.commit()
+    return session
+
+
+def test_merges_taxonomy_with_db_ids(db):
+    registry = kc_registry.get_registry(db)
+    assert registry.slug_to_id == {"alg-binomial-theorem": 1, "alg-sequences-arithmetic": 2}
+    assert registry.slugs_for([2, 1, 99]) == ["alg-sequences-arithmetic", "alg-binomial-theorem"]
+    assert "alg-binomial-theorem" in registry.dependents["alg-sequences-arithmetic"]
+    assert registry.by_slug["alg-binomial-theorem"].prerequisites == ("alg-sequences-arithmetic",)
+    # Taxonomy-only KCs are known by slug but have no id yet.
+    assert len(registry.slugs) > len(registry.slug_to_id)
+
+
+def test_params_by_tier(db):
+    assert params_for_kc(db, 1) == _TIER_PARAMS["HL_core"]
+    assert params_for_kc(db, 2) == _TIER_PARAMS["SL_core"]
+    assert params_for_kc(db, 99) == _DEFAULT_PARAMS
+
+
+def test_lookups_are_cached_until_the_table_changes(db, monkeypatch):
+    first = kc_registry.get_registry(db)
+    assert kc_registry.get_registry(db) is first
+
+    db.add(_kc(3, "new-kc"))
+    db.commit()
+    assert kc_registry.get_registry(db) is first  # within the refresh interval
+
+    monkeypatch.setattr(kc_registry, "REFRESH_SECONDS", 0.0)
+    refreshed = kc_registry.get_registry(db)
+    assert refreshed is not first and refreshed.slug_to_id["new-kc"] == 3
+    assert kc_registry.get_registry(db) is refreshed  # unchanged stamp keeps the snapshot
+
+
+def test_same_length_tier_swap_reloads(db, monkeypatch):
+    monkeypatch.setattr(kc_registry, "REFRESH_SECONDS", 0.0)
+    assert params_for_kc(db, 2) == _TIER_PARAMS["SL_core"]
+    db.query(KnowledgeComponent).filter_by(id=2).update({"difficulty_tier": "HL_core"})
+    db.commit()
+    assert params_for_kc(db, 2) == _TIER_PARAMS["HL_core"]
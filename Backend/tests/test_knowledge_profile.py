@@ -0,0 +1,84 @@
+"""Legacy skill scores: normalized upserts and the cached JSON projection."""
+import pytest
+from sqlalchemy import event
+
+from app.database.models import PYQs, StudentSkillScore, StudentUser
+from app.services import knowledge_profile_service as kps
+from app.services.knowledge_profile_service import KnowledgeProfileService as KPS
+
+SKILLS = {
+    "skills": [
+        {"topic": "Quadratic Equations", "skill_name": "factoring", "difficulty": 0.4, "weight": 1.0},
+        {"topic": "Quadratic Equations", "skill_name": "discriminant", "difficulty": 0.6, "weight": 0.5},
+    ]
+}
+
+
+@pytest.fixture
+def db(empty_db, monkeypatch):
+    monkeypatch.setattr(kps, "get_redis", lambda: None)
+    session = empty_db
+    session.add(StudentUser(id=1, name="s", email="s@example.com"))
+    session.add_all([PYQs(id=q, skills_tested=SKILLS) for q in range(1, 30)])
+    session.commit()
+    kps._profiles.clear()
+    yield session
+    kps._profiles.clear()
+
+
+def _grade(db, question_id, grade):
+    return KPS.update_profile_after_grading(db, 1, question_id, "previous-year-questions", {"grade": grade})
+
+
+def _skills(profile):
+    topic = profile["subjects"]["mathematics"]["topics"][0]
+    return topic, topic["skills"]
+
+
+def test_scores_follow_the_legacy_algorithm(db):
+    profile = _grade(db, 1, "8/10")
+    topic, skills = _skills(profile)
+    # New topic: the first skill is seeded from the attempt, the second starts
+    # at 50 and takes the difficulty-aware update.
+    assert skills["factoring"]["score"] == 60
+    expected = KPS.calculate_expected_performance(50, 0.6)
+    change = 0.2 * 0.5 * (80 - expected) * KPS.get_difficulty_multiplier(0.6, 0.8)
+    assert skills["discriminant"]["score"] == int(50 + change)
+    assert topic["overall_proficiency"] == int((60 + skills["discriminant"]["score"]) / 2)
+
+    _, skills = _skills(_grade(db, 2, "3/10"))
+    expected = KPS.calculate_expected_performance(60, 0.4)
+    change = 0.2 * (30 - expected) * KPS.get_difficulty_multiplier(0.4, 0.3)
+    assert skills["factoring"]["score"] == int(60 + change)
+    assert skills["factoring"]["question_count"] == 2 and skills["factoring"]["last_question_id"] == 2
+
+
+def test_write_cost_does_not_grow_with_history(db):
+    for q in range(1, 25):
+        _grade(db, q, "7/10")
+    seen = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: seen.append(args[2]))
+    _grade(db, 25, "7/10")
+    writes = [s for s in seen if "student_skill_scores" in s and not s.lstrip().upper().startswith("SELECT")]
+    assert len(writes) == 1
+    assert db.query(StudentSkillScore).count() == 2
+    assert db.get(StudentUser, 1).knowledge_profile is None  # the JSON column is no longer rewritten
+
+
+def test_profile_projection_is_cached_until_next_grading(db):
+    _grade(db, 1, "8/10")
+    first = KPS.get_student_profile(db, 1)
+    seen = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: seen.append(args[2]))
+    assert KPS.get_student_profile(db, 1) == first and seen == []
+
+    _grade(db, 2, "8/10")
+    assert _skills(KPS.get_student_profile(db, 1))[1]["factoring"]["question_count"] == 2
+
+
+def test_students_without_rows_get_their_legacy_json(db):
+    legacy = {"subjects": {"mathematics": {"topics": [{"topic_name": "Old", "skills": {}}]}}}
+    db.add(StudentUser(id=2, name="t", email="t@example.com", knowledge_profile=legacy))
+    db.commit()
+    assert KPS.get_student_profile(db, 2) == legacy
+    assert KPS.get_student_profile(db, 3) is None
@@ -0,0 +1,136 @@
+"""The vectorized engine must agree with the scalar mastery_service math."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.database.models import (
+    GradingSession,
+    KCMastery,
+    KnowledgeComponent,
+    QuestionKC,
+    StudentUser,
+)
+from app.services import mastery_engine as me
+from app.services.mastery_service import (
+    _DEFAULT_PARAMS,
+    _TIER_PARAMS,
+    bkt_update,
+    decay_mastery,
+)
+
+TIERS = list(_TIER_PARAMS) + ["unknown"]
+
+
+def test_batch_update_and_decay_match_scalar():
+    rng = np.random.default_rng(0)
+    p = rng.uniform(0.01, 0.99, size=200)
+    correct = rng.random(200) < 0.5
+    days = rng.uniform(-1, 120, size=200)
+    days[::17] = np.nan
+    tiers = [TIERS[i % len(TIERS)] for i in range(200)]
+    params = me.params_matrix(tiers)
+
+    updated = me.bkt_update_batch(p, correct, params)
+    decayed = me.decay_batch(p, days)
+    for i in range(200):
+        scalar = _TIER_PARAMS.get(tiers[i], _DEFAULT_PARAMS)
+        assert updated[i] == pytest.approx(bkt_update(p[i], bool(correct[i]), scalar))
+        expected = p[i] if np.isnan(days[i]) else decay_mastery(p[i], days[i])
+        assert decayed[i] == pytest.approx(expected)
+
+
+def test_replay_matches_sequential_scalar_updates():
+    rng = np.random.default_rng(1)
+    n_states, n_events = 30, 400
+    state = rng.integers(0, n_states, size=n_events)
+    correct = rng.random(n_events) < 0.6
+    times = rng.uniform(0, 90 * 86400, size=n_events)
+    tiers = [TIERS[i % len(TIERS)] for i in range(n_states)]
+
+    result = me.replay(state, correct, times, me.params_matrix(tiers))
+
+    for s in range(n_states):
+        scalar = _TIER_PARAMS.get(tiers[s], _DEFAULT_PARAMS)
+        p, last = scalar.p_L0, None
+        for i in sorted(np.flatnonzero(state == s), key=lambda i: times[i]):
+            if last is not None:
+                p = decay_mastery(p, (times[i] - last) / 86400.0)
+            p = bkt_update(p, bool(correct[i]), scalar)
+            last = times[i]
+        assert result.p_mastery[s] == pytest.approx(p)
+        assert result.n_attempts[s] == np.count_nonzero(state == s)
+        assert result.n_correct[s] == np.count_nonzero((state == s) & correct)
+
+
+def test_replay_attempts_without_spread_matches_replay():
+    rng = np.random.default_rng(2)
+    n_states, n_events = 30, 400
+    state = rng.integers(0, n_states, size=n_events)
+    correct = rng.random(n_events) < 0.6
+    times = np.sort(rng.uniform(0, 90 * 86400, size=n_events))
+    params = me.params_matrix([TIERS[i % len(TIERS)] for i in range(n_states)])
+    empty = np.array([], dtype=np.int64)
+
+    expected = me.replay(state, correct, times, params)
+    result = me.replay_attempts(
+        state // 5, correct, times, np.arange(n_events), state, empty, empty, empty.astype(float), params
+    )
+    assert result.p_mastery == pytest.approx(expected.p_mastery)
+    assert (result.n_attempts == expected.n_attempts).all() and (result.n_correct == expected.n_correct).all()
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add_all([StudentUser(id=uid, name=f"s{uid}", email=f"s{uid}@example.com") for uid in (1, 2)])
+    for kc_id, tier in ((1, "SL_core"), (2, "HL_core")):
+        session.add(KnowledgeComponent(
+            id=kc_id, slug=f"kc{kc_id}", name=f"KC {kc_id}", ib_topic_ref="1.1",
+            domain="Algebra", description="d", difficulty_tier=tier,
+        ))
+    session.add_all([
+        QuestionKC(question_id=10, practice_mode="seed-problems", kc_id=1),
+        QuestionKC(question_id=10, practice_mode="seed-problems", kc_id=2),
+    ])
+    session.commit()
+    return session
+
+
+def test_mastery_matrix_decays_and_leaves_gaps(db):
+    now = datetime(2026, 1, 31)
+    db.add_all([
+        KCMastery(user_id=1, kc_id=1, p_mastery=0.9, last_practiced_at=now - timedelta(days=30)),
+        KCMastery(user_id=2, kc_id=2, p_mastery=0.5, last_practiced_at=now),
+    ])
+    db.commit()
+
+    users, kcs, matrix = me.mastery_matrix(db, [1, 2], now=now)
+    assert users == [1, 2] and kcs == [1, 2]
+    assert matrix[0, 0] == pytest.approx(decay_mastery(0.9, 30.0))
+    assert matrix[1, 1] == pytest.approx(0.5)
+    assert np.isnan(matrix[0, 1]) and np.isnan(matrix[1, 0])
+
+
+def test_grading_history_expands_completed_sessions(db):
+    start = datetime(2026, 1, 1)
+    for i, grade in enumerate(["9/10", "2/10", "8/10"]):
+        db.add(GradingSession(
+            session_id=f"s{i}", user_id=1, question_id=10, question_text="q", correct_solution="a",
+            practice_mode="seed-problems", subject="math", grade="11", status="completed",
+            grading_result={"grade": grade}, created_at=start + timedelta(days=i),
+            expires_at=start + timedelta(days=i, hours=1),
+        ))
+    db.commit()
+
+    users, kcs, correct, times = me.grading_history(db)
+    assert users.tolist() == [1] * 6 and sorted(kcs.tolist()) == [1, 1, 1, 2, 2, 2]
+    assert correct.tolist().count(True) == 4
+
+    result = me.replay(kcs - 1, correct, times, me.params_matrix(["SL_core", "SL_core"]))
+    assert result.n_attempts.tolist() == [3, 3] and result.n_correct.tolist() == [2, 2]
+
+    p = _TIER_PARAMS["SL_core"].p_L0
+    for day, ok in enumerate([True, False, True]):
+        p = bkt_update(decay_mastery(p, 1.0) if day else p, ok, _TIER_PARAMS["SL_core"])
+    assert result.p_mastery[0] == pytest.approx(p)
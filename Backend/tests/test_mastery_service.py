@@ -0,0 +1,92 @@
+"""record_attempt's bulk lock/upsert, and the versioned current_mastery snapshot."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.database.models import KCMastery, KnowledgeComponent, QuestionKC, StudentUser
+from app.services import mastery_service
+from app.services.mastery_service import (
+    _TIER_PARAMS,
+    bkt_update,
+    current_mastery,
+    decay_mastery,
+    record_attempt,
+)
+
+N_KCS = 6
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add(StudentUser(id=1, name="s", email="s@example.com"))
+    for kc_id in range(1, N_KCS + 1):
+        session.add(KnowledgeComponent(
+            id=kc_id, slug=f"kc{kc_id}", name=f"KC {kc_id}", ib_topic_ref="1.1",
+            domain="Algebra", description="d", difficulty_tier="SL_core",
+        ))
+        session.add(QuestionKC(question_id=10, practice_mode="seed-problems", kc_id=kc_id))
+    session.commit()
+    return session
+
+
+def _statements(db):
+    seen = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: seen.append(args[2]))
+    return seen
+
+
+def test_first_attempt_creates_rows_and_second_updates_them(db):
+    params = _TIER_PARAMS["SL_core"]
+    first = record_attempt(db, 1, 10, "seed-problems", {"grade": "8/10"})
+    assert [c["kc_id"] for c in first] == list(range(1, N_KCS + 1))
+    assert first[0]["p_after"] == pytest.approx(bkt_update(params.p_L0, True, params), abs=1e-4)
+
+    row = db.query(KCMastery).filter_by(user_id=1, kc_id=3).one()
+    row.last_practiced_at = datetime.utcnow() - timedelta(days=10)
+    db.commit()
+
+    second = record_attempt(db, 1, 10, "seed-problems", {"grade": "2/10"})
+    expected_before = decay_mastery(first[2]["p_after"], 10.0)
+    assert second[2]["p_before"] == pytest.approx(expected_before, abs=1e-3)
+    db.expire_all()
+    rows = db.query(KCMastery).filter_by(user_id=1).all()
+    assert len(rows) == N_KCS
+    assert all(r.n_attempts == 2 and r.n_correct == 1 for r in rows)
+
+
+def test_round_trips_do_not_grow_with_kc_count(db):
+    record_attempt(db, 1, 10, "seed-problems", {"grade": "8/10"})
+    seen = _statements(db)
+    record_attempt(db, 1, 10, "seed-problems", {"grade": "8/10"})
+    mastery_statements = [s for s in seen if "kc_mastery" in s]
+    # INSERT ... ON CONFLICT DO NOTHING, one locking SELECT, one executemany UPDATE.
+    assert len(mastery_statements) == 3
+
+
+def test_ungradable_attempt_is_a_no_op(db):
+    assert record_attempt(db, 1, 10, "seed-problems", {"grade": "n/a"}) == []
+    assert db.query(KCMastery).count() == 0
+
+
+def test_current_mastery_is_served_from_snapshot_until_an_attempt(db):
+    record_attempt(db, 1, 10, "seed-problems", {"grade": "8/10"})
+    db.query(KCMastery).filter_by(user_id=1, kc_id=1).update(
+        {"last_practiced_at": datetime.utcnow() - timedelta(days=10)}
+    )
+    db.commit()
+    mastery_service.invalidate_snapshot(1)
+
+    first = current_mastery(db, 1)
+    row = next(m for m in first if m["kc_id"] == 1)
+    assert row["kc_slug"] == "kc1" and row["days_since_practice"] == pytest.approx(10.0, abs=0.1)
+    assert row["mastery"] == pytest.approx(decay_mastery(row["raw_mastery"], 10.0), abs=2e-3)
+
+    seen = _statements(db)
+    assert current_mastery(db, 1) == first
+    assert seen == []
+
+    record_attempt(db, 1, 10, "seed-problems", {"grade": "1/10"})
+    after = next(m for m in current_mastery(db, 1) if m["kc_id"] == 1)
+    assert after["n_attempts"] == 2 and after["days_since_practice"] == pytest.approx(0.0, abs=0.1)
@@ -0,0 +1,83 @@
+"""Clustering and cross-student queries of the misconception library."""
+import numpy as np
+import pytest
+
+from app.database.models import StudentMemoryEvent, StudentUser
+from app.services import misconception_library
+from app.services.misconception_library import MisconceptionLibrary
+
+DIM = 32
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add_all([StudentUser(id=uid, name=f"s{uid}", email=f"s{uid}@example.com") for uid in range(1, 7)])
+    session.commit()
+    return session
+
+
+def near(base: np.ndarray, rng, scale: float = 0.05) -> list:
+    return (base + scale * rng.normal(size=DIM)).tolist()
+
+
+def add_event(db, user_id, slugs, summary, vec):
+    row = StudentMemoryEvent(user_id=user_id, summary=summary, concept_keywords=slugs, embedding=vec)
+    db.add(row)
+    db.commit()
+    return row
+
+
+def test_clusters_near_duplicates_per_kc(db):
+    rng = np.random.default_rng(0)
+    fraction_add, sign_slip = rng.normal(size=DIM), rng.normal(size=DIM)
+    first = add_event(db, 1, ["fractions"], "added numerators and denominators", near(fraction_add, rng))
+    for uid in (2, 3, 4):
+        add_event(db, uid, ["fractions"], "added across", near(fraction_add, rng))
+    add_event(db, 5, ["fractions"], "dropped a minus sign", near(sign_slip, rng))
+    add_event(db, 6, ["quadratics"], "same slip, other KC", near(fraction_add, rng))
+
+    library = MisconceptionLibrary(threshold=0.9)
+    assert library.refresh(db) == 6
+
+    top = library.top_misconceptions("fractions")
+    assert [len(m.students) for m in top] == [4, 1]
+    assert top[0].summary == first.summary
+    assert library.students_with_same_mistake(first.id) == [2, 3, 4]
+    assert library.top_misconceptions("unknown-kc") == []
+
+
+def test_refresh_is_incremental_and_hook_is_idempotent(db):
+    rng = np.random.default_rng(1)
+    base = rng.normal(size=DIM)
+    add_event(db, 1, ["limits"], "a", near(base, rng))
+    library = MisconceptionLibrary()
+    library.refresh(db)
+
+    later = add_event(db, 2, ["limits"], "b", near(base, rng))
+    library.record(later)
+    assert library.refresh(db) == 1  # re-read above the high-water mark, not re-added
+    assert len(library) == 2
+    assert library.refresh(db) == 0
+
+
+def test_similar_events_excludes_the_asking_student(db):
+    rng = np.random.default_rng(2)
+    base = rng.normal(size=DIM)
+    mine = add_event(db, 1, ["limits"], "mine", near(base, rng, 0.01))
+    theirs = add_event(db, 2, ["limits"], "theirs", near(base, rng, 0.01))
+    add_event(db, 3, ["limits"], "unrelated", rng.normal(size=DIM).tolist())
+    library = MisconceptionLibrary()
+    library.refresh(db)
+
+    hits = library.similar_events(mine.embedding, k=1, exclude_user=1)
+    assert [(event_id, user_id) for event_id, user_id, _ in hits] == [(theirs.id, 2)]
+
+
+def test_record_event_skips_unloaded_library(db, monkeypatch):
+    monkeypatch.setattr(misconception_library, "_library", None)
+    row = add_event(db, 1, ["limits"], "x", [1.0] * DIM)
+    misconception_library.record_event(row.id, row.user_id, row.concept_keywords, row.summary, row.embedding)
+    assert misconception_library._library is None
+    assert len(misconception_library.get_library(db)) == 1
+    monkeypatch.setattr(misconception_library, "_library", None)
@@ -0,0 +1,74 @@
+"""Write-side state snapshots: versioning, staleness and re-decay."""
+import pytest
+
+from app.services import state_snapshot_service as snap
+from app.services.mastery_service import decay_mastery
+
+
+def make_state(tag: str) -> dict:
+    return {
+        "mastery": [
+            {"kc_slug": "limits", "kc_name": "Limits", "mastery": 0.8, "raw_mastery": 0.8,
+             "days_since_practice": 0.0},
+        ],
+        "persona": [tag],
+        "memory": [],
+        "timings_ms": {},
+    }
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    calls = []
+
+    async def build_state(db, user_id, query, query_kc_ids=None):
+        calls.append((query, query_kc_ids))
+        return make_state(f"build {len(calls)}")
+
+    monkeypatch.setattr(snap, "get_redis", lambda: None)
+    monkeypatch.setattr(snap.sss, "build_state", build_state)
+    snap._snapshots.clear()
+    snap._versions.clear()
+    yield calls
+    snap._snapshots.clear()
+    snap._versions.clear()
+
+
+async def test_materialized_snapshot_is_served_without_rebuilding(builds):
+    await snap.materialize(None, 1, was_correct=False)
+    state = await snap.get_state(None, 1, was_correct=False)
+    assert len(builds) == 1
+    assert state["source"] == "snapshot" and state["persona"] == ["build 1"]
+
+
+async def test_write_after_snapshot_forces_live_build(builds):
+    await snap.materialize(None, 1, was_correct=True)
+    snap.invalidate(1)
+    state = await snap.get_state(None, 1, was_correct=True)
+    assert state["source"] == "live" and len(builds) == 2
+    assert (await snap.get_state(None, 1, was_correct=True))["source"] == "snapshot"
+
+
+async def test_query_mismatch_and_age_limit(builds, monkeypatch):
+    await snap.materialize(None, 1, was_correct=True)
+    assert (await snap.get_state(None, 1, was_correct=False))["source"] == "live"
+
+    clock = [snap.time.time() + snap.SNAPSHOT_MAX_AGE_SECONDS + 1]
+    monkeypatch.setattr(snap.time, "time", lambda: clock[0])
+    assert (await snap.get_state(None, 1, was_correct=False))["source"] == "live"
+
+
+def test_redecay_applies_elapsed_time():
+    state = snap.redecay(make_state("x"), elapsed_seconds=10 * 86400)
+    m = state["mastery"][0]
+    assert m["days_since_practice"] == 10.0
+    assert m["mastery"] == round(decay_mastery(0.8, 10.0), 3) < 0.8
+
+
+async def test_snapshot_is_built_around_the_graded_question_kcs(builds):
+    await snap.materialize(None, 1, was_correct=True, kc_ids=[7, 3])
+    assert builds[-1][1] == [3, 7]  # the KC-index prefilter sees the question's KCs
+    assert (await snap.get_state(None, 1, was_correct=True, kc_ids=[3, 7]))["source"] == "snapshot"
+    assert (await snap.get_state(None, 1, was_correct=True))["source"] == "snapshot"  # question unknown
+    state = await snap.get_state(None, 1, was_correct=True, kc_ids=[9])
+    assert state["source"] == "live" and builds[-1][1] == [9]
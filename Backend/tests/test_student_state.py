@@ -0,0 +1,174 @@
+"""The TASA read path: overlapped DB/embedding stages and the single rewrite call."""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.models import (
+    KnowledgeComponent,
+    StudentMemoryEvent,
+    StudentPersona,
+    StudentUser,
+)
+from app.services import kc_index, vector_repo
+from app.services import student_state_service as sss
+
+
+class FakeModel:
+    def __init__(self, fail: bool = False):
+        self.prompts = []
+        self.fail = fail
+
+    def generate_content(self, prompt, request_options=None):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("quota")
+        notes = json.loads(prompt.split("(JSON): ", 1)[1].split("\n\n", 1)[0])
+
+        class Resp:
+            text = json.dumps([f"now: {n['note']}" for n in notes])
+
+        return Resp()
+
+
+@pytest.fixture
+def db(empty_db):
+    session = empty_db
+    session.add(StudentUser(id=1, name="s", email="s@example.com"))
+    now = datetime.utcnow()
+    session.add_all(
+        [
+            StudentPersona(user_id=1, description="careful with signs", embedding=[1.0, 0.0]),
+            StudentPersona(user_id=1, description="rushes word problems", embedding=[0.0, 1.0]),
+            StudentMemoryEvent(user_id=1, summary="dropped a minus", embedding=[1.0, 0.1], event_at=now),
+            StudentMemoryEvent(
+                user_id=1, summary="misread units", embedding=[0.1, 1.0], event_at=now - timedelta(days=1)
+            ),
+        ]
+    )
+    session.commit()
+    vector_repo._INDEXES.clear()
+    yield session
+    vector_repo._INDEXES.clear()
+
+
+@pytest.fixture(autouse=True)
+def rewrite_cache(monkeypatch):
+    monkeypatch.setattr(sss, "get_redis", lambda: None)
+    sss._rewrites.clear()
+    yield sss._rewrites
+    sss._rewrites.clear()
+
+
+@pytest.fixture
+def slow_embed(monkeypatch):
+    async def embed(query):
+        await asyncio.sleep(0.2)
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(sss, "embed_query_async", embed)
+
+
+def slow_load_rows(monkeypatch):
+    real = sss._load_rows
+
+    def load(db, user_id, query_kc_ids):
+        time.sleep(0.2)
+        return real(db, user_id, query_kc_ids)
+
+    monkeypatch.setattr(sss, "_load_rows", load)
+
+
+async def test_db_and_embedding_overlap_and_one_rewrite(db, slow_embed, monkeypatch):
+    slow_load_rows(monkeypatch)
+    model = FakeModel()
+    monkeypatch.setattr(sss, "_get_model", lambda: model)
+
+    state = await sss.build_state(db, 1, "signs")
+
+    assert len(model.prompts) == 1
+    assert state["persona"] == ["now: careful with signs", "now: rushes word problems"]
+    assert state["memory"] == ["now: dropped a minus", "now: misread units"]
+    timings = state["timings_ms"]
+    assert set(timings) == {"db", "embed", "rank", "rewrite", "total"}
+    assert timings["total"] < timings["db"] + timings["embed"]
+
+
+async def test_rewrite_failure_falls_back_to_raw_notes(db, slow_embed, monkeypatch):
+    monkeypatch.setattr(sss, "_get_model", lambda: FakeModel(fail=True))
+    state = await sss.build_state(db, 1, "signs")
+    assert state["persona"][0] == "careful with signs"
+    assert state["memory"][0] == "dropped a minus"
+
+
+async def test_embedding_failure_skips_retrieval(db, monkeypatch):
+    async def broken(query):
+        raise RuntimeError("embed down")
+
+    monkeypatch.setattr(sss, "embed_query_async", broken)
+    state = await sss.build_state(db, 1, "signs")
+    assert state["persona"] == [] and state["memory"] == []
+    assert "rewrite" not in state["timings_ms"]
+
+
+async def test_repeat_reads_skip_the_llm(db, slow_embed, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(sss, "_get_model", lambda: model)
+    first = await sss.build_state(db, 1, "signs")
+    second = await sss.build_state(db, 1, "signs")
+    assert len(model.prompts) == 1
+    assert second["persona"] == first["persona"] and second["memory"] == first["memory"]
+
+
+async def test_failed_rewrites_are_not_cached(db, slow_embed, monkeypatch):
+    monkeypatch.setattr(sss, "_get_model", lambda: FakeModel(fail=True))
+    await sss.build_state(db, 1, "signs")
+    model = FakeModel()
+    monkeypatch.setattr(sss, "_get_model", lambda: model)
+    state = await sss.build_state(db, 1, "signs")
+    assert len(model.prompts) == 1
+    assert state["persona"][0].startswith("now: ")
+
+
+def test_retention_buckets_drive_the_key():
+    class Entry:
+        concept_keywords = ["limits"]
+
+    def note(mastery, days):
+        return sss._retention_note(Entry(), {"limits": {"mastery": mastery, "days_since_practice": days}})
+
+    assert note(0.71, 8) == note(0.74, 13) == {"min_retention": 0.7, "max_days_since_practice": "7-13"}
+    assert note(0.76, 8)["min_retention"] == 0.8
+    assert note(0.7, 14)["max_days_since_practice"] == "14-29"
+    assert note(0.7, 400)["max_days_since_practice"] == "90+"
+    key = lambda ret: sss._rewrite_key("persona", 1, "careful with signs", ret)
+    assert key(note(0.71, 8)) == key(note(0.74, 13)) != key(note(0.7, 14))
+
+
+async def test_kc_index_reaches_events_outside_the_recent_pool(db, monkeypatch):
+    async def embed(query):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(sss, "embed_query_async", embed)
+    monkeypatch.setattr(sss, "_get_model", lambda: FakeModel(fail=True))
+    monkeypatch.setattr(sss, "_MEMORY_POOL", 2)
+    db.add(KnowledgeComponent(
+        id=7, slug="chain-rule", name="Chain rule", ib_topic_ref="5.6", domain="Calculus",
+        description="d", difficulty_tier="SL_core",
+    ))
+    old = StudentMemoryEvent(
+        user_id=1, summary="forgot the inner derivative", concept_keywords=["chain-rule"],
+        embedding=[1.0, 0.0], event_at=datetime.utcnow() - timedelta(days=90),
+    )
+    db.add(old)
+    db.flush()
+    kc_index.index_entry(db, vector_repo.MEMORY, 1, old.id, old.concept_keywords)
+    db.commit()
+
+    without = await sss.build_state(db, 1, "derivatives")
+    assert old.summary not in without["memory"]
+
+    state = await sss.build_state(db, 1, "derivatives", query_kc_ids=[7])
+    assert state["memory"][0] == old.summary
@@ -0,0 +1,92 @@
+"""Streaming multipart reader: fields/files in memory, size caps on the bytes received."""
+import pytest
+from starlette.requests import Request
+
+from app.services import upload_stream
+
+BOUNDARY = "xyzzy"
+
+
+def _body(image: bytes, session_id: str = "grade_1") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="sessionId"\r\n\r\n'
+        f"{session_id}\r\n"
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="photo.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _request(body: bytes, chunk: int = 1000, content_length: bool = True):
+    """A request whose body arrives in `chunk`-byte pieces; records how many were read."""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    pieces = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+    read = []
+
+    async def receive():
+        read.append(1)
+        piece = pieces[len(read) - 1]
+        return {"type": "http.request", "body": piece, "more_body": len(read) < len(pieces)}
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    return request, read, len(pieces)
+
+
+async def test_reads_fields_and_file_across_chunks():
+    image = bytes(range(256)) * 40
+    request, _, _ = _request(_body(image), chunk=333)
+    fields, files = await upload_stream.read_multipart(request)
+    assert fields == {"sessionId": "grade_1"}
+    upload = files["image"]
+    assert (upload.filename, upload.content_type, upload.data) == ("photo.jpg", "image/jpeg", image)
+
+
+async def test_oversized_file_is_rejected_before_the_body_is_read():
+    request, read, _ = _request(_body(b"x" * 5000), content_length=True)
+    with pytest.raises(upload_stream.UploadRejected) as rejected:
+        await upload_stream.read_multipart(request, max_file_bytes=1000, max_field_bytes=10)
+    assert rejected.value.status_code == 413 and read == []
+
+
+async def test_oversized_stream_is_cut_off_at_the_cap():
+    # No Content-Length (chunked transfer): the cap applies as bytes arrive.
+    request, read, total = _request(_body(b"x" * 50_000), chunk=1000, content_length=False)
+    with pytest.raises(upload_stream.UploadRejected) as rejected:
+        await upload_stream.read_multipart(request, max_file_bytes=10_000)
+    assert rejected.value.status_code == 413
+    assert len(read) < total / 2
+
+
+async def test_rejects_non_multipart_bodies():
+    request = Request({"type": "http", "method": "POST", "headers": [(b"content-type", b"application/json")]})
+    with pytest.raises(upload_stream.UploadRejected) as rejected:
+        await upload_stream.read_multipart(request)
+    assert rejected.value.status_code == 400
+
+
+async def test_only_one_file_part_is_buffered():
+    extra = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image2"; filename="again.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + b"y" * 900 + b"\r\n"
+    body = _body(b"x" * 900)
+    body = body[: -len(f"--{BOUNDARY}--\r\n")] + extra + f"--{BOUNDARY}--\r\n".encode()
+    request, _, _ = _request(body, content_length=False)
+    with pytest.raises(upload_stream.UploadRejected) as rejected:
+        await upload_stream.read_multipart(request, max_file_bytes=1000)
+    assert rejected.value.status_code == 400
+
+
+async def test_total_body_is_capped_across_parts():
+    fields = "".join(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="f{i}"\r\n\r\n{"z" * 95}\r\n' for i in range(14)
+    ).encode()
+    # Every part is under its own cap; together they pass the body cap (1000 + 16 * 100).
+    request, _, _ = _request(fields + _body(b"x" * 900), content_length=False)
+    with pytest.raises(upload_stream.UploadRejected) as rejected:
+        await upload_stream.read_multipart(request, max_file_bytes=1000, max_field_bytes=100)
+    assert rejected.value.status_code == 413
@@ -0,0 +1,168 @@
+"""Unit tests for the NumPy-backed per-student vector index."""
+import random
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.services import vector_repo
+from app.services.vector_repo import IVFIndex, QuantizedVectorIndex, VectorIndex, cosine, top_k
+
+
+def rand_vec(rng: random.Random, dim: int = 8) -> List[float]:
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+@pytest.fixture(autouse=True)
+def clear_index_cache():
+    vector_repo._INDEXES.clear()
+    yield
+    vector_repo._INDEXES.clear()
+
+
+def test_similarities_match_pure_python_cosine():
+    rng = random.Random(0)
+    vecs = {i: rand_vec(rng) for i in range(40)}
+    index = VectorIndex()
+    index.add_many(vecs.items())
+    query = rand_vec(rng)
+
+    ids = [3, 17, 39, 0]
+    got = index.similarities(query, ids)
+    for score, item_id in zip(got, ids):
+        assert score == pytest.approx(cosine(query, vecs[item_id]), abs=1e-5)
+
+
+def test_search_returns_top_k_highest_first():
+    rng = random.Random(1)
+    vecs = {i: rand_vec(rng) for i in range(100)}
+    index = VectorIndex()
+    index.add_many(vecs.items())
+    query = rand_vec(rng)
+
+    expected = sorted(vecs, key=lambda i: cosine(query, vecs[i]), reverse=True)[:5]
+    assert [item_id for item_id, _ in index.search(query, 5)] == expected
+
+
+def test_remove_and_replace_keep_rows_consistent():
+    index = VectorIndex()
+    index.add(1, [1.0, 0.0])
+    index.add(2, [0.0, 1.0])
+    index.add(3, [1.0, 1.0])
+    index.remove(1)
+
+    assert 1 not in index and len(index) == 2
+    assert index.similarities([0.0, 1.0], [2, 3, 1]).tolist() == pytest.approx(
+        [1.0, 0.70710677, 0.0]
+    )
+
+    index.add(2, [1.0, 0.0])  # replace in place
+    assert len(index) == 2
+    assert index.similarities([1.0, 0.0], [2])[0] == pytest.approx(1.0)
+
+
+def test_index_grows_past_initial_capacity():
+    index = VectorIndex()
+    for i in range(vector_repo._INITIAL_CAPACITY * 3):
+        index.add(i, [float(i), 1.0])
+    assert len(index) == vector_repo._INITIAL_CAPACITY * 3
+    assert index.search([1.0, 0.0], 1)[0][0] == vector_repo._INITIAL_CAPACITY * 3 - 1
+
+
+def test_degenerate_vectors_score_zero():
+    index = VectorIndex()
+    index.add(1, [1.0, 0.0])
+    index.add(2, [])
+    index.add(3, [0.0, 0.0])
+    index.add(4, [1.0, 0.0, 0.0])  # wrong dimension
+
+    assert index.similarities([1.0, 0.0], [1, 2, 3, 4]).tolist() == pytest.approx(
+        [1.0, 0.0, 0.0, 0.0]
+    )
+    assert index.similarities([], [1]).tolist() == [0.0]
+
+
+def test_top_k_keeps_legacy_contract():
+    items = [("a", [1.0, 0.0]), ("b", [0.0, 1.0]), ("c", [0.7, 0.7])]
+    ranked = top_k([1.0, 0.1], items, lambda item: item[1], 2)
+    assert [item[0] for item, _ in ranked] == ["a", "c"]
+
+
+def test_ensure_indexed_loads_only_missing_ids():
+    loads = []
+
+    def load(ids):
+        loads.append(list(ids))
+        return [(i, [float(i), 1.0]) for i in ids]
+
+    vector_repo.ensure_indexed(vector_repo.MEMORY, 7, [1, 2], load)
+    vector_repo.index_add(vector_repo.MEMORY, 7, 3, [3.0, 1.0])
+    index = vector_repo.ensure_indexed(vector_repo.MEMORY, 7, [1, 2, 3, 4], load)
+
+    assert loads == [[1, 2], [4]]
+    assert len(index) == 4
+
+    vector_repo.index_reset(vector_repo.MEMORY, 7)
+    assert len(vector_repo.get_index(vector_repo.MEMORY, 7)) == 0
+
+
+def test_ivf_index_recall_against_exact_search():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(20, 16))
+    data = centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 16))
+    exact = VectorIndex()
+    ivf = IVFIndex(nprobe=6, min_train=256)
+    for i, vec in enumerate(data):
+        exact.add(i, vec)
+        ivf.add(i, vec)
+        if ivf.needs_retrain:
+            ivf.train()
+    assert ivf.nlist > 1 and len(ivf) == 2000
+
+    hits = 0
+    queries = centers[rng.integers(0, 20, size=20)] + 0.3 * rng.normal(size=(20, 16))
+    for query in queries:
+        truth = {i for i, _ in exact.search(query, 10)}
+        hits += len(truth & {i for i, _ in ivf.search(query, 10)})
+    assert hits / 200 >= 0.9
+
+
+def test_ivf_index_remove_and_replace():
+    ivf = IVFIndex(min_train=4)
+    for i, vec in enumerate([[1, 0], [0, 1], [1, 1], [-1, 0], [0, -1]]):
+        ivf.add(i, vec)
+    ivf.train(nlist=2)
+    ivf.remove(3)
+    ivf.add(0, [0, -1])
+    assert 3 not in ivf and len(ivf) == 4
+    assert ivf.search([0, -1], 2, nprobe=2)[0][1] == pytest.approx(1.0)
+    assert {i for i, _ in ivf.search([0, -1], 2, nprobe=2)} == {0, 4}
+
+
+def test_quantized_index_is_close_and_rescoring_is_exact():
+    rng = np.random.default_rng(3)
+    data = rng.normal(size=(500, 64))
+    exact, quant = VectorIndex(), QuantizedVectorIndex(shortlist=40)
+    for i, vec in enumerate(data):
+        exact.add(i, vec)
+        quant.add(i, vec)
+    assert quant.nbytes * 3 < exact._matrix.nbytes
+
+    query = rng.normal(size=64)
+    ids = list(range(500))
+    approx = quant.similarities(query, ids)
+    assert np.abs(approx - exact.similarities(query, ids)).max() < 0.02
+
+    load = lambda head: [(i, data[i]) for i in head]
+    got, want = quant.search(query, 10, rescore=load), exact.search(query, 10)
+    assert [i for i, _ in got] == [i for i, _ in want]
+    assert [score for _, score in got] == pytest.approx([score for _, score in want], abs=1e-5)
+
+
+def test_quantized_index_remove_keeps_scales_aligned():
+    quant = QuantizedVectorIndex()
+    quant.add("a", [1.0, 0.0])
+    quant.add("b", [0.0, 3.0])
+    quant.add("c", [1.0, 1.0])
+    quant.remove("a")
+    assert quant.similarities([0.0, 1.0], ["b", "c"]).tolist() == pytest.approx([1.0, 0.7071], abs=1e-2)
@@ -0,0 +1,140 @@
+"""Conformance suite: every VectorStore backend must rank like the pure-Python
+reference. Runs numpy/python against in-memory SQLite; pgvector runs only when
+TEST_POSTGRES_URL points at a Postgres with the `vector` extension."""
+import os
+import random
+from typing import List
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models import Base, StudentMemoryEvent, StudentPersona, StudentUser
+from app.services import vector_repo
+from app.services.vector_repo import cosine
+from app.services.vector_store import make_vector_store
+
+DIM = 768
+PG_URL = os.getenv("TEST_POSTGRES_URL")
+
+BACKENDS = [
+    pytest.param(("python", "sqlite://"), id="python-sqlite"),
+    pytest.param(("numpy", "sqlite://"), id="numpy-sqlite"),
+    pytest.param(("int8", "sqlite://"), id="int8-sqlite"),
+    pytest.param(
+        ("pgvector", PG_URL),
+        id="pgvector-postgres",
+        marks=pytest.mark.skipif(not PG_URL, reason="TEST_POSTGRES_URL not set"),
+    ),
+]
+
+
+def rand_vec(rng: random.Random) -> List[float]:
+    return [rng.gauss(0.0, 1.0) for _ in range(DIM)]
+
+
+@pytest.fixture(params=BACKENDS)
+def env(request):
+    name, url = request.param
+    engine = create_engine(url)
+    if name == "pgvector":
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    if name == "pgvector":
+        with engine.begin() as conn:
+            for table in ("student_personas", "student_memory_events"):
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN embedding_vec vector({DIM})"))
+    vector_repo._INDEXES.clear()
+
+    db = sessionmaker(bind=engine)()
+    db.add_all([StudentUser(id=uid, name=f"s{uid}", email=f"s{uid}@example.com") for uid in (1, 2)])
+    db.commit()
+    yield make_vector_store(name), db
+    db.close()
+    Base.metadata.drop_all(engine)
+    vector_repo._INDEXES.clear()
+
+
+def add_memories(store, db, user_id: int, vecs: List[List[float]]) -> List[int]:
+    ids = []
+    for i, vec in enumerate(vecs):
+        row = StudentMemoryEvent(user_id=user_id, summary=f"m{i}", embedding=vec)
+        db.add(row)
+        db.flush()
+        store.add(db, vector_repo.MEMORY, user_id, row.id, vec)
+        ids.append(row.id)
+    db.commit()
+    return ids
+
+
+def test_similarities_match_reference(env):
+    store, db = env
+    rng = random.Random(0)
+    vecs = [rand_vec(rng) for _ in range(12)]
+    ids = add_memories(store, db, 1, vecs)
+    query = rand_vec(rng)
+
+    got = store.similarities(db, vector_repo.MEMORY, 1, query, ids[::-1])
+    expected = [cosine(query, v) for v in vecs[::-1]]
+    assert got.tolist() == pytest.approx(expected, abs=1e-4)
+
+
+def test_search_is_top_k_and_scoped_to_student(env):
+    store, db = env
+    rng = random.Random(1)
+    mine = [rand_vec(rng) for _ in range(20)]
+    ids = add_memories(store, db, 1, mine)
+    query = rand_vec(rng)
+    add_memories(store, db, 2, [query])  # a perfect match belonging to someone else
+
+    ranked = store.search(db, vector_repo.MEMORY, 1, query, 5)
+    by_id = dict(zip(ids, mine))
+    expected = sorted(ids, key=lambda i: cosine(query, by_id[i]), reverse=True)[:5]
+    assert [row_id for row_id, _ in ranked] == expected
+    assert ranked[0][1] == pytest.approx(cosine(query, by_id[expected[0]]), abs=1e-4)
+
+
+def test_missing_embedding_scores_zero(env):
+    store, db = env
+    rng = random.Random(2)
+    ids = add_memories(store, db, 1, [rand_vec(rng)])
+    row = StudentMemoryEvent(user_id=1, summary="no vector", embedding=None)
+    db.add(row)
+    db.flush()
+    store.add(db, vector_repo.MEMORY, 1, row.id, None)
+    db.commit()
+
+    sims = store.similarities(db, vector_repo.MEMORY, 1, rand_vec(rng), [row.id] + ids)
+    assert sims[0] == 0.0
+
+
+def test_persona_bank_replacement(env):
+    store, db = env
+    rng = random.Random(3)
+    old = StudentPersona(user_id=1, description="old", embedding=rand_vec(rng))
+    db.add(old)
+    db.flush()
+    store.add(db, vector_repo.PERSONA, 1, old.id, old.embedding)
+    db.commit()
+    query = rand_vec(rng)
+    store.search(db, vector_repo.PERSONA, 1, query, 3)  # warm any cache
+    db.expunge_all()
+
+    db.query(StudentPersona).filter(StudentPersona.user_id == 1).delete()
+    store.reset(db, vector_repo.PERSONA, 1)
+    new = StudentPersona(user_id=1, description="new", embedding=query)
+    db.add(new)
+    db.flush()
+    store.add(db, vector_repo.PERSONA, 1, new.id, query)
+    db.commit()
+
+    ranked = store.search(db, vector_repo.PERSONA, 1, query, 3)
+    assert [row_id for row_id, _ in ranked] == [new.id]
+    assert ranked[0][1] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        make_vector_store("faiss")
@@ -0,0 +1,43 @@
+"""Tests for the binary embedding codec and its SQLAlchemy column type."""
+import numpy as np
+import pytest
+
+from app.database.models import StudentMemoryEvent, StudentUser
+from app.database.vector_type import HEADER_SIZE, decode_embedding, encode_embedding
+
+
+def test_float32_roundtrip_is_zero_copy_view():
+    vec = [0.25, -1.5, 3.0]
+    blob = encode_embedding(vec)
+
+    assert len(blob) == HEADER_SIZE + 3 * 4
+    decoded = decode_embedding(blob)
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == vec
+    assert not decoded.flags.writeable  # a view over the bytes, not a copy
+
+
+def test_float16_halves_the_payload():
+    vec = np.linspace(-1.0, 1.0, 768)
+    blob = encode_embedding(vec, dtype="float16")
+
+    assert len(blob) == HEADER_SIZE + 768 * 2
+    assert decode_embedding(blob).astype(np.float32) == pytest.approx(vec, abs=1e-3)
+
+
+def test_rejects_unknown_header():
+    with pytest.raises(ValueError):
+        decode_embedding(b"xxxx" + b"\x00" * 8)
+
+
+def test_orm_column_roundtrip(empty_db):
+    db = empty_db
+    db.add(StudentUser(id=1, name="s", email="s@example.com"))
+    db.add(StudentMemoryEvent(id=1, user_id=1, summary="x", embedding=[1.0, 2.0]))
+    db.add(StudentMemoryEvent(id=2, user_id=1, summary="y", embedding=None))
+    db.commit()
+    db.expunge_all()
+
+    rows = {e.id: e.embedding for e in db.query(StudentMemoryEvent).all()}
+    assert rows[1].tolist() == [1.0, 2.0]
+    assert rows[2] is None
@@ -14,7 +14,7 @@ const QRGradingModal = ({
 }) => {
   const [qrCodeDataUrl, setQrCodeDataUrl] = useState('');
   const [timeRemaining, setTimeRemaining] = useState(expiresIn);
-  const [status, setStatus] = useState('waiting'); // waiting, connected, processing, completed
+  const [status, setStatus] = useState('waiting'); // waiting, connected, processing, completed, failed
   const [gradingResult, setGradingResult] = useState(null);
 
   // Generate QR code
@@ -60,13 +60,16 @@ const QRGradingModal = ({
           
           if (data.status === 'mobile_connected' && status === 'waiting') {
             setStatus('connected');
-          } else if (data.status === 'image_uploaded' && status !== 'processing') {
+          } else if (['image_uploaded', 'grading'].includes(data.status) && status !== 'processing') {
             setStatus('processing');
           } else if (data.status === 'completed' && data.result) {
             setStatus('completed');
             setGradingResult(data.result);
             clearInterval(pollInterval);
             onGradingComplete(data.result);
+          } else if (data.status === 'failed') {
+            setStatus('failed');
+            clearInterval(pollInterval);
           }
         }
       } catch (error) {
@@ -131,6 +134,7 @@ const QRGradingModal = ({
               {status === 'waiting' && <p>Waiting for mobile device...</p>}
               {status === 'connected' && <p className="connected">📱 Mobile device connected!</p>}
               {status === 'processing' && <p className="processing">🔄 Processing your submission...</p>}
+              {status === 'failed' && <p className="processing">Grading failed. Please close and submit again.</p>}
             </div>
 
             <div className="qr-code-container">